@@ -16,7 +16,7 @@ from .models.agent import SubAgent, AgentRole, get_role_by_hint
 from .models.result import SubTaskResult
 from .models.enums import AgentStatus, TaskStatus
 from .models.context import ExecutionContext
-from .sub_agent import SubAgentImpl
+from .sub_agent import ResponseCache, SubAgentImpl
 from .qwen.interface import IQwenClient
 from .qwen.models import QwenConfig, QwenModel
 
@@ -92,6 +92,9 @@ class AgentScheduler(IAgentScheduler):
         self._active_lock = asyncio.Lock()
         self._semaphore = asyncio.Semaphore(self._config.max_concurrent_agents)
         
+        # 所有子智能体共享的模型响应缓存（只对确定性请求生效）
+        self._response_cache = ResponseCache()
+        
         # 工具调用计数
         self._total_tool_calls = 0
         self._tool_calls_lock = asyncio.Lock()
@@ -197,6 +200,7 @@ class AgentScheduler(IAgentScheduler):
             tool_registry=self._tool_registry,
             config=role_config,
             on_state_change=self._on_agent_state_change,
+            response_cache=self._response_cache,
         )
         
         # 创建 SubAgent 数据对象
@@ -403,9 +407,9 @@ class AgentScheduler(IAgentScheduler):
                 success=False,
                 output=None,
                 error=f"Agent execution timed out after {self._config.agent_timeout}s",
-                tool_calls=agent_impl.tool_calls,
+                tool_calls=list(agent_impl.tool_calls),
                 execution_time=self._config.agent_timeout,
-                token_usage=agent_impl.token_usage,
+                token_usage=dict(agent_impl.token_usage),
             )
         except Exception as e:
             import traceback
@@ -417,7 +421,7 @@ class AgentScheduler(IAgentScheduler):
                 success=False,
                 output=None,
                 error=str(e),
-                tool_calls=agent_impl.tool_calls if hasattr(agent_impl, 'tool_calls') else [],
+                tool_calls=list(agent_impl.tool_calls) if hasattr(agent_impl, 'tool_calls') else [],
                 execution_time=0,
                 token_usage={},
             )
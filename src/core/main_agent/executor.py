@@ -382,6 +382,7 @@ class TaskExecutor:
             content=enriched_content, role_hint=subtask.role_hint,
             dependencies=subtask.dependencies, priority=subtask.priority,
             estimated_complexity=subtask.estimated_complexity,
+            items=subtask.items,
         )
         agent = SubAgentImpl(
             agent_id=f"team-agent-{uuid.uuid4().hex[:8]}", role=role,
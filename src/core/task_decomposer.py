@@ -234,6 +234,12 @@ class TaskDecomposer(ITaskDecomposer):
 - 分析/写作任务通常依赖搜索结果
 - 总结任务通常放在最后
 
+## 批量条目
+- 对一组同类条目逐个执行相同操作（如逐条判断评论情感、逐个翻译短句）时，可在子任务中给出 "items" 列表
+- 此时 content 只描述对单个条目的操作，条目本身放入 items；结果按条目顺序编号输出
+- 带 items 的子任务不会调用工具（如浏览器、代码执行），需要工具的操作不要使用 items
+- 其他子任务省略 items 或置为空列表
+
 ## 输出格式
 请以 JSON 格式返回：
 ```json
@@ -243,6 +249,7 @@ class TaskDecomposer(ITaskDecomposer):
             "content": "具体的子任务描述（清晰、可执行，涉及时间时以{current_year}年{current_month}月为当前时间）",
             "role_hint": "searcher|fact_checker|analyst|researcher|writer|coder|translator|summarizer",
             "dependencies": [],
+            "items": [],
             "priority": 5,
             "estimated_complexity": 3.0
         }}
@@ -307,6 +314,7 @@ class TaskDecomposer(ITaskDecomposer):
                 dependencies=set(),  # 稍后处理
                 priority=st_data.get("priority", 0),
                 estimated_complexity=st_data.get("estimated_complexity", 1.0),
+                items=list(st_data.get("items") or []),
             )
             subtasks.append(subtask)
         
@@ -5,7 +5,8 @@ supporting direct messages, broadcast, and shutdown signals.
 """
 
 from abc import ABC, abstractmethod
-from typing import Any, List
+import asyncio
+from typing import Any, List, Optional
 
 from ..models.message import Message, MessageDeliveryResult, MessageType
 
@@ -107,3 +108,16 @@ class IMessageBus(ABC):
             agent_id: 智能体 ID
         """
         pass
+
+    def subscribe(self, agent_id: str) -> Optional[asyncio.Queue]:
+        """获取智能体收件箱队列，用于推送式等待新消息
+
+        默认实现不支持订阅，返回 None，调用方应回退到 receive_messages 轮询。
+
+        Args:
+            agent_id: 智能体 ID
+
+        Returns:
+            Optional[asyncio.Queue]: 收件箱队列，不支持或未注册时为 None
+        """
+        return None
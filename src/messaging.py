@@ -279,3 +279,17 @@ class MessageBus(IMessageBus):
                 break
 
         return messages
+
+    def subscribe(self, agent_id: str) -> Optional[asyncio.Queue]:
+        """获取智能体收件箱队列，用于推送式等待新消息
+
+        订阅方从队列中取出的消息不会再被 receive_messages 返回。
+        如果智能体未注册，返回 None。
+
+        Args:
+            agent_id: 智能体 ID
+
+        Returns:
+            Optional[asyncio.Queue]: 收件箱队列
+        """
+        return self._inboxes.get(agent_id)
@@ -38,6 +38,7 @@ class SubTaskResult:
                     "start_time": tc.start_time,
                     "end_time": tc.end_time,
                     "agent_id": tc.agent_id,
+                    "cached": tc.cached,
                 }
                 for tc in self.tool_calls
             ],
@@ -66,6 +67,7 @@ class SubTaskResult:
                     start_time=tc["start_time"],
                     end_time=tc["end_time"],
                     agent_id=tc["agent_id"],
+                    cached=tc.get("cached", False),
                 )
                 for tc in data.get("tool_calls", [])
             ],
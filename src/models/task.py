@@ -50,6 +50,8 @@ class SubTask:
     dependencies: Set[str] = field(default_factory=set)  # 依赖的子任务ID
     priority: int = 0
     estimated_complexity: float = 1.0
+    # 相互独立的待处理条目（如逐条分类），非空时对每个条目执行 content 描述的任务
+    items: List[Any] = field(default_factory=list)
     
     def to_dict(self) -> Dict[str, Any]:
         """序列化为字典"""
@@ -61,6 +63,7 @@ class SubTask:
             "dependencies": list(self.dependencies),
             "priority": self.priority,
             "estimated_complexity": self.estimated_complexity,
+            "items": list(self.items),
         }
     
     @classmethod
@@ -74,6 +77,7 @@ class SubTask:
             dependencies=set(data.get("dependencies", [])),
             priority=data.get("priority", 0),
             estimated_complexity=data.get("estimated_complexity", 1.0),
+            items=list(data.get("items", [])),
         )
 
 
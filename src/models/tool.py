@@ -27,3 +27,4 @@ class ToolCallRecord:
     start_time: float
     end_time: float
     agent_id: str
+    cached: bool = False  # 是否直接复用了之前相同调用的结果
@@ -6,9 +6,11 @@ from .dashscope_client import DashScopeClient, MODEL_CONTEXT_WINDOWS
 from .local_client import LocalQwenClient
 from .retry import (
     RetryConfig,
+    RetryBudget,
     MODEL_FALLBACK_CHAIN,
     RetryableError,
     NonRetryableError,
+    AllModelsFailedError,
     is_retryable_error,
     execute_with_retry,
     execute_with_fallback,
@@ -29,10 +31,12 @@ __all__ = [
     "ResilientQwenClient",
     # Retry
     "RetryConfig",
+    "RetryBudget",
     "MODEL_FALLBACK_CHAIN",
     "MODEL_CONTEXT_WINDOWS",
     "RetryableError",
     "NonRetryableError",
+    "AllModelsFailedError",
     "is_retryable_error",
     "execute_with_retry",
     "execute_with_fallback",
@@ -1,14 +1,22 @@
 """DashScope API client for Qwen models."""
 
 import os
+import re
+import logging
+import time
 import asyncio
 import queue
 import threading
-from typing import List, Dict, Any, Optional, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple
 
 from .interface import IQwenClient
 from .models import Message, QwenResponse, QwenConfig, QwenModel
 
+logger = logging.getLogger(__name__)
+
 
 # 模型上下文窗口大小映射
 MODEL_CONTEXT_WINDOWS = {
@@ -35,13 +43,87 @@ MODEL_CONTEXT_WINDOWS = {
 }
 
 
-def _is_retryable_error(e: Exception) -> bool:
-    """判断是否为可重试的瞬态错误（限流、连接重置等）"""
-    if isinstance(e, (ConnectionResetError, ConnectionError, asyncio.TimeoutError)):
-        return True
-    err_str = str(e)
+# 客户端专用线程池的最大线程数（批量查询任务状态等并发场景）
+_EXECUTOR_MAX_WORKERS = 16
+
+# 连续中文字符段（CJK 统一表意文字基本区），按段匹配比逐字匹配少产生大量单字符对象
+_CHINESE_RUN_RE = re.compile("[\u4e00-\u9fff]+")
+
+
+@lru_cache(maxsize=1)
+def _get_tiktoken_encoding() -> Any:
+    """获取 cl100k_base 编码器（进程内只加载一次），tiktoken 不可用时返回 None"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _estimate_token_count(text: str) -> int:
+    """
+    估算文本的 token 数量（优先 tiktoken，回退到启发式方法）
+    
+    启发式方法：中文字符约 1.5 token，其他字符约 0.25 token（4字符/token）
+    """
+    if not text:
+        return 0
+    
+    # 使用 cl100k_base 编码器作为近似
+    enc = _get_tiktoken_encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    
+    # 纯 ASCII 文本无需扫描；否则在 C 层按连续段统计中文字符数
+    chinese_chars = 0 if text.isascii() else sum(map(len, _CHINESE_RUN_RE.findall(text)))
+    other_chars = len(text) - chinese_chars
+    estimated = int(chinese_chars * 1.5 + other_chars * 0.25)
+    return max(1, estimated)
+
+
+# 多模态 SDK 依赖的惰性单例，首次调用时导入，避免每次请求重复导入和构建映射
+_TTS_DEPS: Optional[Tuple[Any, Dict[str, Any]]] = None
+_VIDEO_SYNTHESIS: Any = None
+
+
+def _tts_deps() -> Tuple[Any, Dict[str, Any]]:
+    """返回 (SpeechSynthesizer, 格式映射)，首次调用时导入并缓存"""
+    global _TTS_DEPS
+    if _TTS_DEPS is None:
+        try:
+            from dashscope.audio.tts_v2 import SpeechSynthesizer, AudioFormat
+        except ImportError:
+            raise ImportError(
+                "dashscope package is required. Install with: pip install dashscope"
+            )
+        # 将字符串格式映射到 AudioFormat 枚举（键按字母序排列）
+        format_map = {
+            "mp3": AudioFormat.MP3_22050HZ_MONO_256KBPS,
+            "pcm": AudioFormat.PCM_22050HZ_MONO_16BIT,
+            "wav": AudioFormat.WAV_22050HZ_MONO_16BIT,
+        }
+        _TTS_DEPS = (SpeechSynthesizer, format_map)
+    return _TTS_DEPS
+
+
+def _video_synthesis() -> Any:
+    """返回 dashscope.VideoSynthesis，首次调用时导入并缓存"""
+    global _VIDEO_SYNTHESIS
+    if _VIDEO_SYNTHESIS is None:
+        try:
+            from dashscope import VideoSynthesis
+        except ImportError:
+            raise ImportError(
+                "dashscope package is required. Install with: pip install dashscope"
+            )
+        _VIDEO_SYNTHESIS = VideoSynthesis
+    return _VIDEO_SYNTHESIS
+
+
+def _is_retryable_message(err_str: str) -> bool:
+    """根据错误文本判断是否为可重试的瞬态错误"""
     # DashScope 限流错误
-    if "Throttling" in err_str or "RateQuota" in err_str or "rate limit" in err_str.lower():
+    if _is_rate_limit_message(err_str):
         return True
     # 连接类错误
     if "Connection" in err_str or "reset" in err_str.lower():
@@ -52,6 +134,13 @@ def _is_retryable_error(e: Exception) -> bool:
     return False
 
 
+def _is_retryable_error(e: Exception) -> bool:
+    """判断是否为可重试的瞬态错误（限流、连接重置等）"""
+    if isinstance(e, (ConnectionResetError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return _is_retryable_message(str(e))
+
+
 def _retry_wait_time(attempt: int, is_rate_limit: bool = False) -> float:
     """计算重试等待时间（秒），限流错误使用更长的退避"""
     if is_rate_limit:
@@ -61,10 +150,82 @@ def _retry_wait_time(attempt: int, is_rate_limit: bool = False) -> float:
     return min(2 * (2 ** attempt), 16)
 
 
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    """距总截止时间的剩余秒数，未设置截止时间时返回 None"""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _cap_wait(wait_time: float, deadline: Optional[float]) -> float:
+    """将退避等待时间限制在剩余时间内"""
+    remaining = _remaining(deadline)
+    if remaining is None:
+        return wait_time
+    return max(0.0, min(wait_time, remaining - 0.01))
+
+
+def _is_rate_limit_message(err_str: str) -> bool:
+    """根据错误文本判断是否为限流错误"""
+    return "Throttling" in err_str or "RateQuota" in err_str or "rate limit" in err_str.lower()
+
+
 def _is_rate_limit_error(e: Exception) -> bool:
     """判断是否为限流错误"""
-    err_str = str(e)
-    return "Throttling" in err_str or "RateQuota" in err_str or "rate limit" in err_str.lower()
+    return _is_rate_limit_message(str(e))
+
+
+@dataclass
+class _Breaker:
+    """
+    熔断器状态机：closed → open → half_open → closed
+
+    连续失败达到阈值后进入 open 状态，直接拒绝请求；
+    reset_after 秒后进入 half_open，仅放行一个探测请求，
+    探测成功则恢复 closed，失败则重新 open。
+    探测未得出结论（未发出或被取消）时应调用 release_probe()；
+    探测超过 probe_timeout 仍无结论时视为丢失，重新放行一个探测请求。
+    """
+    state: str = "closed"  # "closed" / "open" / "half_open"
+    failures: int = 0
+    opened_at: float = 0.0
+    threshold: int = 5
+    reset_after: float = 30.0
+    probe_timeout: float = 120.0
+    probe_started_at: float = 0.0
+
+    def allow(self) -> bool:
+        """当前是否允许发起请求"""
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.reset_after:
+            # 冷却结束，放行一个探测请求
+            self.state = "half_open"
+            self.probe_started_at = now
+            return True
+        if self.state == "half_open" and now - self.probe_started_at >= self.probe_timeout:
+            # 探测请求迟迟没有结论（可能已丢失），重新放行一个
+            self.probe_started_at = now
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """探测请求未得出结论时回到 open（冷却已过，下次 allow() 立即重新探测）"""
+        if self.state == "half_open":
+            self.state = "open"
+
+    def record_success(self) -> None:
+        """记录成功：恢复 closed"""
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        """记录失败：达到阈值或探测失败时熔断"""
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
 
 
 class DashScopeClient(IQwenClient):
@@ -85,6 +246,137 @@ class DashScopeClient(IQwenClient):
                 "DashScope API key is required. "
                 "Set DASHSCOPE_API_KEY environment variable or pass api_key in config."
             )
+        
+        # 每个客户端固定不变的鉴权参数，多模态请求参数以此为前缀构建
+        self._auth: Dict[str, Any] = {"api_key": self._api_key}
+        
+        # 按 (method, model) 维护熔断器，避免上游故障时每个调用方都耗尽重试
+        self._breakers: Dict[Tuple[str, str], _Breaker] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    async def aclose(self) -> None:
+        """关闭客户端专用线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    def _get_breaker(self, method: str, model: str) -> _Breaker:
+        """获取（或创建）指定端点的熔断器"""
+        key = (method, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = _Breaker()
+        return breaker
+    
+    async def _retry_async(
+        self,
+        method: str,
+        label: str,
+        model: str,
+        submit: Callable[[], Any],
+        on_success: Callable[[Any], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        多模态生成任务的通用重试循环（带熔断）
+        
+        Args:
+            method: 端点方法名（熔断器键的一部分）
+            label: 日志标签，如 "文生图"
+            model: 模型名称（熔断器键的一部分）
+            submit: 在线程池中执行的同步提交函数
+            on_success: 将 status_code == 200 的响应转换为结果字典
+            
+        Returns:
+            结果字典
+        """
+        breaker = self._get_breaker(method, model)
+        total_timeout = self._config.total_timeout
+        deadline = None if total_timeout is None else time.monotonic() + total_timeout
+        # 本次调用是否持有 half_open 探测名额
+        probing = False
+        try:
+            loop = asyncio.get_event_loop()
+            max_retries = self._config.retry_attempts
+            last_error = None
+
+            for attempt in range(max_retries):
+                # 先检查时限再申请熔断器放行，避免拿到探测名额却不发出请求
+                remaining = _remaining(deadline)
+                if remaining is not None and remaining <= 0:
+                    return {
+                        "success": False,
+                        "error": f"deadline exceeded: 超过总时限 {total_timeout}s，最后错误: {last_error}",
+                    }
+                if not breaker.allow():
+                    return {
+                        "success": False,
+                        "error": f"circuit open: {method}/{model} 暂时不可用，请稍后重试",
+                    }
+                probing = breaker.state == "half_open"
+                try:
+                    response = await asyncio.wait_for(
+                        loop.run_in_executor(None, submit),
+                        timeout=remaining,
+                    )
+                    
+                    if response.status_code == 200:
+                        breaker.record_success()
+                        return on_success(response)
+                    else:
+                        # 直接按错误文本分类，无需构造异常对象
+                        err = f"{response.code}: {response.message}"
+                        if _is_retryable_message(err):
+                            breaker.record_failure()
+                            if attempt < max_retries - 1:
+                                is_rl = _is_rate_limit_message(err)
+                                wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                                logger.warning(
+                                    "[DashScope %s] %s，%.0f秒后重试 (%d/%d): %s",
+                                    label, "限流" if is_rl else "瞬态错误", wait_time, attempt + 1, max_retries, err,
+                                )
+                                await asyncio.sleep(wait_time)
+                                last_error = err
+                                continue
+                        elif breaker.state == "half_open":
+                            # 探测请求拿到了明确的业务错误，说明上游已可达
+                            breaker.record_success()
+                        return {
+                            "success": False,
+                            "error": err,
+                        }
+                except Exception as e:
+                    if _is_retryable_error(e):
+                        breaker.record_failure()
+                        if attempt < max_retries - 1:
+                            is_rl = _is_rate_limit_error(e)
+                            wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                            logger.warning(
+                                "[DashScope %s] %s，%.0f秒后重试 (%d/%d): %s",
+                                label, "限流" if is_rl else "瞬态错误", wait_time, attempt + 1, max_retries, e,
+                            )
+                            await asyncio.sleep(wait_time)
+                            last_error = e
+                            continue
+                    elif breaker.state == "half_open":
+                        breaker.record_success()
+                    return {
+                        "success": False,
+                        "error": str(e),
+                    }
+
+            return {
+                "success": False,
+                "error": f"重试 {max_retries} 次后仍失败: {last_error}",
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+            }
+        finally:
+            # 探测被取消或异常中断、未得出结论时交还名额，避免熔断器卡在 half_open
+            if probing and breaker.state == "half_open":
+                breaker.release_probe()
     
     async def chat(
         self,
@@ -115,7 +407,7 @@ class DashScopeClient(IQwenClient):
             )
         
         effective_config = config or self._config
-        max_retries = effective_config.retry_attempts
+        max_retries = effective_config.effective_retry_attempts
         
         # 构建请求参数
         request_messages = [msg.to_dict() for msg in messages]
@@ -152,6 +444,9 @@ class DashScopeClient(IQwenClient):
         if tools and not kwargs.get("enable_search"):
             kwargs["tools"] = tools
         
+        if effective_config.idempotency_key:
+            kwargs["headers"] = {"Idempotency-Key": effective_config.idempotency_key}
+        
         # 需要流式模式的场景（仅 Qwen 原生模型有效）：
         # 1. search_strategy 明确设置时（如 "agent_max"），Web Extractor 不支持非流式
         # 2. enable_code_interpreter=True，代码解释器仅支持流式调用
@@ -163,21 +458,34 @@ class DashScopeClient(IQwenClient):
         # 检测是否需要使用 MultiModalConversation API
         use_multimodal_api = effective_config.model.requires_multimodal_api()
         
+        # 整个重试序列的总截止时间（单次请求超时取 timeout 与剩余时间的较小值）
+        total_timeout = effective_config.total_timeout
+        deadline = None if total_timeout is None else time.monotonic() + total_timeout
+        
         last_error = None
         for attempt in range(max_retries):
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError(
+                    f"DashScope request exceeded total timeout of {total_timeout}s"
+                ) from last_error
+            attempt_timeout = (
+                effective_config.timeout if remaining is None
+                else min(effective_config.timeout, remaining)
+            )
             try:
                 loop = asyncio.get_event_loop()
                 
                 if use_stream:
                     # 流式模式：内部收集所有 chunk 后返回完整 QwenResponse
                     response = await self._chat_stream_collect(
-                        kwargs, effective_config, loop
+                        kwargs, effective_config, loop, attempt_timeout
                     )
                     return response
                 elif use_multimodal_api:
                     # MultiModalConversation API（kimi-k2.5 等模型必须走此路径）
                     response = await self._multimodal_chat(
-                        request_messages, effective_config, loop
+                        request_messages, effective_config, loop, attempt_timeout
                     )
                     return response
                 else:
@@ -185,9 +493,9 @@ class DashScopeClient(IQwenClient):
                     response = await asyncio.wait_for(
                         loop.run_in_executor(
                             None,
-                            lambda: Generation.call(api_key=self._api_key, **kwargs)
+                            partial(Generation.call, api_key=self._api_key, **kwargs)
                         ),
-                        timeout=effective_config.timeout
+                        timeout=attempt_timeout
                     )
                     
                     # 解析响应
@@ -211,8 +519,8 @@ class DashScopeClient(IQwenClient):
                 last_error = e
                 if attempt < max_retries - 1:
                     is_rl = _is_rate_limit_error(e)
-                    wait_time = _retry_wait_time(attempt, is_rl)
-                    print(f"[DashScope] {'限流' if is_rl else '连接错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                    wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                    logger.warning("[DashScope] %s，%.0f秒后重试 (%d/%d): %s", "限流" if is_rl else "连接错误", wait_time, attempt + 1, max_retries, e)
                     await asyncio.sleep(wait_time)
                 continue
             except Exception as e:
@@ -220,8 +528,8 @@ class DashScopeClient(IQwenClient):
                     last_error = e
                     if attempt < max_retries - 1:
                         is_rl = _is_rate_limit_error(e)
-                        wait_time = _retry_wait_time(attempt, is_rl)
-                        print(f"[DashScope] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                        wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                        logger.warning("[DashScope] %s，%.0f秒后重试 (%d/%d): %s", "限流" if is_rl else "瞬态错误", wait_time, attempt + 1, max_retries, e)
                         await asyncio.sleep(wait_time)
                     continue
                 raise
@@ -234,6 +542,7 @@ class DashScopeClient(IQwenClient):
         request_messages: List[Dict[str, Any]],
         effective_config: QwenConfig,
         loop: asyncio.AbstractEventLoop,
+        timeout: Optional[float] = None,
     ) -> QwenResponse:
         """
         使用 MultiModalConversation API 调用模型。
@@ -258,17 +567,21 @@ class DashScopeClient(IQwenClient):
 
         api_key = self._api_key
         model = effective_config.model.value
+        extra_kwargs: Dict[str, Any] = {}
+        if effective_config.idempotency_key:
+            extra_kwargs["headers"] = {"Idempotency-Key": effective_config.idempotency_key}
 
         def call():
             return MultiModalConversation.call(
                 api_key=api_key,
                 model=model,
                 messages=mm_messages,
+                **extra_kwargs,
             )
 
         response = await asyncio.wait_for(
             loop.run_in_executor(None, call),
-            timeout=effective_config.timeout,
+            timeout=effective_config.timeout if timeout is None else timeout,
         )
 
         if response.status_code != 200:
@@ -303,6 +616,7 @@ class DashScopeClient(IQwenClient):
         kwargs: Dict[str, Any],
         effective_config: QwenConfig,
         loop: asyncio.AbstractEventLoop,
+        timeout: Optional[float] = None,
     ) -> QwenResponse:
         """
         使用流式模式调用 API 并收集所有 chunk 为完整的 QwenResponse。
@@ -355,7 +669,7 @@ class DashScopeClient(IQwenClient):
         
         result = await asyncio.wait_for(
             loop.run_in_executor(None, stream_call),
-            timeout=effective_config.timeout
+            timeout=effective_config.timeout if timeout is None else timeout
         )
         
         return QwenResponse(
@@ -378,8 +692,11 @@ class DashScopeClient(IQwenClient):
                 "dashscope package is required. Install with: pip install dashscope"
             )
 
-        max_retries = effective_config.retry_attempts
+        max_retries = effective_config.effective_retry_attempts
         api_key = self._api_key
+        extra_kwargs: Dict[str, Any] = {}
+        if effective_config.idempotency_key:
+            extra_kwargs["headers"] = {"Idempotency-Key": effective_config.idempotency_key}
 
         # MultiModalConversation 的消息格式：content 为 [{"image": url}, {"text": "..."}]
         # 与 OpenAI 兼容格式不同，不需要 type 字段
@@ -393,8 +710,17 @@ class DashScopeClient(IQwenClient):
                 # 纯文本消息
                 vl_messages.append({"role": msg["role"], "content": [{"text": content}]})
 
+        # 与 chat() 相同：total_timeout 约束整个重试序列（含流式读取与退避等待）
+        total_timeout = effective_config.total_timeout
+        deadline = None if total_timeout is None else time.monotonic() + total_timeout
+
         last_error = None
         for attempt in range(max_retries):
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError(
+                    f"DashScope stream exceeded total timeout of {total_timeout}s"
+                ) from last_error
             try:
                 chunk_queue: queue.Queue = queue.Queue()
                 error_holder = [None]
@@ -407,6 +733,7 @@ class DashScopeClient(IQwenClient):
                             messages=vl_messages,
                             stream=True,
                             incremental_output=True,
+                            **extra_kwargs,
                         )
                         for response in responses:
                             if response.status_code == 200:
@@ -445,7 +772,7 @@ class DashScopeClient(IQwenClient):
                 while True:
                     try:
                         item = await loop.run_in_executor(
-                            None, lambda: chunk_queue.get(timeout=0.1)
+                            None, partial(chunk_queue.get, timeout=0.1)
                         )
                         msg_type, content = item
                         if msg_type == "done":
@@ -456,6 +783,11 @@ class DashScopeClient(IQwenClient):
                             has_output = True
                             yield content
                     except queue.Empty:
+                        remaining = _remaining(deadline)
+                        if remaining is not None and remaining <= 0:
+                            raise asyncio.TimeoutError(
+                                f"DashScope stream exceeded total timeout of {total_timeout}s"
+                            )
                         await asyncio.sleep(0.01)
                         continue
 
@@ -466,8 +798,8 @@ class DashScopeClient(IQwenClient):
                 last_error = e
                 if attempt < max_retries - 1:
                     is_rl = _is_rate_limit_error(e)
-                    wait_time = _retry_wait_time(attempt, is_rl)
-                    print(f"[DashScope VL Stream] {'限流' if is_rl else '连接错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                    wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                    logger.warning("[DashScope VL Stream] %s，%.0f秒后重试 (%d/%d): %s", "限流" if is_rl else "连接错误", wait_time, attempt + 1, max_retries, e)
                     await asyncio.sleep(wait_time)
                 continue
             except Exception as e:
@@ -475,8 +807,8 @@ class DashScopeClient(IQwenClient):
                     last_error = e
                     if attempt < max_retries - 1:
                         is_rl = _is_rate_limit_error(e)
-                        wait_time = _retry_wait_time(attempt, is_rl)
-                        print(f"[DashScope VL Stream] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                        wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                        logger.warning("[DashScope VL Stream] %s，%.0f秒后重试 (%d/%d): %s", "限流" if is_rl else "瞬态错误", wait_time, attempt + 1, max_retries, e)
                         await asyncio.sleep(wait_time)
                     continue
                 raise
@@ -509,7 +841,7 @@ class DashScopeClient(IQwenClient):
             )
         
         effective_config = config or self._config
-        max_retries = effective_config.retry_attempts
+        max_retries = effective_config.effective_retry_attempts
         request_messages = [msg.to_dict() for msg in messages]
 
         # 检测是否为视觉模型 + 多模态内容（content 为 list 格式）
@@ -568,8 +900,20 @@ class DashScopeClient(IQwenClient):
         if tools and not kwargs.get("enable_search"):
             kwargs["tools"] = tools
         
+        if effective_config.idempotency_key:
+            kwargs["headers"] = {"Idempotency-Key": effective_config.idempotency_key}
+        
+        # 与 chat() 相同：total_timeout 约束整个重试序列（含流式读取与退避等待）
+        total_timeout = effective_config.total_timeout
+        deadline = None if total_timeout is None else time.monotonic() + total_timeout
+        
         last_error = None
         for attempt in range(max_retries):
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError(
+                    f"DashScope stream exceeded total timeout of {total_timeout}s"
+                ) from last_error
             try:
                 # 使用队列实现真正的异步流式输出
                 chunk_queue: queue.Queue = queue.Queue()
@@ -613,7 +957,7 @@ class DashScopeClient(IQwenClient):
                 while True:
                     # 非阻塞方式从队列获取数据
                     try:
-                        item = await loop.run_in_executor(None, lambda: chunk_queue.get(timeout=0.1))
+                        item = await loop.run_in_executor(None, partial(chunk_queue.get, timeout=0.1))
                         msg_type, content = item
                         
                         if msg_type == "done":
@@ -630,7 +974,12 @@ class DashScopeClient(IQwenClient):
                             has_output = True
                             yield content
                     except queue.Empty:
-                        # 队列为空，继续等待
+                        # 队列为空，继续等待（超过总时限时放弃本次尝试）
+                        remaining = _remaining(deadline)
+                        if remaining is not None and remaining <= 0:
+                            raise asyncio.TimeoutError(
+                                f"DashScope stream exceeded total timeout of {total_timeout}s"
+                            )
                         await asyncio.sleep(0.01)
                         continue
                 
@@ -642,8 +991,8 @@ class DashScopeClient(IQwenClient):
                 last_error = e
                 if attempt < max_retries - 1:
                     is_rl = _is_rate_limit_error(e)
-                    wait_time = _retry_wait_time(attempt, is_rl)
-                    print(f"[DashScope Stream] {'限流' if is_rl else '连接错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                    wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                    logger.warning("[DashScope Stream] %s，%.0f秒后重试 (%d/%d): %s", "限流" if is_rl else "连接错误", wait_time, attempt + 1, max_retries, e)
                     await asyncio.sleep(wait_time)
                 continue
             except Exception as e:
@@ -651,8 +1000,8 @@ class DashScopeClient(IQwenClient):
                     last_error = e
                     if attempt < max_retries - 1:
                         is_rl = _is_rate_limit_error(e)
-                        wait_time = _retry_wait_time(attempt, is_rl)
-                        print(f"[DashScope Stream] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                        wait_time = _cap_wait(_retry_wait_time(attempt, is_rl), deadline)
+                        logger.warning("[DashScope Stream] %s，%.0f秒后重试 (%d/%d): %s", "限流" if is_rl else "瞬态错误", wait_time, attempt + 1, max_retries, e)
                         await asyncio.sleep(wait_time)
                     continue
                 raise
@@ -697,25 +1046,7 @@ class DashScopeClient(IQwenClient):
         Returns:
             估算的 token 数量
         """
-        if not text:
-            return 0
-        
-        # 尝试使用 tiktoken（如果可用）
-        try:
-            import tiktoken
-            # 使用 cl100k_base 编码器作为近似
-            enc = tiktoken.get_encoding("cl100k_base")
-            return len(enc.encode(text))
-        except ImportError:
-            pass
-        
-        # 回退到启发式方法
-        chinese_chars = sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
-        other_chars = len(text) - chinese_chars
-        
-        # 中文字符约 1.5 token，其他字符约 0.25 token（4字符/token）
-        estimated = int(chinese_chars * 1.5 + other_chars * 0.25)
-        return max(1, estimated)
+        return _estimate_token_count(text)
     
     def get_context_window(self) -> int:
         """
@@ -760,7 +1091,7 @@ class DashScopeClient(IQwenClient):
         
         # 构建请求参数
         kwargs = {
-            "api_key": self._api_key,
+            **self._auth,
             "model": model,
             "prompt": prompt,
             "n": n,
@@ -772,61 +1103,22 @@ class DashScopeClient(IQwenClient):
         if seed is not None:
             kwargs["seed"] = seed
         
-        try:
-            loop = asyncio.get_event_loop()
-            max_retries = self._config.retry_attempts
-            last_error = None
-
-            for attempt in range(max_retries):
-                try:
-                    response = await loop.run_in_executor(
-                        None,
-                        lambda: ImageSynthesis.call(**kwargs)
-                    )
-                    
-                    if response.status_code == 200:
-                        results = response.output.get("results", [])
-                        return {
-                            "success": True,
-                            "images": [{"url": r.get("url")} for r in results],
-                            "task_id": response.output.get("task_id"),
-                            "usage": response.usage,
-                        }
-                    else:
-                        err = Exception(f"{response.code}: {response.message}")
-                        if _is_retryable_error(err) and attempt < max_retries - 1:
-                            is_rl = _is_rate_limit_error(err)
-                            wait_time = _retry_wait_time(attempt, is_rl)
-                            print(f"[DashScope 文生图] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {err}")
-                            await asyncio.sleep(wait_time)
-                            last_error = err
-                            continue
-                        return {
-                            "success": False,
-                            "error": f"{response.code}: {response.message}",
-                        }
-                except Exception as e:
-                    if _is_retryable_error(e) and attempt < max_retries - 1:
-                        is_rl = _is_rate_limit_error(e)
-                        wait_time = _retry_wait_time(attempt, is_rl)
-                        print(f"[DashScope 文生图] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
-                        await asyncio.sleep(wait_time)
-                        last_error = e
-                        continue
-                    return {
-                        "success": False,
-                        "error": str(e),
-                    }
-
+        def on_success(response) -> Dict[str, Any]:
+            results = response.output.get("results", [])
             return {
-                "success": False,
-                "error": f"重试 {max_retries} 次后仍失败: {last_error}",
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
+                "success": True,
+                "images": [{"url": r.get("url")} for r in results],
+                "task_id": response.output.get("task_id"),
+                "usage": response.usage,
             }
+        
+        return await self._retry_async(
+            "text_to_image",
+            "文生图",
+            model,
+            partial(ImageSynthesis.call, **kwargs),
+            on_success,
+        )
     
     async def text_to_video(
         self,
@@ -849,15 +1141,10 @@ class DashScopeClient(IQwenClient):
         Returns:
             包含视频URL的结果字典（异步任务）
         """
-        try:
-            from dashscope import VideoSynthesis
-        except ImportError:
-            raise ImportError(
-                "dashscope package is required. Install with: pip install dashscope"
-            )
+        VideoSynthesis = _video_synthesis()
         
         kwargs = {
-            "api_key": self._api_key,
+            **self._auth,
             "model": model,
             "prompt": prompt,
             "size": size,
@@ -867,62 +1154,22 @@ class DashScopeClient(IQwenClient):
         if seed is not None:
             kwargs["seed"] = seed
         
-        try:
-            loop = asyncio.get_event_loop()
-            max_retries = self._config.retry_attempts
-            last_error = None
-
-            for attempt in range(max_retries):
-                try:
-                    # 提交异步任务
-                    response = await loop.run_in_executor(
-                        None,
-                        lambda: VideoSynthesis.async_call(**kwargs)
-                    )
-                    
-                    if response.status_code == 200:
-                        task_id = response.output.get("task_id")
-                        return {
-                            "success": True,
-                            "task_id": task_id,
-                            "status": "processing",
-                            "message": "视频生成任务已提交，请使用 task_id 查询结果",
-                        }
-                    else:
-                        err = Exception(f"{response.code}: {response.message}")
-                        if _is_retryable_error(err) and attempt < max_retries - 1:
-                            is_rl = _is_rate_limit_error(err)
-                            wait_time = _retry_wait_time(attempt, is_rl)
-                            print(f"[DashScope 文生视频] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {err}")
-                            await asyncio.sleep(wait_time)
-                            last_error = err
-                            continue
-                        return {
-                            "success": False,
-                            "error": f"{response.code}: {response.message}",
-                        }
-                except Exception as e:
-                    if _is_retryable_error(e) and attempt < max_retries - 1:
-                        is_rl = _is_rate_limit_error(e)
-                        wait_time = _retry_wait_time(attempt, is_rl)
-                        print(f"[DashScope 文生视频] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
-                        await asyncio.sleep(wait_time)
-                        last_error = e
-                        continue
-                    return {
-                        "success": False,
-                        "error": str(e),
-                    }
-
-            return {
-                "success": False,
-                "error": f"重试 {max_retries} 次后仍失败: {last_error}",
-            }
-        except Exception as e:
+        def on_success(response) -> Dict[str, Any]:
             return {
-                "success": False,
-                "error": str(e),
+                "success": True,
+                "task_id": response.output.get("task_id"),
+                "status": "processing",
+                "message": "视频生成任务已提交，请使用 task_id 查询结果",
             }
+        
+        # 提交异步任务
+        return await self._retry_async(
+            "text_to_video",
+            "文生视频",
+            model,
+            partial(VideoSynthesis.async_call, **kwargs),
+            on_success,
+        )
     
     async def image_to_video(
         self,
@@ -945,15 +1192,10 @@ class DashScopeClient(IQwenClient):
         Returns:
             包含视频URL的结果字典（异步任务）
         """
-        try:
-            from dashscope import VideoSynthesis
-        except ImportError:
-            raise ImportError(
-                "dashscope package is required. Install with: pip install dashscope"
-            )
+        VideoSynthesis = _video_synthesis()
         
         kwargs = {
-            "api_key": self._api_key,
+            **self._auth,
             "model": model,
             "image_url": image_url,
             "duration": duration,
@@ -964,61 +1206,60 @@ class DashScopeClient(IQwenClient):
         if seed is not None:
             kwargs["seed"] = seed
         
-        try:
-            loop = asyncio.get_event_loop()
-            max_retries = self._config.retry_attempts
-            last_error = None
-
-            for attempt in range(max_retries):
-                try:
-                    response = await loop.run_in_executor(
-                        None,
-                        lambda: VideoSynthesis.async_call(**kwargs)
-                    )
-                    
-                    if response.status_code == 200:
-                        task_id = response.output.get("task_id")
-                        return {
-                            "success": True,
-                            "task_id": task_id,
-                            "status": "processing",
-                            "message": "图生视频任务已提交，请使用 task_id 查询结果",
-                        }
-                    else:
-                        err = Exception(f"{response.code}: {response.message}")
-                        if _is_retryable_error(err) and attempt < max_retries - 1:
-                            is_rl = _is_rate_limit_error(err)
-                            wait_time = _retry_wait_time(attempt, is_rl)
-                            print(f"[DashScope 图生视频] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {err}")
-                            await asyncio.sleep(wait_time)
-                            last_error = err
-                            continue
-                        return {
-                            "success": False,
-                            "error": f"{response.code}: {response.message}",
-                        }
-                except Exception as e:
-                    if _is_retryable_error(e) and attempt < max_retries - 1:
-                        is_rl = _is_rate_limit_error(e)
-                        wait_time = _retry_wait_time(attempt, is_rl)
-                        print(f"[DashScope 图生视频] {'限流' if is_rl else '瞬态错误'}，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
-                        await asyncio.sleep(wait_time)
-                        last_error = e
-                        continue
-                    return {
-                        "success": False,
-                        "error": str(e),
-                    }
-
+        def on_success(response) -> Dict[str, Any]:
+            return {
+                "success": True,
+                "task_id": response.output.get("task_id"),
+                "status": "processing",
+                "message": "图生视频任务已提交，请使用 task_id 查询结果",
+            }
+        
+        return await self._retry_async(
+            "image_to_video",
+            "图生视频",
+            model,
+            partial(VideoSynthesis.async_call, **kwargs),
+            on_success,
+        )
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """获取客户端专用线程池（惰性创建，线程按需启动）"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=_EXECUTOR_MAX_WORKERS,
+                thread_name_prefix="dashscope",
+            )
+        return self._executor
+    
+    @staticmethod
+    def _parse_video_fetch(response: Any) -> Dict[str, Any]:
+        """将 VideoSynthesis.fetch 的响应转换为任务结果字典"""
+        if response.status_code != 200:
             return {
                 "success": False,
-                "error": f"重试 {max_retries} 次后仍失败: {last_error}",
+                "error": f"{response.code}: {response.message}",
             }
-        except Exception as e:
+        
+        output = response.output
+        status = output.get("task_status", "UNKNOWN")
+        
+        if status == "SUCCEEDED":
+            return {
+                "success": True,
+                "status": "completed",
+                "video_url": output.get("video_url"),
+            }
+        elif status == "FAILED":
             return {
                 "success": False,
-                "error": str(e),
+                "status": "failed",
+                "error": output.get("message", "任务失败"),
             }
+        return {
+            "success": True,
+            "status": "processing",
+            "message": f"任务状态: {status}",
+        }
     
     async def get_video_task_result(self, task_id: str) -> Dict[str, Any]:
         """
@@ -1030,53 +1271,43 @@ class DashScopeClient(IQwenClient):
         Returns:
             任务结果
         """
-        try:
-            from dashscope import VideoSynthesis
-        except ImportError:
-            raise ImportError(
-                "dashscope package is required. Install with: pip install dashscope"
-            )
+        return (await self.get_video_task_results([task_id]))[0]
+    
+    async def get_video_task_results(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        批量查询视频生成任务结果
         
-        try:
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: VideoSynthesis.fetch(api_key=self._api_key, task=task_id)
-            )
+        各任务的查询在客户端线程池中并发执行，总耗时约等于最慢的单次查询。
+        
+        Args:
+            task_ids: 任务ID列表
             
-            if response.status_code == 200:
-                output = response.output
-                status = output.get("task_status", "UNKNOWN")
-                
-                if status == "SUCCEEDED":
-                    video_url = output.get("video_url")
-                    return {
-                        "success": True,
-                        "status": "completed",
-                        "video_url": video_url,
-                    }
-                elif status == "FAILED":
-                    return {
-                        "success": False,
-                        "status": "failed",
-                        "error": output.get("message", "任务失败"),
-                    }
-                else:
-                    return {
-                        "success": True,
-                        "status": "processing",
-                        "message": f"任务状态: {status}",
-                    }
-            else:
-                return {
-                    "success": False,
-                    "error": f"{response.code}: {response.message}",
-                }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-            }
+        Returns:
+            与 task_ids 顺序一致的任务结果列表
+        """
+        VideoSynthesis = _video_synthesis()
+        
+        loop = asyncio.get_event_loop()
+        executor = self._get_executor()
+        futures = [
+            loop.run_in_executor(
+                executor,
+                partial(VideoSynthesis.fetch, api_key=self._api_key, task=task_id),
+            )
+            for task_id in task_ids
+        ]
+        responses = await asyncio.gather(*futures, return_exceptions=True)
+        
+        results = []
+        for response in responses:
+            if isinstance(response, BaseException):
+                results.append({"success": False, "error": str(response)})
+                continue
+            try:
+                results.append(self._parse_video_fetch(response))
+            except Exception as e:
+                results.append({"success": False, "error": str(e)})
+        return results
     
     async def text_to_speech(
         self,
@@ -1097,20 +1328,11 @@ class DashScopeClient(IQwenClient):
         Returns:
             包含音频数据的结果字典
         """
-        try:
-            from dashscope.audio.tts_v2 import SpeechSynthesizer, AudioFormat
-        except ImportError:
-            raise ImportError(
-                "dashscope package is required. Install with: pip install dashscope"
-            )
-        
-        # 将字符串格式映射到 AudioFormat 枚举
-        format_map = {
-            "mp3": AudioFormat.MP3_22050HZ_MONO_256KBPS,
-            "wav": AudioFormat.WAV_22050HZ_MONO_16BIT,
-            "pcm": AudioFormat.PCM_22050HZ_MONO_16BIT,
-        }
-        audio_format = format_map.get(format.lower(), AudioFormat.MP3_22050HZ_MONO_256KBPS)
+        SpeechSynthesizer, format_map = _tts_deps()
+        # 未知或缺省格式回退到 mp3（仅未命中时才取默认值）
+        audio_format = format_map.get(format.lower() if format else "mp3")
+        if audio_format is None:
+            audio_format = format_map["mp3"]
         
         try:
             loop = asyncio.get_event_loop()
@@ -7,7 +7,24 @@ from .models import Message, QwenResponse, QwenConfig
 
 
 class IQwenClient(ABC):
-    """Qwen 模型客户端接口"""
+    """
+    Qwen 模型客户端接口
+    
+    客户端支持异步上下文管理，退出时释放连接池、线程池等资源：
+    
+        async with DashScopeClient(config) as client:
+            response = await client.chat(messages)
+    """
+    
+    async def __aenter__(self) -> "IQwenClient":
+        return self
+    
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+    
+    async def aclose(self) -> None:
+        """释放客户端持有的资源（默认无操作，可重复调用）"""
+        pass
     
     @abstractmethod
     async def chat(
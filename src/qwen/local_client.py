@@ -5,7 +5,52 @@ from typing import List, Dict, Any, Optional, AsyncIterator
 
 from .interface import IQwenClient
 from .models import Message, QwenResponse, QwenConfig, QwenModel
-from .dashscope_client import MODEL_CONTEXT_WINDOWS
+from .dashscope_client import MODEL_CONTEXT_WINDOWS, _estimate_token_count
+from .retry import RetryableError, _parse_retry_after
+
+
+# 需要按可重试错误处理并读取 Retry-After 的 HTTP 状态码
+_RETRY_AFTER_STATUS_CODES = frozenset({429, 503})
+
+
+def _parse_openai_response(response: Any) -> QwenResponse:
+    """
+    将 OpenAI 兼容接口的响应转换为 QwenResponse
+    
+    纯文本回复（无工具调用）走快速路径，不构建工具调用列表。
+    """
+    choice = response.choices[0]
+    message = choice.message
+    
+    tool_calls = None
+    if message.tool_calls:
+        tool_calls = [
+            {
+                "id": tc.id,
+                "type": tc.type,
+                "function": {
+                    "name": tc.function.name,
+                    "arguments": tc.function.arguments,
+                }
+            }
+            for tc in message.tool_calls
+        ]
+    
+    raw_usage = response.usage
+    usage = {}
+    if raw_usage:
+        usage = {
+            "prompt_tokens": raw_usage.prompt_tokens,
+            "completion_tokens": raw_usage.completion_tokens,
+            "total_tokens": raw_usage.total_tokens,
+        }
+    
+    return QwenResponse(
+        content=message.content or "",
+        tool_calls=tool_calls,
+        finish_reason=choice.finish_reason or "stop",
+        usage=usage,
+    )
 
 
 class LocalQwenClient(IQwenClient):
@@ -43,6 +88,12 @@ class LocalQwenClient(IQwenClient):
             )
         return self._client
     
+    async def aclose(self) -> None:
+        """关闭底层 OpenAI 客户端的 HTTP 连接池"""
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.close()
+    
     async def chat(
         self,
         messages: List[Message],
@@ -82,6 +133,9 @@ class LocalQwenClient(IQwenClient):
             kwargs["tools"] = tools
             kwargs["tool_choice"] = "auto"
         
+        if effective_config.idempotency_key:
+            kwargs["extra_headers"] = {"Idempotency-Key": effective_config.idempotency_key}
+        
         try:
             response = await asyncio.wait_for(
                 client.chat.completions.create(**kwargs),
@@ -91,39 +145,16 @@ class LocalQwenClient(IQwenClient):
             raise TimeoutError(
                 f"Request timed out after {effective_config.timeout}s"
             )
-        
-        # 解析响应
-        choice = response.choices[0]
-        message = choice.message
-        
-        tool_calls = None
-        if message.tool_calls:
-            tool_calls = [
-                {
-                    "id": tc.id,
-                    "type": tc.type,
-                    "function": {
-                        "name": tc.function.name,
-                        "arguments": tc.function.arguments,
-                    }
-                }
-                for tc in message.tool_calls
-            ]
-        
-        usage = {}
-        if response.usage:
-            usage = {
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens,
-            }
-        
-        return QwenResponse(
-            content=message.content or "",
-            tool_calls=tool_calls,
-            finish_reason=choice.finish_reason or "stop",
-            usage=usage,
-        )
+        except Exception as e:
+            # 限流/服务不可用时携带服务端建议的等待时间
+            if getattr(e, "status_code", None) in _RETRY_AFTER_STATUS_CODES:
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                raise RetryableError(
+                    str(e), retry_after=_parse_retry_after(headers.get("retry-after"))
+                ) from e
+            raise
+        
+        return _parse_openai_response(response)
     
     async def chat_stream(
         self,
@@ -162,13 +193,18 @@ class LocalQwenClient(IQwenClient):
             kwargs["tools"] = tools
             kwargs["tool_choice"] = "auto"
         
+        if effective_config.idempotency_key:
+            kwargs["extra_headers"] = {"Idempotency-Key": effective_config.idempotency_key}
+        
         stream = await client.chat.completions.create(**kwargs)
         
         async for chunk in stream:
-            if chunk.choices:
-                delta = chunk.choices[0].delta
-                if delta.content:
-                    yield delta.content
+            choices = chunk.choices
+            if not choices:
+                continue
+            content = choices[0].delta.content
+            if content:
+                yield content
     
     async def health_check(self) -> bool:
         """
@@ -201,21 +237,7 @@ class LocalQwenClient(IQwenClient):
         Returns:
             估算的 token 数量
         """
-        if not text:
-            return 0
-        
-        try:
-            import tiktoken
-            enc = tiktoken.get_encoding("cl100k_base")
-            return len(enc.encode(text))
-        except ImportError:
-            pass
-        
-        # 启发式方法
-        chinese_chars = sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
-        other_chars = len(text) - chinese_chars
-        estimated = int(chinese_chars * 1.5 + other_chars * 0.25)
-        return max(1, estimated)
+        return _estimate_token_count(text)
     
     def get_context_window(self) -> int:
         """
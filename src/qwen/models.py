@@ -1,5 +1,6 @@
 """Qwen model-related data structures."""
 
+import sys
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Union
 from enum import Enum
@@ -40,26 +41,15 @@ class QwenModel(Enum):
 
     def is_qwen_native(self) -> bool:
         """是否为 Qwen 原生模型（支持 enable_search/search_strategy/enable_code_interpreter）"""
-        return self.value.startswith(("qwen", "qwen2", "qwen3"))
+        return self in _QWEN_NATIVE_MODELS
 
     def supports_thinking(self) -> bool:
         """是否支持 enable_thinking 参数"""
-        # Qwen3 系列、DeepSeek R1/V3.2、GLM 4.5/4.6/4.7 支持
-        # Kimi 系列目前不支持
-        thinking_models = {
-            QwenModel.QWEN3_MAX, QwenModel.QWEN3_MAX_PREVIEW,
-            QwenModel.DEEPSEEK_V3, QwenModel.DEEPSEEK_V3_2, QwenModel.DEEPSEEK_R1,
-            QwenModel.GLM_4_PLUS, QwenModel.GLM_4_5, QwenModel.GLM_4_7,
-        }
-        return self in thinking_models
+        return self in _THINKING_MODELS
 
     def is_vision_model(self) -> bool:
         """是否为视觉模型（需要使用 MultiModalConversation API）"""
-        vision_models = {
-            QwenModel.QWEN_VL_MAX, QwenModel.QWEN_VL_PLUS,
-            QwenModel.QWEN2_VL_72B, QwenModel.QWEN_VL_OCR,
-        }
-        return self in vision_models
+        return self in _VISION_MODELS
 
     def requires_multimodal_api(self) -> bool:
         """是否必须使用 MultiModalConversation API（即使是纯文本调用）
@@ -67,10 +57,29 @@ class QwenModel(Enum):
         某些第三方模型（如 kimi-k2.5）在 DashScope 原生 SDK 中
         只能通过 MultiModalConversation API 调用，不支持 Generation API。
         """
-        return self in {QwenModel.KIMI_K2_5} or self.is_vision_model()
+        return self in _MULTIMODAL_API_MODELS
+
+
+# 模型能力集合（模块加载时计算一次，方法调用为 O(1) 成员判断）
+_QWEN_NATIVE_MODELS = frozenset(m for m in QwenModel if m.value.startswith("qwen"))
 
+# Qwen3 系列、DeepSeek R1/V3.2、GLM 4.5/4.6/4.7 支持深度思考
+# Kimi 系列目前不支持
+_THINKING_MODELS = frozenset({
+    QwenModel.QWEN3_MAX, QwenModel.QWEN3_MAX_PREVIEW,
+    QwenModel.DEEPSEEK_V3, QwenModel.DEEPSEEK_V3_2, QwenModel.DEEPSEEK_R1,
+    QwenModel.GLM_4_PLUS, QwenModel.GLM_4_5, QwenModel.GLM_4_7,
+})
 
-@dataclass
+_VISION_MODELS = frozenset({
+    QwenModel.QWEN_VL_MAX, QwenModel.QWEN_VL_PLUS,
+    QwenModel.QWEN2_VL_72B, QwenModel.QWEN_VL_OCR,
+})
+
+_MULTIMODAL_API_MODELS = _VISION_MODELS | frozenset({QwenModel.KIMI_K2_5})
+
+
+@dataclass(slots=True)
 class QwenConfig:
     """Qwen 模型配置"""
     model: QwenModel = QwenModel.QWEN3_MAX  # 默认使用 qwen3-max
@@ -79,12 +88,20 @@ class QwenConfig:
     temperature: float = 0.7
     max_tokens: Optional[int] = None
     timeout: float = 120.0  # 增加超时时间到 120 秒
+    total_timeout: Optional[float] = None  # 整个重试序列的总时限（秒），None 表示不限制
     retry_attempts: int = 5
     top_p: float = 0.8
     enable_search: bool = True  # 是否启用联网搜索功能
     search_strategy: Optional[str] = None  # 搜索策略: None=普通搜索, "agent_max"=启用网页抽取（需模型支持）
     enable_thinking: bool = True  # 是否启用深度思考功能
     enable_code_interpreter: bool = False  # 是否启用代码解释器（仅支持流式调用，需启用思考模式）
+    idempotent: bool = True  # 请求是否可安全重发；False 时失败后不重试、不降级
+    idempotency_key: Optional[str] = None  # 通过 Idempotency-Key 请求头传给服务端用于去重
+    
+    @property
+    def effective_retry_attempts(self) -> int:
+        """实际允许的调用次数：非幂等请求只调用一次"""
+        return self.retry_attempts if self.idempotent else 1
     
     def to_dict(self) -> Dict[str, Any]:
         """序列化为字典"""
@@ -95,23 +112,24 @@ class QwenConfig:
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
             "timeout": self.timeout,
+            "total_timeout": self.total_timeout,
             "retry_attempts": self.retry_attempts,
             "top_p": self.top_p,
             "enable_search": self.enable_search,
             "search_strategy": self.search_strategy,
             "enable_code_interpreter": self.enable_code_interpreter,
+            "idempotent": self.idempotent,
+            "idempotency_key": self.idempotency_key,
         }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "QwenConfig":
         """从字典反序列化"""
-        model_value = data.get("model", "qwen-plus")
-        # 尝试匹配枚举值
-        model = QwenModel.QWEN_PLUS
-        for m in QwenModel:
-            if m.value == model_value:
-                model = m
-                break
+        # 按枚举值查找（Enum 内部为字典查找），未知模型回退到 qwen-plus
+        try:
+            model = QwenModel(data.get("model", "qwen-plus"))
+        except ValueError:
+            model = QwenModel.QWEN_PLUS
         
         return cls(
             model=model,
@@ -120,25 +138,36 @@ class QwenConfig:
             temperature=data.get("temperature", 0.7),
             max_tokens=data.get("max_tokens"),
             timeout=data.get("timeout", 60.0),
+            total_timeout=data.get("total_timeout"),
             retry_attempts=data.get("retry_attempts", 3),
             top_p=data.get("top_p", 0.8),
             enable_search=data.get("enable_search", True),
             search_strategy=data.get("search_strategy"),
             enable_code_interpreter=data.get("enable_code_interpreter", False),
+            idempotent=data.get("idempotent", True),
+            idempotency_key=data.get("idempotency_key"),
         )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Message:
-    """消息数据结构 - 支持纯文本和多模态内容"""
+    """消息数据结构 - 支持纯文本和多模态内容（不可变，修改请用 dataclasses.replace）"""
     role: str  # "system", "user", "assistant", "tool"
     content: Any  # str 或 list[dict]（多模态：[{"image": url}, {"text": prompt}]）
     tool_calls: Optional[List[Dict[str, Any]]] = None
     tool_call_id: Optional[str] = None
+    # to_dict() 结果缓存：历史消息每轮都会被重新序列化，缓存后只需构建一次；
+    # 消息不可变，缓存无需失效
+    _cached_dict: Optional[Dict[str, Any]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
     
     def to_dict(self) -> Dict[str, Any]:
-        """转换为 API 格式"""
-        result: Dict[str, Any] = {
+        """转换为 API 格式（返回的字典会被缓存复用，调用方不应修改）"""
+        result = self._cached_dict
+        if result is not None:
+            return result
+        result = {
             "role": self.role,
             "content": self.content,  # str 或 list 均可直接传递给 DashScope
         }
@@ -146,20 +175,22 @@ class Message:
             result["tool_calls"] = self.tool_calls
         if self.tool_call_id:
             result["tool_call_id"] = self.tool_call_id
+        object.__setattr__(self, "_cached_dict", result)
         return result
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Message":
         """从字典创建"""
         return cls(
-            role=data["role"],
+            # 反序列化得到的角色字符串驻留后与字面量共享同一对象
+            role=sys.intern(data["role"]),
             content=data.get("content", ""),
             tool_calls=data.get("tool_calls"),
             tool_call_id=data.get("tool_call_id"),
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class QwenResponse:
     """Qwen 响应数据结构"""
     content: str
@@ -1,10 +1,19 @@
 """Retry and fallback mechanisms for Qwen clients."""
 
 import asyncio
+import errno
+import hashlib
+import json
+import math
 import random
-from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+import re
+import time
+from dataclasses import asdict, dataclass, field, replace
+from email.utils import parsedate_to_datetime
+from functools import partial
+from typing import List, Dict, Any, FrozenSet, Literal, Optional, Set, Tuple
 
+from .dashscope_client import _Breaker
 from .interface import IQwenClient
 from .models import Message, QwenResponse, QwenConfig, QwenModel
 
@@ -17,6 +26,73 @@ class RetryConfig:
     max_delay: float = 30.0
     exponential_base: float = 2.0
     jitter: bool = True
+    # 降级对冲间隔（秒）：None 表示按顺序逐个尝试降级模型；
+    # 设置后，若当前模型在该间隔内未返回，则并行启动下一个降级模型，先成功者胜出
+    hedge_delay: Optional[float] = None
+    # 抖动策略（jitter=True 时生效）：
+    #   "half"         指数退避 × [0.5, 1.5) 随机系数（默认）
+    #   "full"         [0, 指数退避) 均匀随机
+    #   "decorrelated" min(max_delay, uniform(initial_delay, 上次延迟 × 3))，
+    #                  有状态，每次调用应使用 fresh() 得到的独立副本
+    jitter_strategy: Literal["half", "full", "decorrelated"] = "half"
+    # 单次尝试超时（秒）：None 表示不额外限制，由底层客户端自身的 timeout 控制
+    per_attempt_timeout: Optional[float] = None
+    # 整个重试（含降级）序列的总时限（秒），包含退避等待；None 表示不限制
+    total_deadline: Optional[float] = None
+    # 每个配置独立的随机数生成器，避免争用 random 模块的全局实例
+    _rng: random.Random = field(
+        default_factory=random.Random, init=False, repr=False, compare=False
+    )
+    # 指数退避达到 max_delay 上限的尝试次数（None 表示永不饱和）
+    _saturation_attempt: Optional[int] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # decorrelated 抖动的上一次延迟（0 表示尚未开始）
+    _prev_delay: float = field(default=0.0, init=False, repr=False, compare=False)
+    # 前 max_attempts 次尝试的基础延迟（未加抖动）
+    _base_delays: Tuple[float, ...] = field(
+        default=(), init=False, repr=False, compare=False
+    )
+    # 计算 _base_delays / _saturation_attempt 时的参数；配置可变，参数变化后按需重算
+    _delay_params: Tuple[Any, ...] = field(
+        default=(), init=False, repr=False, compare=False
+    )
+    
+    def __post_init__(self) -> None:
+        self._refresh_delay_table()
+    
+    def _refresh_delay_table(self) -> None:
+        """按当前参数重算退避延迟表（参数未变化时不做任何事）"""
+        params = (self.initial_delay, self.max_delay, self.exponential_base, self.max_attempts)
+        if params == self._delay_params:
+            return
+        self._delay_params = params
+        self._saturation_attempt = None
+        if self.initial_delay >= self.max_delay:
+            self._saturation_attempt = 0
+        elif self.initial_delay > 0 and self.exponential_base > 1:
+            self._saturation_attempt = math.ceil(
+                math.log(self.max_delay / self.initial_delay, self.exponential_base)
+            )
+        self._base_delays = tuple(map(self._base_delay, range(self.max_attempts)))
+    
+    def fresh(self) -> "RetryConfig":
+        """返回参数相同、抖动状态重置的副本（用于有状态的 decorrelated 策略）"""
+        return replace(self)
+    
+    def _base_delay(self, attempt: int) -> float:
+        """计算未加抖动的指数退避延迟"""
+        saturation = self._saturation_attempt
+        if saturation is not None and attempt >= saturation:
+            # 已饱和，无需再计算幂
+            return self.max_delay
+        if self.exponential_base == 2.0:
+            # 底数为 2 时直接调整浮点指数，避免 pow
+            return min(math.ldexp(self.initial_delay, attempt), self.max_delay)
+        return min(
+            self.initial_delay * (self.exponential_base ** attempt),
+            self.max_delay
+        )
     
     def get_delay(self, attempt: int) -> float:
         """
@@ -28,14 +104,105 @@ class RetryConfig:
         Returns:
             延迟时间（秒）
         """
-        delay = min(
-            self.initial_delay * (self.exponential_base ** attempt),
-            self.max_delay
+        self._refresh_delay_table()
+        base_delays = self._base_delays
+        if attempt < len(base_delays):
+            delay = base_delays[attempt]
+        else:
+            delay = self._base_delay(attempt)
+        if not self.jitter:
+            return delay
+        if self.jitter_strategy == "full":
+            return self._rng.uniform(0.0, delay)
+        if self.jitter_strategy == "decorrelated":
+            prev = self._prev_delay or self.initial_delay
+            delay = min(self.max_delay, self._rng.uniform(self.initial_delay, prev * 3))
+            self._prev_delay = delay
+            return delay
+        # 添加 ±50% 的随机抖动
+        return delay * (0.5 + self._rng.random())
+
+
+class RetryBudget:
+    """
+    重试预算（令牌桶）
+    
+    在共享同一预算的所有并发调用之间限制重试总量：每次重试（包括切换到降级模型）
+    消耗一个令牌，令牌按 refill_per_sec 的速率恢复，最多累积 capacity 个。
+    上游大面积故障时，超出预算的重试直接失败，避免重试风暴放大负载。
+    """
+    
+    def __init__(self, capacity: float = 10, refill_per_sec: float = 1.0):
+        """
+        初始化重试预算
+        
+        Args:
+            capacity: 令牌桶容量（允许的突发重试数）
+            refill_per_sec: 每秒恢复的令牌数
+        """
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = float(capacity)
+        self._updated_at = time.monotonic()
+    
+    def try_consume(self) -> bool:
+        """
+        尝试消耗一个令牌
+        
+        方法内部没有 await，在事件循环中天然是原子的，无需加锁。
+        
+        Returns:
+            是否允许本次重试
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated_at) * self.refill_per_sec
         )
-        if self.jitter:
-            # 添加 ±50% 的随机抖动
-            delay *= (0.5 + random.random())
-        return delay
+        self._updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _RetryWheel:
+    """
+    合并重试等待的定时器
+    
+    唤醒时间落在同一 resolution 区间内的等待共用一个 TimerHandle，
+    大量并发重试时减少事件循环定时器堆的插入次数；代价是唤醒最多推迟 resolution 秒，
+    对带抖动的退避等待可以接受。
+    """
+    
+    def __init__(self, resolution: float = 0.05):
+        self.resolution = resolution
+        # (事件循环, 区间序号) -> 该区间内的等待者
+        self._buckets: Dict[Tuple[asyncio.AbstractEventLoop, int], List[asyncio.Future]] = {}
+    
+    async def sleep(self, delay: float) -> None:
+        """等待约 delay 秒（向上取整到 resolution 区间边界）"""
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+        loop = asyncio.get_running_loop()
+        slot = math.ceil((loop.time() + delay) / self.resolution)
+        key = (loop, slot)
+        waiters = self._buckets.get(key)
+        if waiters is None:
+            waiters = self._buckets[key] = []
+            loop.call_at(slot * self.resolution, self._wake, key)
+        # 每个等待者使用独立的 Future，取消单个等待不影响同区间的其他等待者
+        future = loop.create_future()
+        waiters.append(future)
+        await future
+    
+    def _wake(self, key: Tuple[asyncio.AbstractEventLoop, int]) -> None:
+        for future in self._buckets.pop(key, ()):
+            if not future.done():
+                future.set_result(None)
+
+
+_RETRY_WHEEL = _RetryWheel()
 
 
 # 模型降级链
@@ -51,10 +218,78 @@ MODEL_FALLBACK_CHAIN: Dict[QwenModel, List[QwenModel]] = {
     QwenModel.QWEN2_5_7B: [],
 }
 
+# 每个主模型的完整尝试序列（主模型 + 降级链），模块加载时计算一次
+# 注意：运行时修改 MODEL_FALLBACK_CHAIN 不会反映到此表
+_FULL_CHAINS: Dict[QwenModel, Tuple[QwenModel, ...]] = {
+    m: (m, *MODEL_FALLBACK_CHAIN.get(m, ())) for m in QwenModel
+}
+
+
+# 可重试错误的特征文本（小写，匹配时忽略大小写）
+_RETRYABLE_PATTERNS: FrozenSet[str] = frozenset({
+    "timeout", "connection", "network", "rate limit", "too many requests",
+    "502", "503", "504", "429",
+})
+_RETRYABLE_RE = re.compile(
+    "|".join(map(re.escape, sorted(_RETRYABLE_PATTERNS))),
+    re.IGNORECASE,
+)
+
+
+def _build_retryable_automaton():
+    """构建 Aho-Corasick 自动机，未安装 pyahocorasick 时返回 None（回退到正则）"""
+    try:
+        import ahocorasick
+    except ImportError:
+        return None
+    automaton = ahocorasick.Automaton()
+    for pattern in _RETRYABLE_PATTERNS:
+        automaton.add_word(pattern, pattern)
+    automaton.make_automaton()
+    return automaton
+
+
+# 可选依赖：特征文本增多时，单次扫描的耗时与模式数量无关
+_RETRYABLE_AUTOMATON = _build_retryable_automaton()
+
+
+def _has_retryable_pattern(text: str) -> bool:
+    """错误文本中是否包含可重试特征"""
+    if _RETRYABLE_AUTOMATON is not None:
+        return next(_RETRYABLE_AUTOMATON.iter(text.lower()), None) is not None
+    return _RETRYABLE_RE.search(text) is not None
+
 
 class RetryableError(Exception):
     """可重试的错误"""
-    pass
+    
+    def __init__(self, message: str = "", retry_after: Optional[float] = None):
+        """
+        Args:
+            message: 错误信息
+            retry_after: 服务端建议的重试等待时间（秒），来自 Retry-After 响应头
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头
+    
+    支持秒数与 HTTP 日期两种格式，无法解析时返回 None。
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
 
 
 class NonRetryableError(Exception):
@@ -62,6 +297,58 @@ class NonRetryableError(Exception):
     pass
 
 
+class AllModelsFailedError(Exception):
+    """
+    主模型及所有降级模型均失败
+    
+    只保存最后一个错误，错误信息在需要时（str()）才格式化。
+    """
+    
+    def __init__(self, last_error: Optional[Exception] = None):
+        super().__init__()
+        self.last_error = last_error
+    
+    def __str__(self) -> str:
+        return f"All models failed. Last error: {self.last_error}"
+
+
+# 按异常类型即可确定的分类结果（超时与显式标记的错误），其余类型需检查错误文本
+_ALWAYS_RETRYABLE_TYPES = (asyncio.TimeoutError, TimeoutError, RetryableError)
+_NEVER_RETRYABLE_TYPES = (NonRetryableError, ValueError, TypeError)
+
+# 异常类型 -> 是否可重试 的缓存（类对象常驻内存，普通字典即可）
+_TYPE_CACHE: Dict[type, bool] = {}
+
+
+# 异常实例上缓存分类结果的属性名
+_RETRYABLE_ATTR = "_qwen_is_retryable"
+
+# 可重试的 HTTP 状态码
+_RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+# 可重试的套接字错误码
+_RETRYABLE_ERRNOS = frozenset({
+    errno.ECONNRESET, errno.ECONNREFUSED, errno.ECONNABORTED,
+    errno.ETIMEDOUT, errno.EPIPE, errno.ENETUNREACH, errno.EHOSTUNREACH,
+})
+
+
+def _structured_retryable(error: Exception) -> Optional[bool]:
+    """
+    根据异常携带的结构化信息（HTTP 状态码、errno）判断是否可重试
+    
+    无需把异常转为字符串（大型 HTTP 错误的文本可能包含完整响应体）。
+    没有可用信息时返回 None。
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in _RETRYABLE_STATUS_CODES
+    if getattr(error, "errno", None) in _RETRYABLE_ERRNOS:
+        return True
+    return None
+
+
 def is_retryable_error(error: Exception) -> bool:
     """
     判断错误是否可重试
@@ -72,29 +359,51 @@ def is_retryable_error(error: Exception) -> bool:
     Returns:
         是否可重试
     """
-    # 超时错误可重试
-    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
-        return True
+    error_type = type(error)
+    cached = _TYPE_CACHE.get(error_type)
+    if cached is not None:
+        return cached
     
-    # 连接错误可重试
-    error_str = str(error).lower()
-    retryable_patterns = [
-        "timeout",
-        "connection",
-        "network",
-        "rate limit",
-        "too many requests",
-        "503",
-        "502",
-        "504",
-        "429",
-    ]
+    # 超时错误及显式标记的错误类型，结论只取决于类型，可按类型缓存
+    if issubclass(error_type, _ALWAYS_RETRYABLE_TYPES):
+        _TYPE_CACHE[error_type] = True
+        return True
+    if issubclass(error_type, _NEVER_RETRYABLE_TYPES):
+        _TYPE_CACHE[error_type] = False
+        return False
     
-    for pattern in retryable_patterns:
-        if pattern in error_str:
-            return True
+    # 按错误文本分类的结果缓存在异常实例上，同一异常被多层调用方检查时只扫描一次
+    cached = getattr(error, _RETRYABLE_ATTR, None)
+    if cached is not None:
+        return cached
     
-    return False
+    result = _structured_retryable(error)
+    if result is None:
+        # 无结构化信息时检查错误文本：连接、限流、网关类错误可重试
+        result = _has_retryable_pattern(str(error))
+    try:
+        setattr(error, _RETRYABLE_ATTR, result)
+    except (AttributeError, TypeError):
+        # 部分 C 扩展异常不允许设置属性，下次重新计算
+        pass
+    return result
+
+
+def _retry_delay(retry_cfg: RetryConfig, attempt: int, error: Exception) -> float:
+    """计算重试前的等待时间：优先使用服务端建议的等待时间（不超过 max_delay）"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        return min(retry_after, retry_cfg.max_delay)
+    return retry_cfg.get_delay(attempt)
+
+
+def _is_single_shot(retry_cfg: RetryConfig) -> bool:
+    """是否只调用一次且无需超时/时限控制（可跳过重试循环）"""
+    return (
+        retry_cfg.max_attempts == 1
+        and retry_cfg.per_attempt_timeout is None
+        and retry_cfg.total_deadline is None
+    )
 
 
 async def execute_with_retry(
@@ -103,6 +412,8 @@ async def execute_with_retry(
     tools: Optional[List[Dict[str, Any]]] = None,
     config: Optional[QwenConfig] = None,
     retry_config: Optional[RetryConfig] = None,
+    retry_budget: Optional[RetryBudget] = None,
+    deadline: Optional[float] = None,
 ) -> QwenResponse:
     """
     带重试的模型调用
@@ -113,6 +424,8 @@ async def execute_with_retry(
         tools: 工具定义
         config: 模型配置
         retry_config: 重试配置
+        retry_budget: 共享重试预算，耗尽时不再重试
+        deadline: 绝对截止时间（事件循环时间），未提供时按 retry_config.total_deadline 计算
         
     Returns:
         模型响应
@@ -121,20 +434,48 @@ async def execute_with_retry(
         Exception: 所有重试都失败后抛出最后一个异常
     """
     retry_cfg = retry_config or RetryConfig()
+    if deadline is None and _is_single_shot(retry_cfg):
+        # 快速路径：无重试、无超时包装，直接调用
+        return await client.chat(messages, tools=tools, config=config)
+    if retry_cfg.jitter_strategy == "decorrelated":
+        # decorrelated 抖动有状态，每次调用使用独立副本，避免并发调用相互干扰
+        retry_cfg = retry_cfg.fresh()
+    loop = asyncio.get_running_loop()
+    if deadline is None and retry_cfg.total_deadline is not None:
+        deadline = loop.time() + retry_cfg.total_deadline
+    idempotent = config is None or config.idempotent
     last_error: Optional[Exception] = None
     
     for attempt in range(retry_cfg.max_attempts):
+        timeout = retry_cfg.per_attempt_timeout
+        if deadline is not None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                last_error = last_error or asyncio.TimeoutError("total deadline exceeded")
+                break
+            timeout = remaining if timeout is None else min(timeout, remaining)
         try:
-            return await client.chat(messages, tools=tools, config=config)
+            if timeout is None:
+                return await client.chat(messages, tools=tools, config=config)
+            return await asyncio.wait_for(
+                client.chat(messages, tools=tools, config=config), timeout
+            )
         except Exception as e:
             last_error = e
             
-            if not is_retryable_error(e):
+            # 非幂等请求可能已在服务端生效，不重试
+            if not idempotent or not is_retryable_error(e):
                 raise
             
             if attempt < retry_cfg.max_attempts - 1:
-                delay = retry_cfg.get_delay(attempt)
-                await asyncio.sleep(delay)
+                if retry_budget is not None and not retry_budget.try_consume():
+                    # 重试预算耗尽，直接失败
+                    break
+                delay = _retry_delay(retry_cfg, attempt, e)
+                if deadline is not None and loop.time() + delay >= deadline:
+                    # 等待后已无剩余时间，不再重试
+                    break
+                await _RETRY_WHEEL.sleep(delay)
     
     raise last_error or Exception("All retry attempts failed")
 
@@ -145,6 +486,8 @@ async def execute_with_fallback(
     tools: Optional[List[Dict[str, Any]]] = None,
     config: Optional[QwenConfig] = None,
     retry_config: Optional[RetryConfig] = None,
+    retry_budget: Optional[RetryBudget] = None,
+    breakers: Optional[Dict[QwenModel, _Breaker]] = None,
 ) -> QwenResponse:
     """
     带降级的模型调用
@@ -157,6 +500,8 @@ async def execute_with_fallback(
         tools: 工具定义
         config: 模型配置
         retry_config: 重试配置
+        retry_budget: 共享重试预算，切换降级模型同样消耗预算
+        breakers: 按模型维护的熔断器（调用过程中按需创建），熔断中的模型直接跳过
         
     Returns:
         模型响应
@@ -167,50 +512,217 @@ async def execute_with_fallback(
     effective_config = config or QwenConfig()
     retry_cfg = retry_config or RetryConfig()
     
-    # 构建要尝试的模型列表
-    models_to_try = [effective_config.model]
-    models_to_try.extend(MODEL_FALLBACK_CHAIN.get(effective_config.model, []))
+    # 要尝试的模型序列（预先计算）；非幂等请求不降级，避免重复执行
+    if effective_config.idempotent:
+        models_to_try = _FULL_CHAINS[effective_config.model]
+    else:
+        models_to_try = (effective_config.model,)
+    
+    if len(models_to_try) == 1 and breakers is None and _is_single_shot(retry_cfg):
+        # 快速路径：无降级模型、无重试，直接调用
+        try:
+            return await client.chat(messages, tools=tools, config=effective_config)
+        except Exception as e:
+            raise AllModelsFailedError(e) from e
+    
+    # 降级模型沿用原配置的全部字段，仅替换 model；主模型直接复用原配置
+    configs = [
+        effective_config if model is effective_config.model
+        else replace(effective_config, model=model)
+        for model in models_to_try
+    ]
+    
+    # 总时限覆盖所有模型
+    deadline = None
+    if retry_cfg.total_deadline is not None:
+        deadline = asyncio.get_running_loop().time() + retry_cfg.total_deadline
+    
+    if retry_cfg.hedge_delay is not None and len(configs) > 1:
+        return await _execute_hedged(
+            client, messages, tools, configs, retry_cfg, retry_budget, breakers, deadline
+        )
     
     last_error: Optional[Exception] = None
+    attempted = False
+    
+    for current_config in configs:
+        breaker = _get_model_breaker(breakers, current_config.model)
+        if breaker is not None and not breaker.allow():
+            # 熔断中的模型直接跳过，不消耗重试预算
+            last_error = last_error or _circuit_open_error(current_config.model)
+            continue
+        probing = breaker is not None and breaker.state == "half_open"
+        if attempted and retry_budget is not None and not retry_budget.try_consume():
+            # 预算不足、探测请求未发出：交还探测名额
+            if probing:
+                breaker.release_probe()
+            break
+        attempted = True
+        # 尝试使用当前模型（可重试错误在模型内重试，其余错误直接尝试下一个模型）
+        try:
+            return await _execute_with_breaker(
+                client, messages, tools, current_config, retry_cfg, retry_budget, breaker,
+                deadline,
+            )
+        except Exception as e:
+            last_error = e
+            if deadline is not None and asyncio.get_running_loop().time() >= deadline:
+                break
     
-    for model in models_to_try:
-        # 创建当前模型的配置
-        current_config = QwenConfig(
-            model=model,
-            api_key=effective_config.api_key,
-            base_url=effective_config.base_url,
-            temperature=effective_config.temperature,
-            max_tokens=effective_config.max_tokens,
-            timeout=effective_config.timeout,
-            retry_attempts=effective_config.retry_attempts,
-            top_p=effective_config.top_p,
+    raise AllModelsFailedError(last_error) from last_error
+
+
+def _get_model_breaker(
+    breakers: Optional[Dict[QwenModel, _Breaker]], model: QwenModel
+) -> Optional[_Breaker]:
+    """获取（必要时创建）模型对应的熔断器，未启用熔断时返回 None"""
+    if breakers is None:
+        return None
+    breaker = breakers.get(model)
+    if breaker is None:
+        breaker = breakers[model] = _Breaker()
+    return breaker
+
+
+def _circuit_open_error(model: QwenModel) -> NonRetryableError:
+    """熔断跳过模型时使用的错误"""
+    return NonRetryableError(f"circuit open: {model.value}")
+
+
+async def _execute_with_breaker(
+    client: IQwenClient,
+    messages: List[Message],
+    tools: Optional[List[Dict[str, Any]]],
+    config: QwenConfig,
+    retry_cfg: RetryConfig,
+    retry_budget: Optional[RetryBudget],
+    breaker: Optional[_Breaker],
+    deadline: Optional[float] = None,
+) -> QwenResponse:
+    """调用单个模型（含重试），并把结果记入熔断器"""
+    if breaker is None:
+        return await execute_with_retry(
+            client, messages, tools=tools, config=config,
+            retry_config=retry_cfg, retry_budget=retry_budget, deadline=deadline,
         )
-        
-        # 尝试使用当前模型
-        for attempt in range(retry_cfg.max_attempts):
-            try:
-                return await client.chat(messages, tools=tools, config=current_config)
-            except Exception as e:
-                last_error = e
-                
-                if not is_retryable_error(e):
-                    # 不可重试的错误，尝试下一个模型
-                    break
-                
-                if attempt < retry_cfg.max_attempts - 1:
-                    delay = retry_cfg.get_delay(attempt)
-                    await asyncio.sleep(delay)
+    try:
+        response = await execute_with_retry(
+            client, messages, tools=tools, config=config,
+            retry_config=retry_cfg, retry_budget=retry_budget, deadline=deadline,
+        )
+    except asyncio.CancelledError:
+        # 被取消（如对冲竞速失败）的探测请求不计入结果，下次调用重新探测
+        breaker.release_probe()
+        raise
+    except Exception as e:
+        if is_retryable_error(e):
+            breaker.record_failure()
+        elif breaker.state == "half_open":
+            # 不可重试的错误（如参数错误）说明上游可达，不应让单个调用方的错误输入熔断模型
+            breaker.record_success()
+        raise
+    breaker.record_success()
+    return response
+
+
+async def _execute_hedged(
+    client: IQwenClient,
+    messages: List[Message],
+    tools: Optional[List[Dict[str, Any]]],
+    configs: List[QwenConfig],
+    retry_cfg: RetryConfig,
+    retry_budget: Optional[RetryBudget] = None,
+    breakers: Optional[Dict[QwenModel, _Breaker]] = None,
+    deadline: Optional[float] = None,
+) -> QwenResponse:
+    """
+    对冲式降级调用
     
-    raise Exception(
-        f"All models failed. Last error: {last_error}"
-    ) from last_error
+    先启动主模型；每经过 hedge_delay 仍无结果（或已有模型失败）时启动下一个降级模型。
+    任一模型成功即取消其余请求并返回。
+    """
+    pending: Set[asyncio.Task] = set()
+    remaining = iter(configs)
+    last_error: Optional[Exception] = None
+    
+    def launch_next(is_hedge: bool = True) -> bool:
+        nonlocal last_error
+        for current_config in remaining:
+            breaker = _get_model_breaker(breakers, current_config.model)
+            if breaker is None or breaker.allow():
+                break
+            # 熔断中的模型直接跳过
+            last_error = last_error or _circuit_open_error(current_config.model)
+        else:
+            return False
+        # 对冲请求同样计入重试预算
+        if is_hedge and retry_budget is not None and not retry_budget.try_consume():
+            # 请求未发出：交还可能已取得的探测名额
+            if breaker is not None and breaker.state == "half_open":
+                breaker.release_probe()
+            return False
+        pending.add(asyncio.ensure_future(_execute_with_breaker(
+            client, messages, tools, current_config, retry_cfg, retry_budget, breaker,
+            deadline,
+        )))
+        return True
+    
+    launch_next(is_hedge=False)
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=retry_cfg.hedge_delay,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            failed = False
+            for task in done:
+                pending.discard(task)
+                error = task.exception()
+                if error is None:
+                    return task.result()
+                last_error = error
+                failed = True
+            # 超时未返回或已有模型失败：启动下一个降级模型
+            if (failed or not done) and not launch_next() and not pending:
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    raise AllModelsFailedError(last_error) from last_error
+
+
+async def _aclose_stream(stream: Any) -> None:
+    """关闭流（异步生成器），不支持关闭的迭代器直接忽略"""
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+def _request_key(
+    messages: List[Message],
+    tools: Optional[List[Dict[str, Any]]],
+    config: Optional[QwenConfig],
+) -> str:
+    """计算请求的去重键（消息、工具与配置的哈希）"""
+    payload = json.dumps(
+        [
+            [msg.to_dict() for msg in messages],
+            tools,
+            asdict(config) if config is not None else None,
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.blake2b(payload.encode()).hexdigest()
 
 
 class ResilientQwenClient(IQwenClient):
     """
     带弹性机制的 Qwen 客户端包装器
     
-    自动处理重试和模型降级。
+    自动处理重试和模型降级；启用降级时按模型熔断，跳过近期持续失败的模型。
     """
     
     def __init__(
@@ -218,6 +730,8 @@ class ResilientQwenClient(IQwenClient):
         client: IQwenClient,
         retry_config: Optional[RetryConfig] = None,
         enable_fallback: bool = True,
+        retry_budget: Optional[RetryBudget] = None,
+        enable_coalesce: bool = False,
     ):
         """
         初始化弹性客户端
@@ -226,10 +740,21 @@ class ResilientQwenClient(IQwenClient):
             client: 底层 Qwen 客户端
             retry_config: 重试配置
             enable_fallback: 是否启用模型降级
+            retry_budget: 所有请求共享的重试预算，默认容量 10、每秒恢复 1 个令牌
+            enable_coalesce: 是否合并并发的相同请求（共享同一次上游调用及其返回的
+                响应对象）；仅适用于结果可复用的请求，默认关闭
         """
         self._client = client
         self._retry_config = retry_config or RetryConfig()
         self._enable_fallback = enable_fallback
+        self._retry_budget = retry_budget or RetryBudget(capacity=10, refill_per_sec=1.0)
+        # 按模型的熔断器：连续失败的模型在冷却期内直接跳过
+        self._breakers: Dict[QwenModel, _Breaker] = {}
+        self._enable_coalesce = enable_coalesce
+        # 进行中的请求：去重键 -> 共享任务
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # 共享任务 -> 仍在等待的调用方数量（全部取消时取消上游调用）
+        self._inflight_waiters: Dict[asyncio.Task, int] = {}
     
     async def chat(
         self,
@@ -238,6 +763,44 @@ class ResilientQwenClient(IQwenClient):
         config: Optional[QwenConfig] = None
     ) -> QwenResponse:
         """发送聊天请求（带重试和降级）"""
+        if not self._enable_coalesce:
+            return await self._chat(messages, tools, config)
+        
+        key = _request_key(messages, tools, config)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._chat(messages, tools, config))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._forget_inflight, key))
+        waiters = self._inflight_waiters
+        waiters[task] = waiters.get(task, 0) + 1
+        try:
+            # shield：单个调用方被取消时不影响共享同一请求的其他调用方
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # 最后一个调用方也已取消，上游调用的结果不再有人需要
+            if waiters[task] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            remaining = waiters[task] - 1
+            if remaining:
+                waiters[task] = remaining
+            else:
+                del waiters[task]
+    
+    def _forget_inflight(self, key: str, task: asyncio.Task) -> None:
+        """共享任务结束后移除登记（键已被新任务占用时保留）"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    async def _chat(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]],
+        config: Optional[QwenConfig],
+    ) -> QwenResponse:
+        """执行一次带重试和降级的请求"""
         if self._enable_fallback:
             return await execute_with_fallback(
                 self._client,
@@ -245,6 +808,8 @@ class ResilientQwenClient(IQwenClient):
                 tools=tools,
                 config=config,
                 retry_config=self._retry_config,
+                retry_budget=self._retry_budget,
+                breakers=self._breakers,
             )
         else:
             return await execute_with_retry(
@@ -253,6 +818,7 @@ class ResilientQwenClient(IQwenClient):
                 tools=tools,
                 config=config,
                 retry_config=self._retry_config,
+                retry_budget=self._retry_budget,
             )
     
     async def chat_stream(
@@ -261,9 +827,51 @@ class ResilientQwenClient(IQwenClient):
         tools: Optional[List[Dict[str, Any]]] = None,
         config: Optional[QwenConfig] = None
     ):
-        """流式聊天请求（直接转发，不支持重试）"""
-        async for chunk in self._client.chat_stream(messages, tools=tools, config=config):
-            yield chunk
+        """
+        流式聊天请求
+        
+        仅在建立流阶段（收到首个片段之前）重试可重试错误；收到首个片段后直接转发，
+        避免重复输出已发送的内容。
+        """
+        retry_cfg = self._retry_config
+        if retry_cfg.jitter_strategy == "decorrelated":
+            retry_cfg = retry_cfg.fresh()
+        
+        attempt = 0
+        while True:
+            stream = self._client.chat_stream(messages, tools=tools, config=config)
+            try:
+                if retry_cfg.per_attempt_timeout is None:
+                    first_chunk = await stream.__anext__()
+                else:
+                    first_chunk = await asyncio.wait_for(
+                        stream.__anext__(), retry_cfg.per_attempt_timeout
+                    )
+                break
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await _aclose_stream(stream)
+                attempt += 1
+                if (
+                    attempt >= retry_cfg.max_attempts
+                    or (config is not None and not config.idempotent)
+                    or not is_retryable_error(e)
+                    or not self._retry_budget.try_consume()
+                ):
+                    raise
+                await _RETRY_WHEEL.sleep(_retry_delay(retry_cfg, attempt - 1, e))
+        
+        try:
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await _aclose_stream(stream)
+    
+    async def aclose(self) -> None:
+        """关闭底层客户端"""
+        await self._client.aclose()
     
     async def health_check(self) -> bool:
         """检查服务健康状态"""
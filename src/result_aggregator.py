@@ -1,8 +1,10 @@
 """Result Aggregator implementation."""
 
+import re
 import time
-from collections import Counter
-from typing import List, Dict, Any, Optional, Set
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import List, Dict, Any, FrozenSet, Optional, Set, Tuple
 
 from .interfaces.result_aggregator import (
     IResultAggregator,
@@ -16,6 +18,18 @@ from .models.agent import SubAgent
 from .models.enums import AgentStatus, OutputType
 
 
+# 代码输出中的文件路径标记："# file: path/to/file.py" 或 "// file: path/to/file.py"
+_FILE_PATH_RE = re.compile(r'(?:^|\n)\s*(?:#|//)\s*file:\s*(\S+)\s*\n')
+
+
+# 可收集结果的智能体终态
+_TERMINAL_STATUSES: FrozenSet[AgentStatus] = frozenset({
+    AgentStatus.COMPLETED,
+    AgentStatus.FAILED,
+    AgentStatus.TERMINATED,
+})
+
+
 class ResultAggregatorError(Exception):
     """结果聚合器错误"""
     pass
@@ -32,6 +46,8 @@ class ResultAggregatorImpl(IResultAggregator):
     def __init__(self):
         """初始化结果聚合器"""
         self._validation_errors: List[Dict[str, Any]] = []
+        # validation_errors 属性返回的只读视图，重新验证时失效
+        self._validation_errors_view: Optional[Tuple[Dict[str, Any], ...]] = None
     
     async def collect_results(self, agents: List[SubAgent]) -> List[SubTaskResult]:
         """
@@ -50,16 +66,13 @@ class ResultAggregatorImpl(IResultAggregator):
         
         for agent in agents:
             # 只收集终态智能体的结果
-            if agent.status in (
-                AgentStatus.COMPLETED, 
-                AgentStatus.FAILED, 
-                AgentStatus.TERMINATED
-            ):
-                # 从 SubAgentImpl 获取结果（如果有 last_result 属性）
-                if hasattr(agent, 'last_result') and agent.last_result is not None:
-                    results.append(agent.last_result)
-                elif hasattr(agent, '_last_result') and agent._last_result is not None:
-                    results.append(agent._last_result)
+            if agent.status in _TERMINAL_STATUSES:
+                # 从 SubAgentImpl 获取结果（优先 last_result 属性）
+                last_result = getattr(agent, 'last_result', None)
+                if last_result is None:
+                    last_result = getattr(agent, '_last_result', None)
+                if last_result is not None:
+                    results.append(last_result)
                 else:
                     # 如果没有结果，创建一个失败结果
                     result = SubTaskResult(
@@ -88,23 +101,28 @@ class ResultAggregatorImpl(IResultAggregator):
         Returns:
             验证后的结果列表
         """
-        self._validation_errors = []
-        validated_results: List[SubTaskResult] = []
+        self._collect_validation_errors(results)
+        # 即使有验证错误，也保留结果（错误记录在 get_validation_errors() 中）
+        return list(results)
+    
+    def _collect_validation_errors(self, results: List[SubTaskResult]) -> None:
+        """
+        验证所有结果并记录验证错误（不复制结果列表）
         
+        Args:
+            results: 待验证的结果列表
+        """
+        validation_errors: List[Dict[str, Any]] = []
         for result in results:
             errors = self._validate_single_result(result)
-            
             if errors:
-                self._validation_errors.append({
+                validation_errors.append({
                     "subtask_id": result.subtask_id,
                     "agent_id": result.agent_id,
                     "errors": errors,
                 })
-            
-            # 即使有验证错误，也保留结果（标记为验证失败）
-            validated_results.append(result)
-        
-        return validated_results
+        self._validation_errors = validation_errors
+        self._validation_errors_view = None
     
     def _validate_single_result(self, result: SubTaskResult) -> List[str]:
         """
@@ -147,6 +165,14 @@ class ResultAggregatorImpl(IResultAggregator):
     def get_validation_errors(self) -> List[Dict[str, Any]]:
         """获取验证错误列表"""
         return list(self._validation_errors)
+    
+    @property
+    def validation_errors(self) -> Tuple[Dict[str, Any], ...]:
+        """验证错误的只读视图（同一轮验证内重复访问不会复制）"""
+        view = self._validation_errors_view
+        if view is None:
+            view = self._validation_errors_view = tuple(self._validation_errors)
+        return view
 
 
     async def detect_conflicts(self, results: List[SubTaskResult]) -> List[ResultConflict]:
@@ -164,6 +190,10 @@ class ResultAggregatorImpl(IResultAggregator):
         Returns:
             检测到的冲突列表
         """
+        # 快速路径：每个子任务至多一个结果且数值输出不足两个时不可能存在冲突
+        if not self._may_have_conflicts(results):
+            return []
+        
         conflicts: List[ResultConflict] = []
         
         # 检测重复子任务结果
@@ -176,6 +206,23 @@ class ResultAggregatorImpl(IResultAggregator):
         
         return conflicts
     
+    def _may_have_conflicts(self, results: List[SubTaskResult]) -> bool:
+        """
+        快速判断结果中是否可能存在冲突
+        
+        存在重复的子任务ID，或至少有两个成功的数值输出时返回 True。
+        """
+        seen: Set[str] = set()
+        numeric_count = 0
+        for result in results:
+            subtask_id = result.subtask_id
+            if subtask_id in seen:
+                return True
+            seen.add(subtask_id)
+            if result.success and isinstance(result.output, (int, float)):
+                numeric_count += 1
+        return numeric_count >= 2
+    
     def _detect_duplicate_results(
         self, results: List[SubTaskResult]
     ) -> List[ResultConflict]:
@@ -191,18 +238,16 @@ class ResultAggregatorImpl(IResultAggregator):
         conflicts: List[ResultConflict] = []
         
         # 按子任务ID分组
-        subtask_results: Dict[str, List[SubTaskResult]] = {}
+        subtask_results: Dict[str, List[SubTaskResult]] = defaultdict(list)
         for result in results:
-            if result.subtask_id not in subtask_results:
-                subtask_results[result.subtask_id] = []
             subtask_results[result.subtask_id].append(result)
         
         # 检测重复
         for subtask_id, result_list in subtask_results.items():
             if len(result_list) > 1:
-                # 检查结果是否一致
-                success_values = [r.success for r in result_list]
-                if len(set(success_values)) > 1:
+                # 检查结果是否一致（发现不一致即停止）
+                first_success = result_list[0].success
+                if any(r.success != first_success for r in result_list[1:]):
                     # 成功/失败状态不一致
                     conflict = ResultConflict(
                         subtask_ids=[subtask_id],
@@ -246,21 +291,24 @@ class ResultAggregatorImpl(IResultAggregator):
         successful_results = [r for r in results if r.success and r.output is not None]
         
         # 检测数值类型输出的冲突
-        numeric_outputs: Dict[str, List[tuple]] = {}
+        numeric_outputs: Dict[str, List[tuple]] = defaultdict(list)
         for result in successful_results:
             if isinstance(result.output, (int, float)):
                 # 按输出类型分组
-                key = "numeric"
-                if key not in numeric_outputs:
-                    numeric_outputs[key] = []
-                numeric_outputs[key].append((result.subtask_id, result.output))
+                numeric_outputs["numeric"].append((result.subtask_id, result.output))
         
         # 检测数值输出的显著差异
         for key, outputs in numeric_outputs.items():
             if len(outputs) > 1:
-                values = [v for _, v in outputs]
-                if max(values) > 0 and min(values) > 0:
-                    ratio = max(values) / min(values)
+                # 单次遍历求最小/最大值
+                vmin = vmax = outputs[0][1]
+                for _, value in outputs:
+                    if value < vmin:
+                        vmin = value
+                    elif value > vmax:
+                        vmax = value
+                if vmin > 0:
+                    ratio = vmax / vmin
                     if ratio > 10:  # 差异超过10倍
                         conflict = ResultConflict(
                             subtask_ids=[sid for sid, _ in outputs],
@@ -360,25 +408,36 @@ class ResultAggregatorImpl(IResultAggregator):
         """
         start_time = time.time()
         
-        # 验证结果
-        validated_results = await self.validate_results(results)
+        # 验证结果（验证失败的结果同样参与聚合，错误单独记录）
+        self._collect_validation_errors(results)
         
         # 检测冲突
-        conflicts = await self.detect_conflicts(validated_results)
+        conflicts = await self.detect_conflicts(results)
         
         # 解决冲突并去重
         resolved_results = self._resolve_conflicts_and_deduplicate(
-            validated_results, conflicts, conflict_resolution
+            results, conflicts, conflict_resolution
         )
         
+        # 子任务ID到（去重后）结果、子任务的映射，供后续步骤共用
+        result_map: Dict[str, SubTaskResult] = {
+            r.subtask_id: r for r in resolved_results
+        }
+        subtask_map: Dict[str, SubTask] = {
+            st.id: st for st in decomposition.subtasks
+        }
+        
         # 识别缺失的子任务
-        missing_subtasks = self._identify_missing_subtasks(
-            resolved_results, decomposition
-        )
+        missing_subtasks = self._identify_missing_subtasks(result_map, subtask_map)
+        
+        # 成功数只统计一次，整合与成功判定共用
+        completed_count = sum(1 for r in resolved_results if r.success)
         
         # 按执行顺序整合结果
         integrated = self._integrate_results(
-            resolved_results, decomposition, missing_subtasks, output_type
+            resolved_results, decomposition, missing_subtasks, output_type,
+            result_map, subtask_map, include_layers=False,
+            completed_count=completed_count,
         )
         
         # 提取 combined_output 字符串作为 final_output
@@ -389,7 +448,8 @@ class ResultAggregatorImpl(IResultAggregator):
         
         # 计算整体成功状态
         success = self._calculate_overall_success(
-            resolved_results, missing_subtasks, decomposition
+            resolved_results, missing_subtasks, decomposition,
+            completed_count=completed_count,
         )
         
         aggregation_time = time.time() - start_time
@@ -421,73 +481,52 @@ class ResultAggregatorImpl(IResultAggregator):
         Returns:
             去重后的结果列表
         """
-        # 获取有冲突的子任务ID
-        conflicting_subtask_ids: Set[str] = set()
-        for conflict in conflicts:
-            if conflict.conflict_type in ("duplicate", "duplicate_inconsistent"):
-                conflicting_subtask_ids.update(conflict.subtask_ids)
-        
-        # 按子任务ID分组
-        subtask_results: Dict[str, List[SubTaskResult]] = {}
+        # 单遍构建：多数子任务只有一个结果，仅在出现重复时才分桶
+        seen: Dict[str, SubTaskResult] = {}
+        duplicates: Dict[str, List[SubTaskResult]] = {}
         for result in results:
-            if result.subtask_id not in subtask_results:
-                subtask_results[result.subtask_id] = []
-            subtask_results[result.subtask_id].append(result)
-        
-        # 去重
-        resolved_results: List[SubTaskResult] = []
-        for subtask_id, result_list in subtask_results.items():
-            if len(result_list) == 1:
-                resolved_results.append(result_list[0])
+            subtask_id = result.subtask_id
+            first = seen.get(subtask_id)
+            if first is None:
+                seen[subtask_id] = result
             else:
-                # 有重复，需要解决
-                # 找到对应的冲突
-                related_conflict = None
-                for conflict in conflicts:
-                    if subtask_id in conflict.subtask_ids:
-                        related_conflict = conflict
-                        break
-                
-                if related_conflict:
-                    resolved = self.resolve_conflict(
-                        related_conflict, result_list, strategy
-                    )
-                    if resolved:
-                        resolved_results.append(resolved)
-                    else:
-                        # 无法解决，保留第一个
-                        resolved_results.append(result_list[0])
-                else:
-                    # 没有冲突记录，保留第一个
-                    resolved_results.append(result_list[0])
+                duplicates.setdefault(subtask_id, [first]).append(result)
+        
+        if not duplicates:
+            return list(seen.values())
         
-        return resolved_results
+        # 子任务ID到相关冲突的索引（同一子任务有多个冲突时取第一个）
+        conflict_by_subtask: Dict[str, ResultConflict] = {}
+        for conflict in conflicts:
+            for subtask_id in conflict.subtask_ids:
+                conflict_by_subtask.setdefault(subtask_id, conflict)
+        
+        # 仅对重复的子任务解决冲突；无法解决或没有冲突记录时保留第一个
+        for subtask_id, result_list in duplicates.items():
+            related_conflict = conflict_by_subtask.get(subtask_id)
+            if related_conflict:
+                resolved = self.resolve_conflict(related_conflict, result_list, strategy)
+                if resolved:
+                    seen[subtask_id] = resolved
+        
+        return list(seen.values())
     
     def _identify_missing_subtasks(
         self,
-        results: List[SubTaskResult],
-        decomposition: TaskDecomposition,
+        result_map: Dict[str, SubTaskResult],
+        subtask_map: Dict[str, SubTask],
     ) -> List[str]:
         """
         识别缺失的子任务
         
         Args:
-            results: 结果列表
-            decomposition: 任务分解
+            result_map: 子任务ID到结果的映射
+            subtask_map: 子任务ID到子任务的映射（预期的全部子任务）
             
         Returns:
             缺失的子任务ID列表
         """
-        # 获取所有预期的子任务ID
-        expected_subtask_ids = {st.id for st in decomposition.subtasks}
-        
-        # 获取已有结果的子任务ID
-        result_subtask_ids = {r.subtask_id for r in results}
-        
-        # 计算缺失的子任务
-        missing = expected_subtask_ids - result_subtask_ids
-        
-        return list(missing)
+        return list(subtask_map.keys() - result_map.keys())
     
     def _integrate_results(
         self,
@@ -495,6 +534,10 @@ class ResultAggregatorImpl(IResultAggregator):
         decomposition: TaskDecomposition,
         missing_subtasks: List[str],
         output_type: OutputType = OutputType.REPORT,
+        result_map: Optional[Dict[str, SubTaskResult]] = None,
+        subtask_map: Optional[Dict[str, SubTask]] = None,
+        include_layers: bool = True,
+        completed_count: Optional[int] = None,
     ) -> Dict[str, Any]:
         """
         整合结果为最终输出 - 根据 output_type 采用不同整合策略
@@ -508,31 +551,23 @@ class ResultAggregatorImpl(IResultAggregator):
             decomposition: 任务分解
             missing_subtasks: 缺失的子任务ID列表
             output_type: 目标输出类型
+            result_map: 子任务ID到结果的映射（未提供时由 results 构建）
+            subtask_map: 子任务ID到子任务的映射（未提供时由 decomposition 构建）
+            include_layers: 是否构建按执行层组织的详细结果（execution_layers），
+                调用方不需要时可跳过，此时该字段为空列表
+            completed_count: 已统计的成功结果数（未提供时由 results 统计）
 
         Returns:
             整合后的输出
         """
-        # 创建子任务ID到结果的映射
-        result_map: Dict[str, SubTaskResult] = {
-            r.subtask_id: r for r in results
-        }
-
-        # 创建子任务ID到子任务的映射
-        subtask_map: Dict[str, SubTask] = {
-            st.id: st for st in decomposition.subtasks
-        }
+        if result_map is None:
+            result_map = {r.subtask_id: r for r in results}
+        if subtask_map is None:
+            subtask_map = {st.id: st for st in decomposition.subtasks}
 
         # 收集所有成功的输出内容
-        successful_outputs = []
-        for result in results:
-            if result.success and result.output is not None:
-                subtask = subtask_map.get(result.subtask_id)
-                successful_outputs.append({
-                    "subtask_id": result.subtask_id,
-                    "subtask_content": subtask.content if subtask else "Unknown",
-                    "role": subtask.role_hint if subtask else "unknown",
-                    "output": result.output,
-                })
+        # 同一列表供各整合策略使用，并直接作为 outputs 字段返回
+        successful_outputs = self._collect_successful_outputs(results, subtask_map)
 
         # 根据 output_type 选择整合策略
         if output_type == OutputType.CODE:
@@ -545,7 +580,9 @@ class ResultAggregatorImpl(IResultAggregator):
 
         # 按执行层组织详细结果
         execution_layers = []
-        for layer_idx, layer in enumerate(decomposition.execution_order):
+        layers = decomposition.execution_order if include_layers else ()
+        missing_set = set(missing_subtasks) if layers else frozenset()
+        for layer_idx, layer in enumerate(layers):
             layer_results: List[Dict[str, Any]] = []
 
             for subtask_id in layer:
@@ -562,7 +599,7 @@ class ResultAggregatorImpl(IResultAggregator):
                         "error": result.error,
                         "execution_time": result.execution_time,
                     })
-                elif subtask_id in missing_subtasks:
+                elif subtask_id in missing_set:
                     layer_results.append({
                         "subtask_id": subtask_id,
                         "subtask_content": subtask.content if subtask else "Unknown",
@@ -578,22 +615,54 @@ class ResultAggregatorImpl(IResultAggregator):
                 "results": layer_results,
             })
 
+        # 单次遍历统计成功数，失败数由总数相减得到
+        if completed_count is None:
+            completed_count = sum(1 for r in results if r.success)
+
         # 构建最终输出
         integrated_output: Dict[str, Any] = {
             "task_id": decomposition.original_task_id,
             "combined_output": combined_output,
             "summary": {
                 "total_subtasks": len(decomposition.subtasks),
-                "completed_subtasks": len([r for r in results if r.success]),
-                "failed_subtasks": len([r for r in results if not r.success]),
+                "completed_subtasks": completed_count,
+                "failed_subtasks": len(results) - completed_count,
                 "missing_subtasks": len(missing_subtasks),
-                "success_rate": len([r for r in results if r.success]) / max(len(results), 1) * 100,
+                "success_rate": completed_count / max(len(results), 1) * 100,
             },
             "execution_layers": execution_layers,
             "outputs": successful_outputs,
         }
 
         return integrated_output
+
+    def _collect_successful_outputs(
+        self,
+        results: List[SubTaskResult],
+        subtask_map: Dict[str, SubTask],
+    ) -> List[Dict[str, Any]]:
+        """
+        收集所有成功且有输出的结果，附带子任务内容与角色
+
+        Args:
+            results: 结果列表
+            subtask_map: 子任务ID到子任务的映射
+
+        Returns:
+            成功的输出列表
+        """
+        successful_outputs: List[Dict[str, Any]] = []
+        for result in results:
+            if result.success and result.output is not None:
+                subtask = subtask_map.get(result.subtask_id)
+                successful_outputs.append({
+                    "subtask_id": result.subtask_id,
+                    "subtask_content": subtask.content if subtask else "Unknown",
+                    "role": subtask.role_hint if subtask else "unknown",
+                    "output": result.output,
+                })
+        return successful_outputs
+
     def _integrate_code_results(
         self, successful_outputs: List[Dict[str, Any]]
     ) -> Dict[str, str]:
@@ -610,7 +679,7 @@ class ResultAggregatorImpl(IResultAggregator):
         Returns:
             文件路径到合并代码内容的映射字典
         """
-        file_groups: Dict[str, List[str]] = {}
+        file_groups: Dict[str, List[str]] = defaultdict(list)
 
         for output_item in successful_outputs:
             raw_output = output_item.get("output")
@@ -618,24 +687,29 @@ class ResultAggregatorImpl(IResultAggregator):
             if isinstance(raw_output, dict):
                 # 输出是字典，查找 file_path 和 content 键
                 file_path = raw_output.get("file_path", "")
-                content = str(raw_output.get("content", raw_output.get("output", "")))
+                content = (
+                    raw_output["content"] if "content" in raw_output
+                    else raw_output.get("output", "")
+                )
+                if not isinstance(content, str):
+                    content = str(content)
 
                 if file_path:
-                    file_groups.setdefault(file_path, []).append(content)
+                    file_groups[file_path].append(content)
                 else:
                     # 没有 file_path，归入未分类
-                    file_groups.setdefault("_unclassified", []).append(content)
+                    file_groups["_unclassified"].append(content)
             elif isinstance(raw_output, str):
                 # 输出是字符串，尝试从内容中提取文件路径标记
                 # 支持格式: "# file: path/to/file.py" 或 "// file: path/to/file.py"
                 extracted = self._extract_file_paths_from_content(raw_output)
                 if extracted:
                     for fp, code in extracted.items():
-                        file_groups.setdefault(fp, []).append(code)
+                        file_groups[fp].append(code)
                 else:
-                    file_groups.setdefault("_unclassified", []).append(raw_output)
+                    file_groups["_unclassified"].append(raw_output)
             elif raw_output is not None:
-                file_groups.setdefault("_unclassified", []).append(str(raw_output))
+                file_groups["_unclassified"].append(str(raw_output))
 
         # 合并同一文件路径的代码片段
         merged: Dict[str, str] = {}
@@ -658,27 +732,27 @@ class ResultAggregatorImpl(IResultAggregator):
         Returns:
             文件路径到代码内容的映射，如果未找到标记则返回空字典
         """
-        import re
-
-        # 匹配 "# file: xxx" 或 "// file: xxx" 格式的文件路径标记
-        pattern = r'(?:^|\n)\s*(?:#|//)\s*file:\s*(\S+)\s*\n'
-        matches = list(re.finditer(pattern, content))
+        # 单次遍历：每个标记的代码段在遇到下一个标记（或文本末尾）时确定
+        groups: Dict[str, List[str]] = defaultdict(list)
+        file_path: Optional[str] = None
+        start = 0
+        for match in _FILE_PATH_RE.finditer(content):
+            if file_path is not None:
+                code = content[start:match.start()].strip()
+                if code:
+                    groups[file_path].append(code)
+            file_path = match.group(1)
+            start = match.end()
 
-        if not matches:
+        if file_path is None:
             return {}
 
-        result: Dict[str, str] = {}
-        for i, match in enumerate(matches):
-            file_path = match.group(1)
-            start = match.end()
-            end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
-            code = content[start:end].strip()
-            if code:
-                result.setdefault(file_path, [])
-                result[file_path].append(code)
+        code = content[start:].strip()
+        if code:
+            groups[file_path].append(code)
 
-        # Join multiple snippets for the same file
-        return {fp: "\n".join(snippets) for fp, snippets in result.items()}
+        # 同一文件的多个片段合并
+        return {fp: "\n".join(snippets) for fp, snippets in groups.items()}
 
     def _integrate_composite_results(
         self, successful_outputs: List[Dict[str, Any]]
@@ -695,7 +769,7 @@ class ResultAggregatorImpl(IResultAggregator):
         Returns:
             输出类型到结果列表的映射字典
         """
-        type_groups: Dict[str, List[Dict[str, Any]]] = {}
+        type_groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
 
         for output_item in successful_outputs:
             raw_output = output_item.get("output")
@@ -706,9 +780,10 @@ class ResultAggregatorImpl(IResultAggregator):
             else:
                 out_type = "report"
 
-            type_groups.setdefault(out_type, []).append(output_item)
+            type_groups[out_type].append(output_item)
 
-        return type_groups
+        # 返回普通字典，避免调用方访问不存在的键时意外插入
+        return dict(type_groups)
     
     def _generate_combined_output(self, successful_outputs: List[Dict[str, Any]]) -> str:
         """
@@ -728,7 +803,12 @@ class ResultAggregatorImpl(IResultAggregator):
         """
         if not successful_outputs:
             return "任务执行未产生有效输出。"
-        
+
+        # 快速路径：只有一个输出时无需分层，直接返回其内容
+        if len(successful_outputs) == 1:
+            content = str(successful_outputs[0].get("output", "")).strip()
+            return content or "任务执行完成，但未生成文本输出。"
+
         # 分层收集输出
         writer_outputs = []
         analyst_outputs = []
@@ -757,15 +837,17 @@ class ResultAggregatorImpl(IResultAggregator):
         # 策略：writer > analyst > data，优先使用高层输出
         if writer_outputs:
             # 取最长的 writer 输出作为主报告（通常是最后的综合报告）
-            main_report = max(writer_outputs, key=lambda x: x["length"])
+            if len(writer_outputs) == 1:
+                main_report = writer_outputs[0]
+            else:
+                main_report = max(writer_outputs, key=itemgetter("length"))
             result = main_report["content"]
             
             # 如果主报告不够长，用 analyst 输出补充
-            if len(result) < 3000 and analyst_outputs:
-                supplements = []
-                for item in analyst_outputs:
-                    supplements.append(item["content"])
-                result = result + "\n\n---\n\n" + "\n\n".join(supplements)
+            if main_report["length"] < 3000 and analyst_outputs:
+                result = result + "\n\n---\n\n" + "\n\n".join(
+                    item["content"] for item in analyst_outputs
+                )
             
             return result
         
@@ -791,6 +873,7 @@ class ResultAggregatorImpl(IResultAggregator):
         results: List[SubTaskResult],
         missing_subtasks: List[str],
         decomposition: TaskDecomposition,
+        completed_count: Optional[int] = None,
     ) -> bool:
         """
         计算整体成功状态
@@ -801,6 +884,7 @@ class ResultAggregatorImpl(IResultAggregator):
             results: 结果列表
             missing_subtasks: 缺失的子任务ID列表
             decomposition: 任务分解
+            completed_count: 已统计的成功结果数（提供时无需再遍历 results）
             
         Returns:
             整体是否成功
@@ -814,4 +898,6 @@ class ResultAggregatorImpl(IResultAggregator):
             return False
         
         # 检查所有结果是否成功
+        if completed_count is not None:
+            return completed_count == len(results)
         return all(r.success for r in results)
@@ -1,10 +1,21 @@
 """Sub Agent implementation."""
 
 import asyncio
+import datetime
+import hashlib
 import json
+import logging
+import re
 import time
 import uuid
-from typing import Dict, Any, List, Optional, Callable, Awaitable
+from collections import OrderedDict, deque
+from types import MappingProxyType
+from typing import Deque, Dict, Any, FrozenSet, List, Mapping, Optional, Tuple, Callable, Awaitable
+
+try:
+    import orjson  # 可选依赖：更快的工具结果序列化
+except ImportError:
+    orjson = None
 
 from .interfaces.sub_agent import ISubAgent
 from .interfaces.tool_registry import IToolRegistry
@@ -18,6 +29,10 @@ from .models.agent import AgentRole
 from .models.context import ExecutionContext
 from .qwen.interface import IQwenClient
 from .qwen.models import Message, QwenConfig, QwenResponse
+from .qwen.retry import RetryConfig
+
+
+logger = logging.getLogger(__name__)
 
 
 class SubAgentError(Exception):
@@ -37,6 +52,90 @@ SANDBOX_CODE_INTERPRETER_TOOL = "sandbox_code_interpreter"
 # 非 Qwen 原生模型使用沙箱浏览器替代 DashScope 内置 web_search / web_extractor
 SANDBOX_BROWSER_TOOL = "sandbox_browser"
 
+# 由沙箱浏览器替代的联网工具
+_WEB_TOOLS = frozenset({"web_search", "web_extractor"})
+
+# datetime.weekday() 到中文星期的映射
+_WEEKDAYS = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+# 无副作用、结果只取决于参数的工具，同一智能体内相同调用可直接复用结果
+CACHEABLE_TOOLS = frozenset({SANDBOX_BROWSER_TOOL, "code_review", "data_analysis"})
+
+# DeepSeek 原生工具调用标记头：function<｜tool▁sep｜>tool_name，其后可选 ```json 围栏。
+# 标记内部不跨越 ">"，配合 str.find 定位起点，避免 [\s\S]*? 在长文本上回溯
+_DS_TOOL_HEADER_RE = re.compile(
+    r'function\s*[<＜][^>＞]*?tool[\s\u2581_]sep[^>＞]*[>＞]\s*'
+    r'(\w+)\s*'
+    r'(?:```(?:json)?\s*)?'
+)
+
+
+def _dumps_compact(obj: Any) -> str:
+    """
+    将工具结果/参数序列化为紧凑 JSON 文本（保留非 ASCII 字符）
+    
+    安装 orjson 时使用其 C 实现，遇到其不支持的类型时回退到标准库。
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _skip_whitespace(content: str, pos: int) -> int:
+    """返回 pos 起第一个非空白字符的位置"""
+    while pos < len(content) and content[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _decode_json_at(content: str, start: int, opening: str) -> Tuple[Any, int]:
+    """
+    从 content[start] 开始解码一个 JSON 值（要求以 opening 字符开头）
+    
+    Returns:
+        (解码结果, 结束位置)；不是以 opening 开头或不是合法 JSON 时返回 (None, -1)
+    """
+    if not content.startswith(opening, start):
+        return None, -1
+    try:
+        return _JSON_DECODER.raw_decode(content, start)
+    except json.JSONDecodeError:
+        return None, -1
+
+
+# 格式 3 工具调用标签
+_TOOL_CALL_OPEN = "<tool_call>"
+_TOOL_CALL_CLOSE = "</tool_call>"
+
+
+def _tool_call_from_item(item: Any) -> Optional[Dict[str, Any]]:
+    """
+    将 {"name": ..., "arguments": ...} 形式的条目转换为 API 格式的 tool_call
+    
+    Returns:
+        tool_call 字典；条目不是字典或缺少 name 时返回 None
+    """
+    if not isinstance(item, dict):
+        return None
+    name = item.get("name", "")
+    if not name:
+        return None
+    args = item.get("arguments", {})
+    return {
+        "id": f"call_{uuid.uuid4().hex[:8]}",
+        "type": "function",
+        "function": {
+            "name": name,
+            "arguments": _dumps_compact(args) if isinstance(args, dict) else str(args),
+        },
+    }
+
 
 class SubAgentExecutionError(SubAgentError):
     """子智能体执行错误"""
@@ -49,14 +148,143 @@ class InvalidStateTransitionError(SubAgentError):
 
 
 # 定义有效的状态转换
-VALID_STATE_TRANSITIONS: Dict[AgentStatus, List[AgentStatus]] = {
-    AgentStatus.IDLE: [AgentStatus.RUNNING, AgentStatus.TERMINATED],
-    AgentStatus.RUNNING: [AgentStatus.COMPLETED, AgentStatus.FAILED, AgentStatus.TERMINATED],
-    AgentStatus.COMPLETED: [],  # 终态，不能转换
-    AgentStatus.FAILED: [],  # 终态，不能转换
-    AgentStatus.TERMINATED: [],  # 终态，不能转换
+VALID_STATE_TRANSITIONS: Dict[AgentStatus, FrozenSet[AgentStatus]] = {
+    AgentStatus.IDLE: frozenset({AgentStatus.RUNNING, AgentStatus.TERMINATED}),
+    AgentStatus.RUNNING: frozenset({AgentStatus.COMPLETED, AgentStatus.FAILED, AgentStatus.TERMINATED}),
+    AgentStatus.COMPLETED: frozenset(),  # 终态，不能转换
+    AgentStatus.FAILED: frozenset(),  # 终态，不能转换
+    AgentStatus.TERMINATED: frozenset(),  # 终态，不能转换
 }
 
+# 未登记状态的可转换集合
+_NO_TRANSITIONS: FrozenSet[AgentStatus] = frozenset()
+
+
+class _HistoryBuffer:
+    """
+    执行历史的列式存储
+    
+    事件类型、时间戳和附加字段分别存放在等长的有界 deque 中，
+    不为每条事件创建对象；对外通过 to_records() 按需还原为字典。
+    """
+    
+    __slots__ = ("_types", "_timestamps", "_payloads")
+    
+    def __init__(self, maxlen: int):
+        self._types: Deque[str] = deque(maxlen=maxlen)
+        self._timestamps: Deque[float] = deque(maxlen=maxlen)
+        self._payloads: Deque[Optional[Dict[str, Any]]] = deque(maxlen=maxlen)
+    
+    def __len__(self) -> int:
+        return len(self._types)
+    
+    def append(self, event_type: str, timestamp: float, payload: Optional[Dict[str, Any]]) -> None:
+        """追加一条事件（超出上限时三列同步淘汰最早的记录）"""
+        self._types.append(event_type)
+        self._timestamps.append(timestamp)
+        self._payloads.append(payload)
+    
+    def to_records(self) -> List[Dict[str, Any]]:
+        """还原为执行历史字典列表：type、timestamp 及事件附加字段"""
+        records = []
+        for event_type, timestamp, payload in zip(self._types, self._timestamps, self._payloads):
+            event = {"type": event_type, "timestamp": timestamp}
+            if payload:
+                event.update(payload)
+            records.append(event)
+        return records
+
+
+class ResponseCache:
+    """
+    模型响应缓存（精确匹配，LRU 淘汰）
+    
+    键为 (模型参数, 工具 schema, 完整消息列表) 的 SHA-256 摘要，可在多个子智能体间共享。
+    只缓存确定性请求（temperature 为 0、未启用联网搜索和代码解释器）
+    且不含工具调用的响应，避免重放带副作用的工具调用。
+    """
+    
+    DEFAULT_MAX_SIZE = 1024
+    
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self._max_size = max_size
+        self._entries: "OrderedDict[str, QwenResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @staticmethod
+    def is_cacheable(config: QwenConfig) -> bool:
+        """请求结果是否只取决于输入（可安全复用）"""
+        return (
+            config.temperature == 0
+            and not config.enable_search
+            and not config.enable_code_interpreter
+        )
+    
+    @staticmethod
+    def tools_digest(tools: Optional[List[Dict[str, Any]]]) -> str:
+        """计算 tools schema 的摘要（schema 不变时应复用，避免每轮重新序列化）"""
+        if not tools:
+            return ""
+        raw = json.dumps(tools, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def make_key(
+        messages: List[Message],
+        tools_digest: str,
+        config: QwenConfig,
+    ) -> str:
+        """
+        计算请求的缓存键
+        
+        Args:
+            messages: 完整消息列表
+            tools_digest: tools_digest() 计算的 tools schema 摘要
+            config: 请求配置
+        """
+        payload = {
+            "model": config.model.value,
+            "top_p": config.top_p,
+            "max_tokens": config.max_tokens,
+            "thinking": config.enable_thinking,
+            "tools": tools_digest,
+            "msgs": [m.to_dict() for m in messages],
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[QwenResponse]:
+        """
+        查找缓存的响应
+        
+        Returns:
+            命中时返回响应副本（usage 为空，不计入 token 统计），否则返回 None
+        """
+        response = self._entries.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return QwenResponse(
+            content=response.content,
+            tool_calls=None,
+            finish_reason=response.finish_reason,
+        )
+    
+    def put(self, key: str, response: QwenResponse) -> None:
+        """写入响应；含工具调用的响应不缓存"""
+        if response.tool_calls:
+            return
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
 
 # 状态变更回调类型
 StateChangeCallback = Callable[[str, AgentStatus, AgentStatus], Awaitable[None]]
@@ -68,6 +296,19 @@ class SubAgentImpl(ISubAgent):
     # 最大执行循环次数，防止无限循环
     MAX_ITERATIONS = 20
     
+    # 默认保留的执行历史条数，超出后丢弃最早的记录
+    DEFAULT_MAX_HISTORY = 512
+    
+    # 工具结果缓存的最大条目数（LRU 淘汰）
+    TOOL_CACHE_SIZE = 64
+    # 列表输入每次调用打包处理的条目数，以及同时进行的批次数
+    BATCH_SIZE = 8
+    MAX_CONCURRENT_BATCHES = 4
+    # 单轮模型调用的输出 token 上限，防止失控生成
+    PER_ITERATION_MAX_TOKENS = 8192
+    # 单轮模型调用（含客户端内部重试）的默认总时限（秒）
+    DEFAULT_PER_ITERATION_TIMEOUT = 300.0
+    
     def __init__(
         self,
         agent_id: str,
@@ -77,6 +318,11 @@ class SubAgentImpl(ISubAgent):
         config: Optional[QwenConfig] = None,
         on_state_change: Optional[StateChangeCallback] = None,
         message_bus: Optional[IMessageBus] = None,
+        max_history: int = DEFAULT_MAX_HISTORY,
+        stable_system_prompt: bool = True,
+        response_cache: Optional[ResponseCache] = None,
+        retry_config: Optional[RetryConfig] = None,
+        per_iteration_timeout: Optional[float] = DEFAULT_PER_ITERATION_TIMEOUT,
     ):
         """
         初始化子智能体
@@ -89,27 +335,86 @@ class SubAgentImpl(ISubAgent):
             config: 模型配置（可选，覆盖角色默认配置）
             on_state_change: 状态变更回调函数
             message_bus: 消息总线（可选，用于接收其他智能体的消息）
+            max_history: 执行历史最多保留的条数
+            stable_system_prompt: 是否在一次执行内复用同一份系统提示（时间精确到分钟），
+                使重试和多轮迭代的请求前缀保持一致，便于模型服务端的提示缓存命中
+            response_cache: 模型响应缓存（可选，可在多个子智能体间共享）
+            retry_config: 执行重试的退避配置（可选，默认 0.5 秒起指数退避并加抖动，上限 30 秒）
+            per_iteration_timeout: 单轮模型调用的总时限（秒），超时视为执行错误；None 表示不限制
         """
         self._id = agent_id
+        # 日志前缀只拼接一次
+        self._log_prefix = f"[SubAgent {agent_id[:8]}]"
         self._role = role
         self._qwen_client = qwen_client
         self._tool_registry = tool_registry
         self._config = config
         self._message_bus = message_bus
+        self._stable_system_prompt = stable_system_prompt
+        self._response_cache = response_cache
+        self._tools_digest: Optional[str] = None
+        self._retry_config = retry_config or RetryConfig(initial_delay=0.5, max_delay=30.0)
+        self._per_iteration_timeout = per_iteration_timeout
         self._status = AgentStatus.IDLE
+        # 停止请求：标志位供循环内廉价检查，事件用于打断进行中的模型调用
         self._stop_requested = False
+        self._stop_event = asyncio.Event()
         self._tool_calls: List[ToolCallRecord] = []
-        self._token_usage: Dict[str, int] = {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "total_tokens": 0,
-        }
+        # token 使用统计（对外以字典形式提供）
+        self._prompt_tokens = 0
+        self._completion_tokens = 0
+        self._total_tokens = 0
+        # 对外只读视图的缓存：记录变化时递增版本号，读取时版本未变则直接复用
+        self._tool_calls_version = 0
+        self._tool_calls_view: Optional[Tuple[int, Tuple[ToolCallRecord, ...]]] = None
+        self._history_version = 0
+        self._history_view: Optional[Tuple[int, Tuple[Dict[str, Any], ...]]] = None
+        self._token_usage_view: Optional[Tuple[Tuple[int, int, int], Mapping[str, int]]] = None
         self._current_task: Optional[SubTask] = None
         self._on_state_change = on_state_change
         self._created_at = time.time()
         self._completed_at: Optional[float] = None
         self._last_result: Optional[SubTaskResult] = None
-        self._execution_history: List[Dict[str, Any]] = []
+        self._execution_history = _HistoryBuffer(max_history)
+        # 进入终态时置位，stop() 据此等待执行循环退出
+        self._done_event = asyncio.Event()
+        
+        # 内置工具与沙箱回退只取决于模型和角色，初始化后不再变化，计算一次
+        is_native = (config or QwenConfig()).model.is_qwen_native()
+        role_tools: FrozenSet[str] = frozenset(role.available_tools)
+        self._available_tools_set = role_tools
+        self._effective_builtins: FrozenSet[str] = (
+            frozenset(DASHSCOPE_BUILTIN_TOOLS) if is_native else frozenset()
+        )
+        self._sandbox_code_interpreter = (
+            not is_native and "code_interpreter" in role_tools
+        )
+        self._sandbox_browser = not is_native and not role_tools.isdisjoint(_WEB_TOOLS)
+        # call_tool 允许调用的工具：角色工具加上沙箱替代工具
+        callable_tools = set(role_tools)
+        if self._sandbox_code_interpreter:
+            callable_tools.add(SANDBOX_CODE_INTERPRETER_TOOL)
+        if self._sandbox_browser:
+            callable_tools.add(SANDBOX_BROWSER_TOOL)
+        self._callable_tools: FrozenSet[str] = frozenset(callable_tools)
+        # 系统提示中的工具说明段落（首次构建系统提示时生成并缓存）
+        self._tools_instruction: Optional[str] = None
+        # 工具描述行/schema 与请求配置同样只取决于角色和模型，首次使用时构建
+        self._tool_bundle: Optional[Tuple[List[str], List[Dict[str, Any]]]] = None
+        self._cached_request_config: Optional[QwenConfig] = None
+        
+        # 可缓存工具的结果：(tool_name, 规范化参数) -> 结果
+        self._tool_cache: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._tool_cache_hits = 0
+        # 最近一轮工具调用中返回错误的数量（由 _process_tool_calls 更新）
+        self._last_tool_error_count = 0
+        
+        # 推送式收件箱：后台任务等待新消息，执行循环只读取暂存的消息
+        self._mailbox_task: Optional[asyncio.Task] = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._pending_messages: List[Any] = []
+        # 收到 SHUTDOWN 消息时置位，用于打断进行中的模型调用
+        self._shutdown_event = asyncio.Event()
     
     @property
     def id(self) -> str:
@@ -142,19 +447,47 @@ class SubAgentImpl(ISubAgent):
         return self._last_result
     
     @property
-    def tool_calls(self) -> List[ToolCallRecord]:
-        """获取工具调用记录"""
-        return list(self._tool_calls)
+    def tool_calls(self) -> Tuple[ToolCallRecord, ...]:
+        """获取工具调用记录（只读快照，记录未变化时重复读取返回同一对象）"""
+        view = self._tool_calls_view
+        if view is None or view[0] != self._tool_calls_version:
+            view = (self._tool_calls_version, tuple(self._tool_calls))
+            self._tool_calls_view = view
+        return view[1]
     
     @property
-    def token_usage(self) -> Dict[str, int]:
-        """获取 token 使用统计"""
-        return dict(self._token_usage)
+    def token_usage(self) -> Mapping[str, int]:
+        """获取 token 使用统计（只读视图）"""
+        key = (self._prompt_tokens, self._completion_tokens, self._total_tokens)
+        view = self._token_usage_view
+        if view is None or view[0] != key:
+            view = (key, MappingProxyType(self._token_usage_dict()))
+            self._token_usage_view = view
+        return view[1]
+    
+    @property
+    def execution_history(self) -> Tuple[Dict[str, Any], ...]:
+        """获取执行历史（最近 max_history 条，只读快照，不应修改其中的字典）"""
+        view = self._history_view
+        if view is None or view[0] != self._history_version:
+            view = (
+                self._history_version,
+                tuple(self._execution_history.to_records()),
+            )
+            self._history_view = view
+        return view[1]
     
     @property
-    def execution_history(self) -> List[Dict[str, Any]]:
-        """获取执行历史"""
-        return list(self._execution_history)
+    def tools_schema(self) -> List[Dict[str, Any]]:
+        """获取工具 schema 列表（首次访问时构建并缓存）"""
+        return self._get_tool_bundle()[1]
+    
+    @property
+    def request_config(self) -> QwenConfig:
+        """获取按角色构建的请求配置（首次访问时构建并缓存）"""
+        if self._cached_request_config is None:
+            self._cached_request_config = self._build_request_config()
+        return self._cached_request_config
     
     def get_status(self) -> AgentStatus:
         """获取当前状态"""
@@ -170,8 +503,25 @@ class SubAgentImpl(ISubAgent):
     
     def can_transition_to(self, new_status: AgentStatus) -> bool:
         """检查是否可以转换到指定状态"""
-        valid_transitions = VALID_STATE_TRANSITIONS.get(self._status, [])
-        return new_status in valid_transitions
+        return new_status in VALID_STATE_TRANSITIONS.get(self._status, _NO_TRANSITIONS)
+    
+    def _record_history(
+        self, event_type: str, timestamp: Optional[float] = None, **payload: Any
+    ) -> None:
+        """
+        记录一条执行历史
+        
+        Args:
+            event_type: 事件类型
+            timestamp: 事件时间（默认当前时间）
+            **payload: 事件附加字段
+        """
+        self._execution_history.append(
+            event_type,
+            time.time() if timestamp is None else timestamp,
+            payload or None,
+        )
+        self._history_version += 1
     
     async def _set_status(self, new_status: AgentStatus) -> None:
         """
@@ -199,16 +549,16 @@ class SubAgentImpl(ISubAgent):
         self._status = new_status
         
         # 记录状态变更到执行历史
-        self._execution_history.append({
-            "type": "state_change",
-            "timestamp": time.time(),
-            "from_status": old_status.value,
-            "to_status": new_status.value,
-        })
-        
-        # 如果是终态，记录完成时间
+        self._record_history(
+            "state_change",
+            from_status=old_status.value,
+            to_status=new_status.value,
+        )
+        
+        # 如果是终态，记录完成时间并唤醒等待中的 stop()
         if self.is_terminal_state():
             self._completed_at = time.time()
+            self._done_event.set()
         
         # 调用状态变更回调
         if self._on_state_change:
@@ -226,31 +576,26 @@ class SubAgentImpl(ISubAgent):
         如果智能体不在运行状态，直接设置为终止状态。
         """
         self._stop_requested = True
+        self._stop_event.set()
         
         # 记录停止请求
-        self._execution_history.append({
-            "type": "stop_requested",
-            "timestamp": time.time(),
-        })
+        self._record_history("stop_requested")
         
-        # 如果当前正在运行，等待执行完成
+        # 如果当前正在运行，等待执行循环进入终态
         max_wait = 30  # 最多等待30秒
-        wait_interval = 0.1
-        waited = 0
         
-        while self._status == AgentStatus.RUNNING and waited < max_wait:
-            await asyncio.sleep(wait_interval)
-            waited += wait_interval
+        if self._status == AgentStatus.RUNNING:
+            try:
+                await asyncio.wait_for(self._done_event.wait(), timeout=max_wait)
+            except asyncio.TimeoutError:
+                pass
         
         # 如果还在运行状态（超时），强制设置为终止
         if self._status == AgentStatus.RUNNING:
             self._status = AgentStatus.TERMINATED
             self._completed_at = time.time()
-            self._execution_history.append({
-                "type": "force_terminated",
-                "timestamp": time.time(),
-                "reason": "stop timeout",
-            })
+            self._done_event.set()
+            self._record_history("force_terminated", reason="stop timeout")
         elif not self.is_terminal_state():
             # 如果不在终态，设置为终止
             await self._set_status(AgentStatus.TERMINATED)
@@ -266,17 +611,18 @@ class SubAgentImpl(ISubAgent):
         if self._status == AgentStatus.RUNNING:
             await self.stop()
         
+        # 取消可能残留的收件箱后台任务
+        await self._stop_mailbox()
+        
         # 清理工具调用记录（保留在执行历史中）
         self._tool_calls.clear()
+        self._tool_calls_version += 1
         
         # 清理当前任务引用
         self._current_task = None
         
         # 记录清理操作
-        self._execution_history.append({
-            "type": "cleanup",
-            "timestamp": time.time(),
-        })
+        self._record_history("cleanup")
     
     def get_execution_summary(self) -> Dict[str, Any]:
         """
@@ -292,9 +638,10 @@ class SubAgentImpl(ISubAgent):
             "created_at": self._created_at,
             "completed_at": self._completed_at,
             "total_tool_calls": len(self._tool_calls),
-            "token_usage": dict(self._token_usage),
+            "token_usage": self._token_usage_dict(),
             "last_result_success": self._last_result.success if self._last_result else None,
             "execution_history_count": len(self._execution_history),
+            "tool_cache_hits": self._tool_cache_hits,
         }
     
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
@@ -308,19 +655,12 @@ class SubAgentImpl(ISubAgent):
         Returns:
             工具执行结果
         """
-        # 沙箱代码解释器是 code_interpreter 的替代品，允许调用
-        effective_tools = set(self._role.available_tools)
-        if self._uses_sandbox_code_interpreter():
-            effective_tools.add(SANDBOX_CODE_INTERPRETER_TOOL)
-        # 沙箱浏览器是 web_search/web_extractor 的替代品，允许调用
-        if self._uses_sandbox_browser():
-            effective_tools.add(SANDBOX_BROWSER_TOOL)
-        
         # 检查工具是否在角色允许的工具列表中
-        if tool_name not in effective_tools:
+        # （沙箱代码解释器/沙箱浏览器作为内置工具的替代品同样允许调用）
+        if tool_name not in self._callable_tools:
             raise SubAgentError(
                 f"Tool '{tool_name}' is not available for role '{self._role.name}'. "
-                f"Available tools: {list(effective_tools)}"
+                f"Available tools: {list(self._callable_tools)}"
             )
         
         # 检查工具是否已注册
@@ -331,6 +671,33 @@ class SubAgentImpl(ISubAgent):
                 f"Please use your knowledge to answer instead."
             )
         
+        # 无副作用的工具：相同参数直接复用之前的成功结果
+        cache_key = None
+        if tool_name in CACHEABLE_TOOLS:
+            cache_key = (
+                tool_name,
+                json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str),
+            )
+            if cache_key in self._tool_cache:
+                self._tool_cache.move_to_end(cache_key)
+                result = self._tool_cache[cache_key]
+                self._tool_cache_hits += 1
+                now = time.time()
+                self._tool_calls.append(ToolCallRecord(
+                    id=str(uuid.uuid4()),
+                    tool_name=tool_name,
+                    arguments=arguments,
+                    result=result,
+                    success=True,
+                    error=None,
+                    start_time=now,
+                    end_time=now,
+                    agent_id=self._id,
+                    cached=True,
+                ))
+                self._tool_calls_version += 1
+                return result
+        
         # 调用工具
         record = await self._tool_registry.invoke_tool(
             tool_name=tool_name,
@@ -340,10 +707,18 @@ class SubAgentImpl(ISubAgent):
         
         # 记录工具调用
         self._tool_calls.append(record)
+        self._tool_calls_version += 1
         
         if not record.success:
             raise SubAgentError(f"Tool call failed: {record.error}")
         
+        # 浏览器等工具把失败包装在 {"success": False} 里返回，这类结果不缓存，下次照常重试
+        failed = isinstance(record.result, dict) and record.result.get("success") is False
+        if cache_key is not None and not failed:
+            self._tool_cache[cache_key] = record.result
+            if len(self._tool_cache) > self.TOOL_CACHE_SIZE:
+                self._tool_cache.popitem(last=False)
+        
         return record.result
     
     def _uses_sandbox_code_interpreter(self) -> bool:
@@ -353,10 +728,7 @@ class SubAgentImpl(ISubAgent):
         DashScope 内置的 code_interpreter 不可用，需要回退到阿里云
         AgentRun Sandbox 提供的 function-calling 工具。
         """
-        base = self._config or QwenConfig()
-        has_code_interpreter = "code_interpreter" in self._role.available_tools
-        is_native = base.model.is_qwen_native()
-        return has_code_interpreter and not is_native
+        return self._sandbox_code_interpreter
 
     def _uses_sandbox_browser(self) -> bool:
         """判断当前角色是否需要使用沙箱浏览器替代 DashScope 内置 web_search/web_extractor
@@ -365,82 +737,62 @@ class SubAgentImpl(ISubAgent):
         DashScope 内置的 enable_search 不可用，需要回退到阿里云
         AgentRun BrowserTool 提供的 function-calling 工具。
         """
-        base = self._config or QwenConfig()
-        has_web = "web_search" in self._role.available_tools or "web_extractor" in self._role.available_tools
-        is_native = base.model.is_qwen_native()
-        return has_web and not is_native
+        return self._sandbox_browser
 
-    def _get_effective_builtin_tools(self) -> set:
+    def _get_effective_builtin_tools(self) -> FrozenSet[str]:
         """获取当前模型实际可用的 DashScope 内置工具集合
         
-        非 Qwen 原生模型不支持任何 DashScope 内置工具。
+        非 Qwen 原生模型不支持任何 DashScope 内置工具（返回空集合）。
         """
-        base = self._config or QwenConfig()
-        if not base.model.is_qwen_native():
-            return set()  # 第三方模型无 DashScope 内置工具
-        return DASHSCOPE_BUILTIN_TOOLS
+        return self._effective_builtins
 
-    def _build_system_prompt(self, subtask: SubTask) -> str:
-        """构建系统提示 - 精简版，减少 token 消耗同时保留核心指令"""
-        import datetime
-        
-        now = datetime.datetime.now()
-        current_datetime = now.strftime("%Y年%m月%d日 %H:%M:%S")
-        current_year = now.year
-        current_month = now.month
-        current_weekday = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"][now.weekday()]
-        
-        # 精简时间声明
-        time_info = f"[系统时间] {current_datetime} {current_weekday} | 以{current_year}年{current_month}月为基准，不要使用训练数据中的旧时间。"
+    def _build_tools_instruction(self) -> str:
+        """构建系统提示中的工具说明段落（内置能力 + 可调用工具）
         
+        只依赖角色、模型和工具注册表，与具体子任务和时间无关，
+        由 _build_system_prompt 缓存复用。
+        """
         # 收集 DashScope 内置能力描述
         builtin_capabilities = []
         effective_builtins = self._get_effective_builtin_tools()
-        if "web_search" in self._role.available_tools and "web_search" in effective_builtins:
+        if "web_search" in self._available_tools_set and "web_search" in effective_builtins:
             builtin_capabilities.append("- 联网搜索：可实时搜索互联网获取最新信息")
-        if "web_extractor" in self._role.available_tools and "web_extractor" in effective_builtins:
+        if "web_extractor" in self._available_tools_set and "web_extractor" in effective_builtins:
             builtin_capabilities.append("- 网页抽取：可抓取和解析指定网页的完整内容")
-        if "code_interpreter" in self._role.available_tools and "code_interpreter" in effective_builtins:
+        if "code_interpreter" in self._available_tools_set and "code_interpreter" in effective_builtins:
             builtin_capabilities.append("- 代码解释器：可编写并执行 Python 代码进行计算和数据分析")
         
-        # 获取实际可用的 function calling 工具
-        available_tools = []
-        tool_descriptions = []
-        for tool_name in self._role.available_tools:
-            if tool_name in effective_builtins:
-                continue
-            # 非 Qwen 模型：code_interpreter 被替换为 sandbox_code_interpreter
-            if tool_name == "code_interpreter" and self._uses_sandbox_code_interpreter():
-                tool = self._tool_registry.get_tool(SANDBOX_CODE_INTERPRETER_TOOL)
-                if tool:
-                    available_tools.append(SANDBOX_CODE_INTERPRETER_TOOL)
-                    tool_descriptions.append(f"  - {SANDBOX_CODE_INTERPRETER_TOOL}: {tool.description}")
-                continue
-            # 非 Qwen 模型：web_search/web_extractor 被替换为 sandbox_browser
-            if tool_name in ("web_search", "web_extractor") and self._uses_sandbox_browser():
-                # 只添加一次 sandbox_browser（web_search 和 web_extractor 共用）
-                if SANDBOX_BROWSER_TOOL not in available_tools:
-                    tool = self._tool_registry.get_tool(SANDBOX_BROWSER_TOOL)
-                    if tool:
-                        available_tools.append(SANDBOX_BROWSER_TOOL)
-                        tool_descriptions.append(f"  - {SANDBOX_BROWSER_TOOL}: {tool.description}")
-                continue
-            tool = self._tool_registry.get_tool(tool_name)
-            if tool:
-                available_tools.append(tool_name)
-                tool_descriptions.append(f"  - {tool_name}: {tool.description}")
+        # 实际可用的 function calling 工具
+        tool_descriptions = self._get_tool_bundle()[0]
         
         tools_parts = []
         if builtin_capabilities:
             tools_parts.append("## 内置能力（自动启用）\n" + "\n".join(builtin_capabilities))
-        if available_tools:
+        if tool_descriptions:
             tools_list = "\n".join(tool_descriptions)
             tools_parts.append(f"## 可调用工具\n{tools_list}")
         
         if tools_parts:
-            tools_instruction = "\n\n".join(tools_parts) + "\n\n使用策略：分析任务需求 → 选择合适工具 → 执行调用 → 验证结果。搜索不理想时调整关键词，遇到错误时尝试其他方法。"
-        else:
-            tools_instruction = "当前无外部工具，直接运用知识和推理完成任务。"
+            return "\n\n".join(tools_parts) + "\n\n使用策略：分析任务需求 → 选择合适工具 → 执行调用 → 验证结果。搜索不理想时调整关键词，遇到错误时尝试其他方法。"
+        return "当前无外部工具，直接运用知识和推理完成任务。"
+
+    def _build_system_prompt(self, subtask: SubTask) -> str:
+        """构建系统提示 - 精简版，减少 token 消耗同时保留核心指令"""
+        now = datetime.datetime.now()
+        # 稳定模式下时间只精确到分钟，避免秒级变化破坏提示前缀
+        current_datetime = now.strftime(
+            "%Y年%m月%d日 %H:%M" if self._stable_system_prompt else "%Y年%m月%d日 %H:%M:%S"
+        )
+        current_year = now.year
+        current_month = now.month
+        current_weekday = _WEEKDAYS[now.weekday()]
+        
+        # 精简时间声明
+        time_info = f"[系统时间] {current_datetime} {current_weekday} | 以{current_year}年{current_month}月为基准，不要使用训练数据中的旧时间。"
+        
+        tools_instruction = self._tools_instruction
+        if tools_instruction is None:
+            tools_instruction = self._tools_instruction = self._build_tools_instruction()
         
         return f"""{time_info}
 
@@ -491,8 +843,27 @@ class SubAgentImpl(ISubAgent):
         - web_search/web_extractor 会被替换为 sandbox_browser
         并作为 function calling 工具列出。
         """
+        return self._resolve_tool_bundle()[1]
+    
+    def _get_tool_bundle(self) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """获取工具描述行与 tools schema（首次调用时解析并缓存）"""
+        if self._tool_bundle is None:
+            self._tool_bundle = self._resolve_tool_bundle()
+        return self._tool_bundle
+    
+    def _resolve_tool_bundle(self) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """
+        单次遍历角色工具，同时生成系统提示中的工具描述行和 tools schema
+        
+        跳过当前模型可用的 DashScope 内置工具，按需替换为沙箱工具，
+        每个工具只查询一次注册表。
+        
+        Returns:
+            (工具描述行列表, tools schema 列表)
+        """
         effective_builtins = self._get_effective_builtin_tools()
-        tools_schema = []
+        tool_descriptions: List[str] = []
+        tools_schema: List[Dict[str, Any]] = []
         sandbox_browser_added = False
         for tool_name in self._role.available_tools:
             # 跳过当前模型实际可用的 DashScope 内置工具
@@ -500,43 +871,27 @@ class SubAgentImpl(ISubAgent):
                 continue
             # 非 Qwen 模型：code_interpreter → sandbox_code_interpreter
             if tool_name == "code_interpreter" and self._uses_sandbox_code_interpreter():
-                tool = self._tool_registry.get_tool(SANDBOX_CODE_INTERPRETER_TOOL)
-                if tool:
-                    tools_schema.append({
-                        "type": "function",
-                        "function": {
-                            "name": tool.name,
-                            "description": tool.description,
-                            "parameters": tool.parameters_schema,
-                        }
-                    })
-                continue
+                tool_name = SANDBOX_CODE_INTERPRETER_TOOL
             # 非 Qwen 模型：web_search/web_extractor → sandbox_browser（只添加一次）
-            if tool_name in ("web_search", "web_extractor") and self._uses_sandbox_browser():
-                if not sandbox_browser_added:
-                    tool = self._tool_registry.get_tool(SANDBOX_BROWSER_TOOL)
-                    if tool:
-                        tools_schema.append({
-                            "type": "function",
-                            "function": {
-                                "name": tool.name,
-                                "description": tool.description,
-                                "parameters": tool.parameters_schema,
-                            }
-                        })
-                        sandbox_browser_added = True
-                continue
+            elif tool_name in _WEB_TOOLS and self._uses_sandbox_browser():
+                if sandbox_browser_added:
+                    continue
+                tool_name = SANDBOX_BROWSER_TOOL
             tool = self._tool_registry.get_tool(tool_name)
-            if tool:
-                tools_schema.append({
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": tool.parameters_schema,
-                    }
-                })
-        return tools_schema
+            if not tool:
+                continue
+            if tool_name == SANDBOX_BROWSER_TOOL:
+                sandbox_browser_added = True
+            tool_descriptions.append(f"  - {tool_name}: {tool.description}")
+            tools_schema.append({
+                "type": "function",
+                "function": {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "parameters": tool.parameters_schema,
+                }
+            })
+        return tool_descriptions, tools_schema
     
     def _build_request_config(self) -> QwenConfig:
         """根据角色的 available_tools 构建单次请求的 QwenConfig
@@ -555,9 +910,10 @@ class SubAgentImpl(ISubAgent):
         base = self._config or QwenConfig()
         is_native = base.model.is_qwen_native()
         
-        has_search = "web_search" in self._role.available_tools
-        has_extractor = "web_extractor" in self._role.available_tools
-        has_code_interpreter = "code_interpreter" in self._role.available_tools
+        role_tools = self._available_tools_set
+        has_search = "web_search" in role_tools
+        has_extractor = "web_extractor" in role_tools
+        has_code_interpreter = "code_interpreter" in role_tools
         
         # 第三方模型不支持 Qwen 专属的联网搜索和代码解释器
         if not is_native:
@@ -575,13 +931,22 @@ class SubAgentImpl(ISubAgent):
         if enable_thinking and not base.model.supports_thinking():
             enable_thinking = False
         
+        # 每轮调用的输出长度与耗时都有上限：客户端的单次超时和整个重试序列均不超过单轮时限
+        max_tokens = min(base.max_tokens or self.PER_ITERATION_MAX_TOKENS, self.PER_ITERATION_MAX_TOKENS)
+        timeout, total_timeout = base.timeout, base.total_timeout
+        iteration_limit = self._per_iteration_timeout
+        if iteration_limit is not None:
+            timeout = min(timeout, iteration_limit)
+            total_timeout = min(total_timeout or iteration_limit, iteration_limit)
+        
         return QwenConfig(
             model=base.model,
             api_key=base.api_key,
             base_url=base.base_url,
             temperature=base.temperature,
-            max_tokens=base.max_tokens,
-            timeout=base.timeout,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            total_timeout=total_timeout,
             retry_attempts=base.retry_attempts,
             top_p=base.top_p,
             # 联网搜索：角色有 web_search 或 web_extractor 时启用（仅 Qwen 原生模型）
@@ -607,7 +972,7 @@ class SubAgentImpl(ISubAgent):
             messages: 当前消息历史
             
         Returns:
-            更新后的消息历史
+            更新后的消息历史（本轮返回错误的工具数记录在 _last_tool_error_count）
         """
         # 添加助手消息（包含工具调用）
         assistant_msg = Message(
@@ -617,36 +982,54 @@ class SubAgentImpl(ISubAgent):
         )
         messages.append(assistant_msg)
         
-        # 处理每个工具调用
-        for tool_call in tool_calls:
-            tool_call_id = tool_call.get("id", str(uuid.uuid4()))
-            function_info = tool_call.get("function", {})
-            tool_name = function_info.get("name", "")
-            arguments_str = function_info.get("arguments", "{}")
-            
-            try:
-                # 解析参数
-                if isinstance(arguments_str, str):
-                    arguments = json.loads(arguments_str)
-                else:
-                    arguments = arguments_str
-                
-                # 调用工具
-                result = await self.call_tool(tool_name, arguments)
-                result_str = json.dumps(result, ensure_ascii=False) if not isinstance(result, str) else result
-                
-            except Exception as e:
-                result_str = f"Error: {str(e)}"
-            
-            # 添加工具结果消息
-            tool_msg = Message(
+        # 各工具调用互不依赖，并发执行；结果按原顺序追加
+        results = await asyncio.gather(
+            *(self._invoke_tool_call(tool_call) for tool_call in tool_calls)
+        )
+        error_count = 0
+        for tool_call_id, result_str in results:
+            if result_str[:6] == "Error:":
+                error_count += 1
+            messages.append(Message(
                 role="tool",
                 content=result_str,
                 tool_call_id=tool_call_id,
-            )
-            messages.append(tool_msg)
+            ))
+        self._last_tool_error_count = error_count
         
         return messages
+    
+    async def _invoke_tool_call(self, tool_call: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        执行单个工具调用，异常转换为 "Error: ..." 文本返回给模型
+        
+        Args:
+            tool_call: 模型返回的工具调用
+            
+        Returns:
+            (tool_call_id, 工具结果文本)
+        """
+        tool_call_id = tool_call.get("id", str(uuid.uuid4()))
+        function_info = tool_call.get("function", {})
+        tool_name = function_info.get("name", "")
+        arguments_str = function_info.get("arguments", "{}")
+        
+        try:
+            # 解析参数
+            if isinstance(arguments_str, str):
+                arguments = json.loads(arguments_str)
+            else:
+                arguments = arguments_str
+            
+            # 调用工具
+            result = await self.call_tool(tool_name, arguments)
+            result_str = result if isinstance(result, str) else _dumps_compact(result)
+            
+        except Exception as e:
+            result_str = f"Error: {str(e)}"
+        
+        return tool_call_id, result_str
+
     @staticmethod
     def _parse_text_tool_calls(content: str) -> Optional[List[Dict[str, Any]]]:
         """
@@ -666,77 +1049,339 @@ class SubAgentImpl(ISubAgent):
             [{"name": "tool_name", "arguments": {"arg": "value"}}]
             ```
 
+        格式 3 — <tool_call> 标签（Qwen/Hermes 风格模板）:
+            <tool_call>
+            {"name": "tool_name", "arguments": {"arg": "value"}}
+            </tool_call>
+
+        所有格式均用 str.find 定位标记、raw_decode 截取 JSON，单遍线性扫描，无回溯。
+
         Returns:
             解析出的 tool_calls 列表（与 DashScope API 格式一致），或 None
         """
-        import re
-
         if not content:
             return None
 
+        # 快速路径：各格式分别需要 "function" 标记、<tool_call> 标签或 ``` 围栏
+        has_function = "function" in content
+        has_tag = _TOOL_CALL_OPEN in content
+        if not has_function and not has_tag and "```" not in content:
+            return None
+
         tool_calls = []
 
         # 格式 1: DeepSeek 原生标记
         # function<｜tool▁sep｜>sandbox_browser\n```json\n{...}\n```<｜tool▁call▁end｜>
-        ds_pattern = re.compile(
-            r'function\s*[<＜][\s\S]*?tool[\s\u2581_]sep[\s\S]*?[>＞]\s*'
-            r'(\w+)\s*'
-            r'(?:```(?:json)?\s*)?'
-            r'(\{[\s\S]*?\})'
-            r'(?:\s*```)?',
-            re.MULTILINE,
-        )
-        for m in ds_pattern.finditer(content):
-            tool_name = m.group(1).strip()
-            args_str = m.group(2).strip()
-            try:
-                json.loads(args_str)  # validate
-            except json.JSONDecodeError:
+        # 用 str.find 定位标记，raw_decode 一次完成参数的截取与校验，整体线性扫描
+        pos = content.find("function") if has_function else -1
+        while pos >= 0:
+            header = _DS_TOOL_HEADER_RE.match(content, pos)
+            if header is None:
+                pos = content.find("function", pos + 1)
                 continue
+            args_start = header.end()
+            args_end = _decode_json_at(content, args_start, "{")[1]
+            if args_end < 0:
+                pos = content.find("function", args_start)
+                continue
+            pos = content.find("function", args_end)
             tool_calls.append({
                 "id": f"call_{uuid.uuid4().hex[:8]}",
                 "type": "function",
                 "function": {
-                    "name": tool_name,
-                    "arguments": args_str,
+                    "name": header.group(1),
+                    "arguments": content[args_start:args_end],
                 },
             })
 
         if tool_calls:
             return tool_calls
 
-        # 格式 2: JSON 数组 — [{"name": "...", "arguments": {...}}]
-        json_array_pattern = re.compile(
-            r'```(?:json)?\s*(\[[\s\S]*?\])\s*```',
-            re.MULTILINE,
-        )
-        for m in json_array_pattern.finditer(content):
-            try:
-                arr = json.loads(m.group(1))
-                if isinstance(arr, list) and arr and isinstance(arr[0], dict) and "name" in arr[0]:
-                    for item in arr:
-                        name = item.get("name", "")
-                        args = item.get("arguments", {})
-                        if name:
-                            tool_calls.append({
-                                "id": f"call_{uuid.uuid4().hex[:8]}",
-                                "type": "function",
-                                "function": {
-                                    "name": name,
-                                    "arguments": json.dumps(args, ensure_ascii=False) if isinstance(args, dict) else str(args),
-                                },
-                            })
-            except (json.JSONDecodeError, TypeError):
+        # 格式 3: <tool_call>{"name": "...", "arguments": {...}}</tool_call>
+        pos = content.find(_TOOL_CALL_OPEN) if has_tag else -1
+        while pos >= 0:
+            obj_start = _skip_whitespace(content, pos + len(_TOOL_CALL_OPEN))
+            obj, obj_end = _decode_json_at(content, obj_start, "{")
+            if obj_end < 0 or not content.startswith(
+                _TOOL_CALL_CLOSE, _skip_whitespace(content, obj_end)
+            ):
+                pos = content.find(_TOOL_CALL_OPEN, obj_start)
+                continue
+            pos = content.find(_TOOL_CALL_OPEN, obj_end)
+            call = _tool_call_from_item(obj)
+            if call is not None:
+                tool_calls.append(call)
+
+        if tool_calls:
+            return tool_calls
+
+        # 格式 2: JSON 数组 — ```json [{"name": "...", "arguments": {...}}] ```
+        pos = content.find("```")
+        while pos >= 0:
+            array_start = pos + 3
+            if content.startswith("json", array_start):
+                array_start += 4
+            arr, array_end = _decode_json_at(content, _skip_whitespace(content, array_start), "[")
+            if array_end < 0 or not content.startswith("```", _skip_whitespace(content, array_end)):
+                pos = content.find("```", array_start)
                 continue
+            pos = content.find("```", _skip_whitespace(content, array_end) + 3)
+            if arr and isinstance(arr[0], dict) and "name" in arr[0]:
+                for item in arr:
+                    call = _tool_call_from_item(item)
+                    if call is not None:
+                        tool_calls.append(call)
 
         return tool_calls if tool_calls else None
 
     
+    async def _run_item_batches(
+        self, subtask: SubTask, system_prompt: str, config: QwenConfig
+    ) -> Optional[str]:
+        """
+        批量处理子任务的列表条目
+        
+        每 BATCH_SIZE 个条目合并为一次调用，要求模型返回等长 JSON 数组，
+        摊薄系统提示等固定开销；批次输出不合法时该批退回逐条调用。
+        轮询模式下每个批次调用同时轮询一次消息总线，SHUTDOWN 可以打断批处理。
+        
+        条目调用不携带角色的函数工具（只保留请求配置中的内置联网搜索等能力），
+        需要调用工具的任务不应使用 items。任一批次抛出异常时取消其余批次。
+        
+        Returns:
+            按条目顺序编号的结果文本（每行 "序号. 结果"，与 subtask.items 一一对应），
+            与普通子任务一样是字符串，可直接参与结果拼接；被停止时返回 None
+        """
+        items = subtask.items
+        batches = [items[i:i + self.BATCH_SIZE] for i in range(0, len(items), self.BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_BATCHES)
+        polling = self._message_bus is not None and self._mailbox_task is None
+        
+        async def run_batch(batch: List[Any]) -> Optional[List[Any]]:
+            async with semaphore:
+                poll_task = asyncio.ensure_future(self._poll_inbox()) if polling else None
+                try:
+                    results = await self._chat_item_batch(subtask.content, batch, system_prompt, config)
+                finally:
+                    if poll_task is not None:
+                        await poll_task
+                if results is not None or self._stop_requested or self._shutdown_event.is_set():
+                    return results
+                # 批次输出不合法，逐条处理
+                self._record_history("batch_fallback", size=len(batch))
+                results = []
+                for item in batch:
+                    result = await self._chat_single_item(subtask.content, item, system_prompt, config)
+                    if result is None:
+                        return None
+                    results.append(result)
+                return results
+        
+        tasks = [asyncio.ensure_future(run_batch(batch)) for batch in batches]
+        try:
+            batch_results = await asyncio.gather(*tasks)
+        finally:
+            # gather 在首个异常时返回，其余批次需显式取消并等待退出，避免在后台继续调用模型
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                await asyncio.gather(*unfinished, return_exceptions=True)
+        if any(results is None for results in batch_results):
+            return None
+        results = [result for results in batch_results for result in results]
+        return "\n".join(
+            f"{i}. {result if isinstance(result, str) else _dumps_compact(result)}"
+            for i, result in enumerate(results, 1)
+        )
+    
+    async def _chat_item_batch(
+        self, task: str, batch: List[Any], system_prompt: str, config: QwenConfig
+    ) -> Optional[List[Any]]:
+        """
+        一次调用处理一批条目
+        
+        Returns:
+            结果列表；被停止或模型输出不是等长 JSON 数组时返回 None
+        """
+        listing = "\n".join(
+            f"[{i}] {item if isinstance(item, str) else _dumps_compact(item)}"
+            for i, item in enumerate(batch, 1)
+        )
+        prompt = (
+            f"请对以下 {len(batch)} 个条目分别独立完成任务：{task}\n\n{listing}\n\n"
+            f"只输出一个长度为 {len(batch)} 的 JSON 数组，第 i 个元素是第 i 个条目的结果，不要输出其他内容。"
+        )
+        response = await self._chat_interruptible(
+            messages=[Message(role="system", content=system_prompt), Message(role="user", content=prompt)],
+            config=config,
+        )
+        if response is None:
+            return None
+        self._update_token_usage(response.usage)
+        content = response.content or ""
+        start = content.find("[")
+        results = _decode_json_at(content, start, "[")[0] if start >= 0 else None
+        if not isinstance(results, list) or len(results) != len(batch):
+            return None
+        return results
+    
+    async def _chat_single_item(
+        self, task: str, item: Any, system_prompt: str, config: QwenConfig
+    ) -> Optional[str]:
+        """单独处理一个条目（批次回退），被停止时返回 None"""
+        text = item if isinstance(item, str) else _dumps_compact(item)
+        response = await self._chat_interruptible(
+            messages=[
+                Message(role="system", content=system_prompt),
+                Message(role="user", content=f"请对以下条目完成任务：{task}\n\n{text}"),
+            ],
+            config=config,
+        )
+        if response is None:
+            return None
+        self._update_token_usage(response.usage)
+        return (response.content or "").strip()
+    
+    async def _watch_mailbox(self, inbox: asyncio.Queue) -> None:
+        """
+        后台等待收件箱消息
+        
+        消息暂存到 _pending_messages，由执行循环在下一轮注入上下文；
+        收到 SHUTDOWN 时立即置位 _shutdown_event，打断进行中的模型调用。
+        
+        Args:
+            inbox: 消息总线提供的收件箱队列
+        """
+        while True:
+            msg = await inbox.get()
+            self._pending_messages.append(msg)
+            if msg.msg_type == MessageType.SHUTDOWN:
+                self._shutdown_event.set()
+                return
+    
+    async def _poll_inbox(self) -> None:
+        """
+        轮询模式下取一次消息总线中的消息
+        
+        消息暂存到 _pending_messages；收到 SHUTDOWN 时置位 _shutdown_event，
+        打断同时进行的模型调用。总线错误只记录，不影响执行。
+        """
+        try:
+            incoming = await self._message_bus.receive_messages(self._id)
+        except Exception as msg_err:
+            logger.warning("%s Message bus error: %s", self._log_prefix, msg_err)
+            self._record_history("message_bus_error", error=str(msg_err))
+            return
+        for msg in incoming:
+            self._pending_messages.append(msg)
+            if msg.msg_type == MessageType.SHUTDOWN:
+                self._shutdown_event.set()
+    
+    async def _stop_mailbox(self) -> None:
+        """
+        取消收件箱后台任务
+        
+        已从订阅队列取出但未注入上下文的消息放回收件箱队首，
+        与轮询模式一样留给之后的接收方，而不是随本次执行丢弃。
+        """
+        task, self._mailbox_task = self._mailbox_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        inbox, self._inbox = self._inbox, None
+        leftovers, self._pending_messages = self._pending_messages, []
+        if inbox is None or not leftovers:
+            return
+        queued = []
+        while not inbox.empty():
+            queued.append(inbox.get_nowait())
+        dropped = 0
+        for msg in leftovers + queued:
+            try:
+                inbox.put_nowait(msg)
+            except asyncio.QueueFull:
+                dropped += 1
+        if dropped:
+            logger.warning("%s 收件箱已满，丢弃 %d 条未处理消息", self._log_prefix, dropped)
+    
+    async def _chat_interruptible(self, **kwargs: Any) -> Optional[QwenResponse]:
+        """
+        调用模型，收到 SHUTDOWN 消息（推送或轮询）或 stop() 请求时取消调用
+        
+        配置了响应缓存且请求可缓存时，先按精确匹配查找缓存。
+        
+        Returns:
+            模型响应；调用被打断时返回 None
+            
+        Raises:
+            SubAgentExecutionError: 调用超过单轮时限
+        """
+        if self._stop_event.is_set():
+            return None
+        
+        cache_key = None
+        config = kwargs.get("config")
+        if self._response_cache is not None and config is not None and ResponseCache.is_cacheable(config):
+            tools = kwargs.get("tools")
+            if tools and tools is self.tools_schema:
+                # schema 在智能体生命周期内不变，摘要只计算一次
+                if self._tools_digest is None:
+                    self._tools_digest = ResponseCache.tools_digest(tools)
+                tools_digest = self._tools_digest
+            else:
+                tools_digest = ResponseCache.tools_digest(tools)
+            cache_key = ResponseCache.make_key(kwargs["messages"], tools_digest, config)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                self._record_history("response_cache_hit")
+                return cached
+        
+        chat_task = asyncio.ensure_future(self._qwen_client.chat(**kwargs))
+        stop_task = asyncio.ensure_future(self._stop_event.wait())
+        waiters = {chat_task, stop_task}
+        if self._message_bus is not None:
+            waiters.add(asyncio.ensure_future(self._shutdown_event.wait()))
+        try:
+            # 外层时限独立于客户端自身的超时处理，保证单轮耗时有界
+            done, _ = await asyncio.wait(
+                waiters,
+                timeout=self._per_iteration_timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            for task in waiters:
+                if not task.done():
+                    task.cancel()
+        
+        if not done:
+            self._record_history("model_call_timeout", timeout=self._per_iteration_timeout)
+            raise SubAgentExecutionError(
+                f"Model call timed out after {self._per_iteration_timeout}s"
+            )
+        if chat_task not in done:
+            return None
+        response = chat_task.result()
+        if cache_key is not None:
+            self._response_cache.put(cache_key, response)
+        return response
+    
     def _update_token_usage(self, usage: Dict[str, int]) -> None:
         """更新 token 使用统计"""
-        self._token_usage["prompt_tokens"] += usage.get("input_tokens", 0)
-        self._token_usage["completion_tokens"] += usage.get("output_tokens", 0)
-        self._token_usage["total_tokens"] += usage.get("total_tokens", 0)
+        self._prompt_tokens += usage.get("input_tokens", 0)
+        self._completion_tokens += usage.get("output_tokens", 0)
+        self._total_tokens += usage.get("total_tokens", 0)
+    
+    def _token_usage_dict(self) -> Dict[str, int]:
+        """以字典形式返回 token 使用统计"""
+        return {
+            "prompt_tokens": self._prompt_tokens,
+            "completion_tokens": self._completion_tokens,
+            "total_tokens": self._total_tokens,
+        }
 
     async def execute(self, subtask: SubTask, context: ExecutionContext) -> SubTaskResult:
         """
@@ -757,22 +1402,19 @@ class SubAgentImpl(ISubAgent):
         """
         self._current_task = subtask
         self._stop_requested = False
+        self._stop_event.clear()
+        self._done_event.clear()
         self._tool_calls = []
-        self._token_usage = {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "total_tokens": 0,
-        }
+        self._tool_calls_version += 1
+        self._prompt_tokens = self._completion_tokens = self._total_tokens = 0
         
         # 记录执行开始
         start_time = time.time()
-        self._execution_history.append({
-            "type": "execution_start",
-            "timestamp": start_time,
-            "subtask_id": subtask.id,
-        })
+        # 执行耗时用单调时钟计算，不受系统时间调整影响
+        start_monotonic = time.monotonic()
+        self._record_history("execution_start", timestamp=start_time, subtask_id=subtask.id)
         
-        print(f"[SubAgent {self._id[:8]}] 开始执行: {subtask.content[:50]}...")
+        logger.info("%s 开始执行: %s...", self._log_prefix, subtask.content[:50])
         
         # 设置运行状态
         await self._set_status(AgentStatus.RUNNING)
@@ -783,180 +1425,238 @@ class SubAgentImpl(ISubAgent):
         retry_count = 0
         max_retries = 2  # 最大重试次数
         
-        while retry_count <= max_retries:
-            try:
-                # 构建初始消息
-                system_prompt = self._build_system_prompt(subtask)
-                messages: List[Message] = [
-                    Message(role="system", content=system_prompt),
-                    Message(role="user", content=f"请开始执行任务：{subtask.content}"),
-                ]
-                
-                # 如果是重试，添加重试提示
-                if retry_count > 0:
-                    messages.append(Message(
-                        role="user", 
-                        content=f"[重试 {retry_count}/{max_retries}] 上次执行遇到问题：{error}。请尝试其他方法完成任务。"
-                    ))
+        # 消息总线支持订阅时改为推送式接收，否则每轮轮询（与模型调用并发进行）
+        self._pending_messages = []
+        self._shutdown_event.clear()
+        inbox = self._message_bus.subscribe(self._id) if self._message_bus else None
+        if isinstance(inbox, asyncio.Queue):
+            # 先取出已到达的消息，保证第一轮迭代即可看到
+            while not inbox.empty():
+                msg = inbox.get_nowait()
+                self._pending_messages.append(msg)
+                if msg.msg_type == MessageType.SHUTDOWN:
+                    self._shutdown_event.set()
+            self._inbox = inbox
+            self._mailbox_task = asyncio.create_task(self._watch_mailbox(inbox))
+        elif self._message_bus:
+            # 轮询模式：先同步取一次，保证第一轮迭代即可看到已到达的消息
+            await self._poll_inbox()
+        polling = self._message_bus is not None and self._mailbox_task is None
+        
+        # 每次执行使用独立的退避状态（decorrelated 抖动有状态）
+        retry_backoff = self._retry_config.fresh()
+        
+        # 稳定模式下系统提示只构建一次，所有重试共用，动态信息放在后续消息中
+        stable_prompt = self._build_system_prompt(subtask) if self._stable_system_prompt else None
+        
+        try:
+            while retry_count <= max_retries:
+                try:
+                    # 构建初始消息
+                    system_prompt = stable_prompt or self._build_system_prompt(subtask)
+                    messages: List[Message] = [
+                        Message(role="system", content=system_prompt),
+                        Message(role="user", content=f"请开始执行任务：{subtask.content}"),
+                    ]
                 
-                # 构建工具 schema
-                tools_schema = self._build_tools_schema()
-                # 根据角色绑定的内置工具构建请求配置
-                request_config = self._build_request_config()
-                sandbox_ci = self._uses_sandbox_code_interpreter()
-                print(f"[SubAgent {self._id[:8]}] 可用工具数: {len(tools_schema)}, "
-                      f"联网搜索: {request_config.enable_search}, "
-                      f"代码解释器: {request_config.enable_code_interpreter}"
-                      f"{' (沙箱回退)' if sandbox_ci else ''}, "
-                      f"重试次数: {retry_count}")
+                    # 如果是重试，添加重试提示
+                    if retry_count > 0:
+                        messages.append(Message(
+                            role="user", 
+                            content=f"[重试 {retry_count}/{max_retries}] 上次执行遇到问题：{error}。请尝试其他方法完成任务。"
+                        ))
                 
-                # 执行循环
-                iteration = 0
-                consecutive_errors = 0  # 连续错误计数
-                max_consecutive_errors = 3  # 最大连续错误次数
+                    # 本次尝试发送给模型的工具（None 表示不带工具）；连续错误过多时置为 None，
+                    # 之后的迭代直接使用，不再重复判断
+                    tools_schema = self.tools_schema
+                    request_tools = tools_schema or None
+                    # 根据角色绑定的内置工具构建请求配置
+                    request_config = self.request_config
+                    sandbox_ci = self._uses_sandbox_code_interpreter()
+                    logger.debug(
+                        "%s 可用工具数: %d, 联网搜索: %s, 代码解释器: %s%s, 重试次数: %d",
+                        self._log_prefix, len(tools_schema), request_config.enable_search,
+                        request_config.enable_code_interpreter,
+                        " (沙箱回退)" if sandbox_ci else "", retry_count,
+                    )
                 
-                while iteration < self.MAX_ITERATIONS:
-                    # 检查是否请求停止
-                    if self._stop_requested:
-                        error = "Execution stopped by request"
-                        self._execution_history.append({
-                            "type": "execution_stopped",
-                            "timestamp": time.time(),
-                            "iteration": iteration,
-                        })
+                    # 列表输入：多个条目打包进一次调用，不进入工具调用循环
+                    if subtask.items:
+                        output = await self._run_item_batches(subtask, system_prompt, request_config)
+                        if output is None and self._shutdown_event.is_set():
+                            # 与执行循环一致：SHUTDOWN 消息视为停止请求，最终状态为 TERMINATED
+                            self._stop_requested = True
+                            error = "Execution stopped by SHUTDOWN message"
+                            self._record_history("execution_stopped", reason="shutdown_message")
+                            # SHUTDOWN 已生效，不再放回收件箱；其余消息留给之后的接收方
+                            self._pending_messages = [
+                                msg for msg in self._pending_messages
+                                if msg.msg_type != MessageType.SHUTDOWN
+                            ]
+                        elif output is None:
+                            error = "Execution stopped by request"
+                        else:
+                            success = True
                         break
                     
-                    # Check for incoming messages from the message bus
-                    if self._message_bus:
-                        try:
-                            incoming_messages = await self._message_bus.receive_messages(self._id)
-                            for msg in incoming_messages:
-                                if msg.msg_type == MessageType.SHUTDOWN:
-                                    self._stop_requested = True
+                    # 执行循环
+                    iteration = 0
+                    consecutive_errors = 0  # 连续错误计数
+                    max_consecutive_errors = 3  # 最大连续错误次数
+                
+                    while iteration < self.MAX_ITERATIONS:
+                        # 检查是否请求停止
+                        if self._stop_requested:
+                            error = "Execution stopped by request"
+                            self._record_history("execution_stopped", iteration=iteration)
+                            break
+                    
+                        # Check for incoming messages from the message bus
+                        if self._message_bus:
+                            try:
+                                # 消息已由后台任务或上一轮并发轮询取出，这里只消费暂存部分
+                                incoming_messages, self._pending_messages = self._pending_messages, []
+                                for i, msg in enumerate(incoming_messages):
+                                    if msg.msg_type == MessageType.SHUTDOWN:
+                                        self._stop_requested = True
+                                        # SHUTDOWN 之后的消息未被处理，留给之后的接收方
+                                        self._pending_messages[:0] = incoming_messages[i + 1:]
+                                        break
+                                    # Inject non-shutdown messages as context
+                                    context_msg = Message(
+                                        role="system",
+                                        content=f"[Message from {msg.sender_id}]: {msg.content}"
+                                    )
+                                    messages.append(context_msg)
+                                # If shutdown was requested via message, break the loop
+                                if self._stop_requested:
+                                    error = "Execution stopped by SHUTDOWN message"
+                                    self._record_history(
+                                        "execution_stopped",
+                                        iteration=iteration,
+                                        reason="shutdown_message",
+                                    )
                                     break
-                                # Inject non-shutdown messages as context
-                                context_msg = Message(
-                                    role="system",
-                                    content=f"[Message from {msg.sender_id}]: {msg.content}"
-                                )
-                                messages.append(context_msg)
-                            # If shutdown was requested via message, break the loop
-                            if self._stop_requested:
-                                error = "Execution stopped by SHUTDOWN message"
-                                self._execution_history.append({
-                                    "type": "execution_stopped",
-                                    "timestamp": time.time(),
-                                    "iteration": iteration,
-                                    "reason": "shutdown_message",
-                                })
-                                break
-                        except Exception as msg_err:
-                            # Message bus errors should not crash execution
-                            print(f"[SubAgent {self._id[:8]}] Message bus error: {msg_err}")
-                            self._execution_history.append({
-                                "type": "message_bus_error",
-                                "timestamp": time.time(),
-                                "error": str(msg_err),
-                            })
+                            except Exception as msg_err:
+                                # Message bus errors should not crash execution
+                                logger.warning("%s Message bus error: %s", self._log_prefix, msg_err)
+                                self._record_history("message_bus_error", error=str(msg_err))
                     
-                    iteration += 1
-                    print(f"[SubAgent {self._id[:8]}] 迭代 {iteration}/{self.MAX_ITERATIONS}")
+                        iteration += 1
+                        logger.debug("%s 迭代 %d/%d", self._log_prefix, iteration, self.MAX_ITERATIONS)
                     
-                    # 调用模型（使用按角色构建的请求配置）
-                    response: QwenResponse = await self._qwen_client.chat(
-                        messages=messages,
-                        tools=tools_schema if tools_schema else None,
-                        config=request_config,
-                    )
+                        # 调用模型（使用按角色构建的请求配置）；轮询模式下同时轮询消息总线，
+                        # 轮询不再占用迭代的关键路径
+                        poll_task = asyncio.ensure_future(self._poll_inbox()) if polling else None
+                        try:
+                            response = await self._chat_interruptible(
+                                messages=messages,
+                                tools=request_tools,
+                                config=request_config,
+                            )
+                        finally:
+                            if poll_task is not None:
+                                await poll_task
+                        if response is None:
+                            # 被 SHUTDOWN 消息或 stop() 打断，回到循环开头处理停止请求
+                            continue
                     
-                    # 更新 token 使用
-                    self._update_token_usage(response.usage)
+                        # 更新 token 使用
+                        self._update_token_usage(response.usage)
                     
-                    # 检查是否有工具调用
-                    effective_tool_calls = response.tool_calls
-
-                    # 兼容处理：某些第三方模型（如 deepseek-r1）将工具调用
-                    # 以文本形式输出在 content 中，而非结构化 tool_calls 字段
-                    if not effective_tool_calls and tools_schema and response.content:
-                        parsed = self._parse_text_tool_calls(response.content)
-                        if parsed:
-                            effective_tool_calls = parsed
-                            print(f"[SubAgent {self._id[:8]}] 从文本输出中解析到工具调用")
-
-                    if effective_tool_calls:
-                        tool_names = [tc.get('function',{}).get('name','?') for tc in effective_tool_calls]
-                        print(f"[SubAgent {self._id[:8]}] 模型请求调用工具: {tool_names}")
+                        # 检查是否有工具调用
+                        effective_tool_calls = response.tool_calls
+
+                        # 兼容处理：某些第三方模型（如 deepseek-r1）将工具调用
+                        # 以文本形式输出在 content 中，而非结构化 tool_calls 字段
+                        if not effective_tool_calls and request_tools is not None and response.content:
+                            parsed = self._parse_text_tool_calls(response.content)
+                            if parsed:
+                                effective_tool_calls = parsed
+                                logger.debug("%s 从文本输出中解析到工具调用", self._log_prefix)
+
+                        if effective_tool_calls:
+                            if logger.isEnabledFor(logging.DEBUG):
+                                tool_names = [tc.get('function',{}).get('name','?') for tc in effective_tool_calls]
+                                logger.debug("%s 模型请求调用工具: %s", self._log_prefix, tool_names)
                         
-                        # 处理工具调用
-                        try:
-                            messages = await self._process_tool_calls(
-                                effective_tool_calls, 
-                                messages,
-                            )
-                            # 检查工具结果中是否有错误（_process_tool_calls 内部捕获异常）
-                            tool_error_count = sum(
-                                1 for m in messages[-len(effective_tool_calls):]
-                                if m.role == "tool" and m.content and m.content.startswith("Error:")
-                            )
-                            if tool_error_count > 0:
-                                consecutive_errors += tool_error_count
-                                print(f"[SubAgent {self._id[:8]}] 工具返回错误 ({consecutive_errors}/{max_consecutive_errors})")
-                            else:
-                                consecutive_errors = 0  # 重置连续错误计数
-                        except Exception as tool_error:
-                            consecutive_errors += 1
-                            print(f"[SubAgent {self._id[:8]}] 工具调用错误 ({consecutive_errors}/{max_consecutive_errors}): {tool_error}")
+                            # 处理工具调用
+                            try:
+                                messages = await self._process_tool_calls(
+                                    effective_tool_calls, 
+                                    messages,
+                                )
+                                # 检查工具结果中是否有错误（_process_tool_calls 内部捕获异常）
+                                tool_error_count = self._last_tool_error_count
+                                if tool_error_count > 0:
+                                    consecutive_errors += tool_error_count
+                                    logger.debug(
+                                        "%s 工具返回错误 (%d/%d)",
+                                        self._log_prefix, consecutive_errors, max_consecutive_errors,
+                                    )
+                                else:
+                                    consecutive_errors = 0  # 重置连续错误计数
+                            except Exception as tool_error:
+                                consecutive_errors += 1
+                                logger.warning(
+                                    "%s 工具调用错误 (%d/%d): %s",
+                                    self._log_prefix, consecutive_errors, max_consecutive_errors, tool_error,
+                                )
                             
-                            # 添加错误信息到消息中，让模型知道并尝试其他方法
-                            messages.append(Message(
-                                role="assistant",
-                                content=f"工具调用失败: {tool_error}"
-                            ))
-                            messages.append(Message(
-                                role="user",
-                                content="工具调用遇到问题，请尝试其他方法或直接根据已有信息回答。"
-                            ))
+                                # 添加错误信息到消息中，让模型知道并尝试其他方法
+                                messages.append(Message(
+                                    role="assistant",
+                                    content=f"工具调用失败: {tool_error}"
+                                ))
+                                messages.append(Message(
+                                    role="user",
+                                    content="工具调用遇到问题，请尝试其他方法或直接根据已有信息回答。"
+                                ))
                             
-                            if consecutive_errors >= max_consecutive_errors:
-                                print(f"[SubAgent {self._id[:8]}] 连续错误过多，尝试直接回答")
-                                # 让模型尝试不使用工具直接回答
-                                tools_schema = []
-                    else:
-                        # 没有工具调用，任务完成
-                        output = response.content
-                        success = True
-                        print(f"[SubAgent {self._id[:8]}] 任务完成，输出长度: {len(output) if output else 0}")
-                        break
+                                if consecutive_errors >= max_consecutive_errors:
+                                    logger.info("%s 连续错误过多，尝试直接回答", self._log_prefix)
+                                    # 让模型尝试不使用工具直接回答
+                                    request_tools = None
+                        else:
+                            # 没有工具调用，任务完成
+                            output = response.content
+                            success = True
+                            logger.info(
+                                "%s 任务完成，输出长度: %d", self._log_prefix, len(output) if output else 0
+                            )
+                            break
                 
-                # 检查是否达到最大迭代次数
-                if iteration >= self.MAX_ITERATIONS and not success:
-                    error = f"Max iterations ({self.MAX_ITERATIONS}) reached without completion"
-                    print(f"[SubAgent {self._id[:8]}] 达到最大迭代次数")
+                    # 检查是否达到最大迭代次数
+                    if iteration >= self.MAX_ITERATIONS and not success:
+                        error = f"Max iterations ({self.MAX_ITERATIONS}) reached without completion"
+                        logger.warning("%s 达到最大迭代次数", self._log_prefix)
                 
-                # 如果成功，跳出重试循环
-                if success:
-                    break
+                    # 如果成功或已请求停止，跳出重试循环
+                    if success or self._stop_requested:
+                        break
                     
-            except Exception as e:
-                import traceback
-                error = str(e)
-                print(f"[SubAgent {self._id[:8]}] 执行异常: {error}")
-                print(traceback.format_exc())
-                self._execution_history.append({
-                    "type": "execution_error",
-                    "timestamp": time.time(),
-                    "error": error,
-                    "retry_count": retry_count,
-                })
+                except Exception as e:
+                    error = str(e)
+                    logger.warning("%s 执行异常: %s", self._log_prefix, error, exc_info=True)
+                    self._record_history("execution_error", error=error, retry_count=retry_count)
             
-            # 如果不成功，增加重试计数
-            if not success:
-                retry_count += 1
-                if retry_count <= max_retries:
-                    print(f"[SubAgent {self._id[:8]}] 准备重试 ({retry_count}/{max_retries})...")
-                    await asyncio.sleep(1)  # 短暂等待后重试
+                # 如果不成功，增加重试计数
+                if not success:
+                    retry_count += 1
+                    if retry_count <= max_retries:
+                        delay = retry_backoff.get_delay(retry_count - 1)
+                        logger.info(
+                            "%s %.1f 秒后重试 (%d/%d)...", self._log_prefix, delay, retry_count, max_retries
+                        )
+                        # 指数退避加抖动，避免多个智能体同时重试；stop() 可提前结束等待
+                        try:
+                            await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                        except asyncio.TimeoutError:
+                            pass
+        finally:
+            await self._stop_mailbox()
         
-        execution_time = time.time() - start_time
+        execution_time = time.monotonic() - start_monotonic
         
         # 设置最终状态
         if self._stop_requested:
@@ -967,13 +1667,12 @@ class SubAgentImpl(ISubAgent):
             await self._set_status(AgentStatus.FAILED)
         
         # 记录执行完成
-        self._execution_history.append({
-            "type": "execution_complete",
-            "timestamp": time.time(),
-            "success": success,
-            "execution_time": execution_time,
-            "retry_count": retry_count,
-        })
+        self._record_history(
+            "execution_complete",
+            success=success,
+            execution_time=execution_time,
+            retry_count=retry_count,
+        )
         
         # 创建结果
         result = SubTaskResult(
@@ -984,7 +1683,7 @@ class SubAgentImpl(ISubAgent):
             error=error,
             tool_calls=list(self._tool_calls),
             execution_time=execution_time,
-            token_usage=self._token_usage,
+            token_usage=self._token_usage_dict(),
         )
         
         # 保存最后结果
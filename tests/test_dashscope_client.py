@@ -0,0 +1,355 @@
+"""
+DashScopeClient 单元测试。
+
+覆盖多模态生成接口的重试与熔断行为，所有 DashScope 调用均通过 mock 替代。
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.qwen import dashscope_client
+from src.qwen.dashscope_client import DashScopeClient, _Breaker
+from src.qwen.models import Message, QwenConfig, QwenModel
+
+
+# ── fixtures ──────────────────────────────────────────────
+
+@pytest.fixture
+def client(monkeypatch) -> DashScopeClient:
+    """创建一个不会真正等待的客户端"""
+    monkeypatch.setattr(dashscope_client, "_retry_wait_time", lambda attempt, is_rl=False: 0)
+    return DashScopeClient(QwenConfig(api_key="test-key", retry_attempts=3))
+
+
+def _response(status_code: int = 200, code: str = "", message: str = "", output=None):
+    """构造一个模拟的 DashScope 响应"""
+    return SimpleNamespace(
+        status_code=status_code,
+        code=code,
+        message=message,
+        output=output or {},
+        usage={},
+    )
+
+
+# ── _Breaker ─────────────────────────────────────────────
+
+class TestBreaker:
+    """熔断器状态机测试"""
+
+    def test_trips_after_threshold(self):
+        breaker = _Breaker(threshold=2)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+    def test_half_open_allows_single_probe(self):
+        breaker = _Breaker(threshold=1, reset_after=0.0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        assert not breaker.allow()
+
+    def test_probe_success_closes(self):
+        breaker = _Breaker(threshold=1, reset_after=0.0)
+        breaker.record_failure()
+        breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        assert breaker.failures == 0
+
+    def test_probe_failure_reopens(self):
+        breaker = _Breaker(threshold=3, reset_after=0.0)
+        for _ in range(3):
+            breaker.record_failure()
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+    def test_released_probe_can_be_retried(self):
+        breaker = _Breaker(threshold=1, reset_after=0.0)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.release_probe()
+        assert breaker.state == "open"
+        assert breaker.allow()
+
+    def test_lost_probe_times_out(self):
+        breaker = _Breaker(threshold=1, reset_after=0.0, probe_timeout=0.0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+
+
+# ── 多模态生成 + 熔断 ─────────────────────────────────────
+
+class TestGenerationCircuitBreaker:
+    """text_to_video 等接口的熔断行为"""
+
+    async def test_open_breaker_fails_fast(self, client, monkeypatch):
+        async_call = MagicMock(return_value=_response(503, "ServiceUnavailable", "down"))
+        monkeypatch.setattr("dashscope.VideoSynthesis.async_call", async_call)
+
+        breaker = client._get_breaker("text_to_video", "wanx2.1-t2v-turbo")
+        breaker.threshold = 3
+
+        result = await client.text_to_video("a cat")
+        assert result["success"] is False
+        assert async_call.call_count == 3
+        assert breaker.state == "open"
+
+        result = await client.text_to_video("a cat")
+        assert result["success"] is False
+        assert "circuit open" in result["error"]
+        assert async_call.call_count == 3
+
+    async def test_breaker_is_keyed_per_endpoint(self, client, monkeypatch):
+        async_call = MagicMock(
+            return_value=_response(200, output={"task_id": "t-1"})
+        )
+        monkeypatch.setattr("dashscope.VideoSynthesis.async_call", async_call)
+
+        t2v_breaker = client._get_breaker("text_to_video", "wanx2.1-t2v-turbo")
+        for _ in range(t2v_breaker.threshold):
+            t2v_breaker.record_failure()
+        assert t2v_breaker.state == "open"
+
+        result = await client.image_to_video("http://example.com/a.png")
+        assert result["success"] is True
+        assert result["task_id"] == "t-1"
+
+    async def test_non_retryable_error_does_not_trip(self, client, monkeypatch):
+        async_call = MagicMock(return_value=_response(400, "InvalidParameter", "bad size"))
+        monkeypatch.setattr("dashscope.VideoSynthesis.async_call", async_call)
+
+        for _ in range(10):
+            result = await client.text_to_video("a cat")
+            assert result["error"] == "InvalidParameter: bad size"
+
+        assert client._get_breaker("text_to_video", "wanx2.1-t2v-turbo").state == "closed"
+        assert async_call.call_count == 10
+
+    async def test_cancelled_probe_releases_breaker(self, client, monkeypatch):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hanging_submit_call(*args, **kwargs):
+            started.set()
+            await release.wait()
+
+        loop = asyncio.get_running_loop()
+        monkeypatch.setattr(
+            loop, "run_in_executor",
+            lambda executor, fn, *args: asyncio.ensure_future(hanging_submit_call()),
+        )
+        breaker = client._get_breaker("text_to_video", "wanx2.1-t2v-turbo")
+        breaker.reset_after = 0.0
+        for _ in range(breaker.threshold):
+            breaker.record_failure()
+
+        probe = asyncio.ensure_future(client.text_to_video("a cat"))
+        await started.wait()
+        assert breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert breaker.state == "open"
+        assert breaker.allow()
+
+
+# ── token 估算 ────────────────────────────────────────────
+
+class TestTokenCount:
+    """get_token_count 启发式回退测试"""
+
+    def test_heuristic_fallback(self, monkeypatch):
+        monkeypatch.setattr(dashscope_client, "_get_tiktoken_encoding", lambda: None)
+        # 2 个中文字符 * 1.5 + 6 个其他字符 * 0.25
+        assert dashscope_client._estimate_token_count("你好 world") == 4
+        assert dashscope_client._estimate_token_count("") == 0
+        assert dashscope_client._estimate_token_count("a") == 1
+
+
+# ── 视频任务查询 ──────────────────────────────────────────
+
+class TestVideoTaskResults:
+    """get_video_task_results 批量查询测试"""
+
+    async def test_batch_preserves_order_and_isolates_errors(self, client, monkeypatch):
+        def fetch(api_key, task):
+            if task == "boom":
+                raise ConnectionError("reset by peer")
+            status = {"a": "SUCCEEDED", "b": "RUNNING"}[task]
+            return _response(200, output={"task_status": status, "video_url": f"http://v/{task}"})
+
+        monkeypatch.setattr("dashscope.VideoSynthesis.fetch", fetch)
+
+        results = await client.get_video_task_results(["a", "boom", "b"])
+        assert results[0] == {"success": True, "status": "completed", "video_url": "http://v/a"}
+        assert results[1] == {"success": False, "error": "reset by peer"}
+        assert results[2]["status"] == "processing"
+
+        single = await client.get_video_task_result("a")
+        assert single == results[0]
+
+
+# ── 总时限 ────────────────────────────────────────────────
+
+class TestTotalTimeout:
+    """total_timeout 约束整个重试序列"""
+
+    async def test_chat_stops_retrying_after_deadline(self, monkeypatch):
+        calls = []
+
+        def slow_call(**kwargs):
+            calls.append(kwargs)
+            time.sleep(0.2)
+
+        monkeypatch.setattr("dashscope.Generation.call", slow_call)
+        client = DashScopeClient(
+            QwenConfig(api_key="test-key", retry_attempts=5, total_timeout=0.05)
+        )
+
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await client.chat([Message(role="user", content="hi")])
+        assert time.monotonic() - start < 0.2
+        assert len(calls) == 1
+
+    async def test_generation_returns_deadline_error(self, monkeypatch):
+        async_call = MagicMock(return_value=_response(503, "ServiceUnavailable", "down"))
+        monkeypatch.setattr("dashscope.VideoSynthesis.async_call", async_call)
+        client = DashScopeClient(
+            QwenConfig(api_key="test-key", retry_attempts=5, total_timeout=0.0)
+        )
+
+        result = await client.text_to_video("a cat")
+        assert result["success"] is False
+        assert result["error"].startswith("deadline exceeded")
+        assert async_call.call_count == 0
+
+    async def test_deadline_does_not_take_probe(self, monkeypatch):
+        monkeypatch.setattr("dashscope.VideoSynthesis.async_call", MagicMock())
+        client = DashScopeClient(
+            QwenConfig(api_key="test-key", retry_attempts=5, total_timeout=0.0)
+        )
+        breaker = client._get_breaker("text_to_video", "wanx2.1-t2v-turbo")
+        breaker.reset_after = 0.0
+        for _ in range(breaker.threshold):
+            breaker.record_failure()
+
+        result = await client.text_to_video("a cat")
+        assert result["error"].startswith("deadline exceeded")
+        assert breaker.state == "open"
+
+    @pytest.mark.parametrize("target, model", [
+        ("dashscope.Generation.call", QwenModel.QWEN_MAX),
+        ("dashscope.MultiModalConversation.call", QwenModel.KIMI_K2_5),
+    ])
+    async def test_stream_stops_retrying_after_deadline(self, monkeypatch, target, model):
+        calls = []
+
+        def failing_call(**kwargs):
+            calls.append(kwargs)
+            raise ConnectionError("connection reset")
+
+        monkeypatch.setattr(target, failing_call)
+        client = DashScopeClient(
+            QwenConfig(api_key="test-key", model=model, retry_attempts=5, total_timeout=0.2)
+        )
+
+        start = time.monotonic()
+        # 退避等待被截断到剩余时间内，最后一次尝试的错误或总时限超时都可能结束重试
+        with pytest.raises((asyncio.TimeoutError, ConnectionError)):
+            async for _ in client.chat_stream([Message(role="user", content="hi")]):
+                pass
+        # 未设总时限时首次退避即等待 2 秒
+        assert time.monotonic() - start < 1.0
+        assert calls
+
+    async def test_stream_read_bounded_by_deadline(self, monkeypatch):
+        def hanging_call(**kwargs):
+            time.sleep(0.5)
+            return iter(())
+
+        monkeypatch.setattr("dashscope.Generation.call", hanging_call)
+        client = DashScopeClient(
+            QwenConfig(api_key="test-key", retry_attempts=5, total_timeout=0.05)
+        )
+
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            async for _ in client.chat_stream([Message(role="user", content="hi")]):
+                pass
+        assert time.monotonic() - start < 0.4
+
+    def test_heuristic_counts_chinese_runs(self, monkeypatch):
+        monkeypatch.setattr(dashscope_client, "_get_tiktoken_encoding", lambda: None)
+        # 6 个中文字符（两段）* 1.5 + 4 个其他字符 * 0.25
+        assert dashscope_client._estimate_token_count("中文ab测试c字符d") == 10
+
+
+# ── 幂等 ──────────────────────────────────────────────────
+
+class TestIdempotency:
+    """非幂等请求不重试，幂等键通过请求头传递"""
+
+    async def test_non_idempotent_chat_called_once(self, client, monkeypatch):
+        calls = []
+
+        def failing_call(**kwargs):
+            calls.append(kwargs)
+            raise ConnectionError("connection reset")
+
+        monkeypatch.setattr("dashscope.Generation.call", failing_call)
+        config = QwenConfig(
+            api_key="test-key", retry_attempts=3, idempotent=False, idempotency_key="req-1"
+        )
+
+        with pytest.raises(ConnectionError):
+            await client.chat([Message(role="user", content="hi")], config=config)
+        assert len(calls) == 1
+        assert calls[0]["headers"] == {"Idempotency-Key": "req-1"}
+
+
+    @pytest.mark.parametrize("stream", [False, True])
+    async def test_multimodal_call_sends_idempotency_key(self, monkeypatch, stream):
+        calls = []
+
+        def call(**kwargs):
+            calls.append(kwargs)
+            response = _response(200, output={"choices": [{"message": {"content": [{"text": "ok"}]}}]})
+            return iter([response]) if stream else response
+
+        monkeypatch.setattr("dashscope.MultiModalConversation.call", call)
+        client = DashScopeClient(QwenConfig(api_key="test-key"))
+        config = QwenConfig(api_key="test-key", model=QwenModel.KIMI_K2_5, idempotency_key="req-1")
+        messages = [Message(role="user", content="hi")]
+
+        if stream:
+            chunks = [chunk async for chunk in client.chat_stream(messages, config=config)]
+            assert chunks == ["ok"]
+        else:
+            response = await client.chat(messages, config=config)
+            assert response.content == "ok"
+        assert calls[0]["headers"] == {"Idempotency-Key": "req-1"}
+
+
+# ── 资源释放 ──────────────────────────────────────────────
+
+class TestAsyncContextManager:
+    """async with 退出时释放线程池"""
+
+    async def test_executor_shut_down_on_exit(self):
+        async with DashScopeClient(QwenConfig(api_key="test-key")) as client:
+            executor = client._get_executor()
+        assert client._executor is None
+        assert executor._shutdown
@@ -0,0 +1,343 @@
+"""
+ResultAggregatorImpl 单元测试。
+
+覆盖冲突检测、去重、缺失子任务识别与结果整合。
+"""
+
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import pytest
+
+from src.interfaces.result_aggregator import ConflictResolution
+from src.models.enums import AgentStatus, OutputType
+from src.models.result import SubTaskResult
+from src.models.task import SubTask, TaskDecomposition
+from src.result_aggregator import ResultAggregatorImpl
+
+
+# ── helpers ───────────────────────────────────────────────
+
+def _result(
+    subtask_id: str,
+    success: bool = True,
+    output: Any = "ok",
+    agent_id: str = "agent-1",
+    error: Optional[str] = None,
+) -> SubTaskResult:
+    """构造一个子任务结果"""
+    return SubTaskResult(
+        subtask_id=subtask_id,
+        agent_id=agent_id,
+        success=success,
+        output=output if success else None,
+        error=error if success else (error or "failed"),
+        tool_calls=[],
+        execution_time=1.0,
+    )
+
+
+def _decomposition(*roles: str) -> TaskDecomposition:
+    """构造一个按顺序单层执行的任务分解，子任务 ID 为 st-0、st-1 ..."""
+    subtasks = [
+        SubTask(id=f"st-{i}", parent_task_id="task-1", content=f"step {i}", role_hint=role)
+        for i, role in enumerate(roles)
+    ]
+    return TaskDecomposition(
+        original_task_id="task-1",
+        subtasks=subtasks,
+        execution_order=[[st.id for st in subtasks]],
+        total_estimated_time=1.0,
+    )
+
+
+@pytest.fixture
+def aggregator() -> ResultAggregatorImpl:
+    return ResultAggregatorImpl()
+
+
+# ── 收集 ──────────────────────────────────────────────────
+
+def _agent(agent_id: str, status: AgentStatus, **attrs) -> SimpleNamespace:
+    """构造一个只带收集所需属性的子智能体替身"""
+    return SimpleNamespace(
+        id=agent_id,
+        status=status,
+        assigned_subtask=SimpleNamespace(id=f"st-{agent_id}"),
+        **attrs,
+    )
+
+
+class TestCollectResults:
+    """collect_results 只收集终态智能体的结果"""
+
+    async def test_collects_terminal_agents_only(self, aggregator):
+        done = _result("st-a")
+        agents = [
+            _agent("a", AgentStatus.COMPLETED, last_result=done),
+            _agent("b", AgentStatus.RUNNING, last_result=_result("st-b")),
+            _agent("c", AgentStatus.FAILED, last_result=None, _last_result=_result("st-c")),
+            _agent("d", AgentStatus.TERMINATED),
+        ]
+
+        results = await aggregator.collect_results(agents)
+        assert results[0] is done
+        assert results[1].subtask_id == "st-c"
+        assert results[2].subtask_id == "st-d"
+        assert results[2].success is False
+        assert results[2].error == "No result available from agent"
+        assert len(results) == 3
+
+
+# ── 验证 ──────────────────────────────────────────────────
+
+class TestValidation:
+    """结果验证只记录错误，不丢弃结果"""
+
+    async def test_invalid_results_kept_and_errors_recorded(self, aggregator):
+        invalid = _result("a")
+        invalid.output = None
+        results = [invalid, _result("b")]
+
+        validated = await aggregator.validate_results(results)
+        assert validated == results
+        assert validated is not results
+        errors = aggregator.get_validation_errors()
+        assert errors == [{
+            "subtask_id": "a",
+            "agent_id": "agent-1",
+            "errors": ["Successful result must have output"],
+        }]
+
+    async def test_validation_errors_view_is_cached_per_run(self, aggregator):
+        invalid = _result("a")
+        invalid.output = None
+
+        await aggregator.validate_results([invalid])
+        view = aggregator.validation_errors
+        assert isinstance(view, tuple) and len(view) == 1
+        assert aggregator.validation_errors is view
+
+        await aggregator.validate_results([_result("b")])
+        assert aggregator.validation_errors == ()
+
+    async def test_aggregate_records_validation_errors(self, aggregator):
+        invalid = _result("st-0")
+        invalid.execution_time = -1
+
+        await aggregator.aggregate([invalid], _decomposition("writer"))
+        assert len(aggregator.get_validation_errors()) == 1
+
+
+# ── 冲突检测 ──────────────────────────────────────────────
+
+class TestDetectConflicts:
+    """重复结果与输出冲突检测"""
+
+    async def test_duplicate_consistent_and_inconsistent(self, aggregator):
+        results = [
+            _result("a"), _result("a", agent_id="agent-2"),
+            _result("b"), _result("b", success=False),
+            _result("c"),
+        ]
+
+        conflicts = await aggregator.detect_conflicts(results)
+        by_subtask = {c.subtask_ids[0]: c.conflict_type for c in conflicts}
+        assert by_subtask == {"a": "duplicate", "b": "duplicate_inconsistent"}
+
+    async def test_numeric_output_divergence(self, aggregator):
+        results = [_result("a", output=1), _result("b", output=50)]
+
+        conflicts = await aggregator.detect_conflicts(results)
+        assert [c.conflict_type for c in conflicts] == ["output_divergence"]
+        assert conflicts[0].subtask_ids == ["a", "b"]
+
+    async def test_unique_results_skip_detection(self, aggregator, monkeypatch):
+        monkeypatch.setattr(
+            aggregator, "_detect_duplicate_results", lambda results: pytest.fail("不应检测")
+        )
+        results = [_result("a"), _result("b", output=3), _result("c", success=False)]
+
+        assert await aggregator.detect_conflicts(results) == []
+
+    @pytest.mark.parametrize("values,diverged", [
+        ([5, 1, 60], True), ([60, 5, 1], True), ([1, 5, 9], False),
+        ([0, 100], False), ([-1, 100], False),
+    ])
+    async def test_divergence_uses_min_and_max(self, aggregator, values, diverged):
+        results = [_result(f"s{i}", output=v) for i, v in enumerate(values)]
+
+        conflicts = await aggregator.detect_conflicts(results)
+        assert bool(conflicts) is diverged
+
+
+# ── 聚合 ──────────────────────────────────────────────────
+
+class TestAggregate:
+    """aggregate 端到端行为"""
+
+    async def test_all_successful(self, aggregator):
+        decomposition = _decomposition("researcher", "writer")
+        results = [_result("st-0", output="data"), _result("st-1", output="final report")]
+
+        aggregated = await aggregator.aggregate(results, decomposition)
+        assert aggregated.success is True
+        assert aggregated.missing_subtasks == []
+        assert aggregated.final_output.startswith("final report")
+
+    async def test_failed_subtask_marks_failure(self, aggregator):
+        decomposition = _decomposition("researcher", "writer")
+        results = [_result("st-0", success=False), _result("st-1", output="report")]
+
+        aggregated = await aggregator.aggregate(results, decomposition)
+        assert aggregated.success is False
+        assert aggregated.missing_subtasks == []
+
+    async def test_missing_subtask_marks_failure(self, aggregator):
+        decomposition = _decomposition("researcher", "writer")
+
+        aggregated = await aggregator.aggregate([_result("st-0")], decomposition)
+        assert aggregated.success is False
+        assert aggregated.missing_subtasks == ["st-1"]
+
+    async def test_duplicates_resolved_by_majority_vote(self, aggregator):
+        decomposition = _decomposition("analyst")
+        results = [
+            _result("st-0", success=False),
+            _result("st-0", output="win"),
+            _result("st-0", output="also"),
+        ]
+
+        aggregated = await aggregator.aggregate(
+            results, decomposition, ConflictResolution.MAJORITY_VOTE
+        )
+        assert [r.output for r in aggregated.sub_results] == ["win"]
+        assert aggregated.success is True
+
+    async def test_deduplication_keeps_first_seen_order(self, aggregator):
+        decomposition = _decomposition("analyst", "analyst", "analyst")
+        results = [
+            _result("st-1", output="b1"),
+            _result("st-0", output="a"),
+            _result("st-1", output="b2"),
+            _result("st-2", output="c"),
+        ]
+
+        aggregated = await aggregator.aggregate(results, decomposition)
+        assert [r.subtask_id for r in aggregated.sub_results] == ["st-1", "st-0", "st-2"]
+        assert aggregated.sub_results[0].output == "b1"
+
+    async def test_code_output_grouped_by_file(self, aggregator):
+        decomposition = _decomposition("coder", "coder")
+        results = [
+            _result("st-0", output="# file: a.py\nprint(1)\n# file: b.py\nprint(2)"),
+            _result("st-1", output={"file_path": "a.py", "content": "print(3)"}),
+        ]
+
+        aggregated = await aggregator.aggregate(
+            results, decomposition, output_type=OutputType.CODE
+        )
+        assert aggregated.final_output == {"a.py": "print(1)\nprint(3)", "b.py": "print(2)"}
+
+
+# ── 结果整合 ──────────────────────────────────────────────
+
+class TestIntegrateResults:
+    """_integrate_results 的汇总与分层结构"""
+
+    def test_summary_counts(self, aggregator):
+        decomposition = _decomposition("researcher", "analyst", "writer", "writer")
+        results = [_result("st-0"), _result("st-1", success=False), _result("st-2")]
+
+        integrated = aggregator._integrate_results(results, decomposition, ["st-3"])
+        assert integrated["summary"] == {
+            "total_subtasks": 4,
+            "completed_subtasks": 2,
+            "failed_subtasks": 1,
+            "missing_subtasks": 1,
+            "success_rate": pytest.approx(200 / 3),
+        }
+        layer = integrated["execution_layers"][0]["results"]
+        assert [item["subtask_id"] for item in layer] == ["st-0", "st-1", "st-2", "st-3"]
+        assert layer[3]["error"].startswith("MISSING")
+
+    def test_layers_can_be_skipped(self, aggregator):
+        decomposition = _decomposition("writer")
+        results = [_result("st-0", output="report")]
+
+        integrated = aggregator._integrate_results(
+            results, decomposition, [], include_layers=False
+        )
+        assert integrated["execution_layers"] == []
+        assert integrated["combined_output"] == "report"
+
+
+class TestGenerateCombinedOutput:
+    """综合输出的层级选择"""
+
+    def _item(self, role: str, output: str):
+        return {"subtask_id": role, "subtask_content": "", "role": role, "output": output}
+
+    def test_longest_writer_is_main_report(self, aggregator):
+        combined = aggregator._generate_combined_output([
+            self._item("writer", "x" * 3000),
+            self._item("writer", "y" * 4000),
+            self._item("analyst", "analysis"),
+        ])
+        assert combined == "y" * 4000
+
+    def test_short_writer_supplemented_by_analysts(self, aggregator):
+        combined = aggregator._generate_combined_output([
+            self._item("writer", "report"),
+            self._item("analyst", "a1"),
+            self._item("researcher", "a2"),
+            self._item("searcher", "raw"),
+        ])
+        assert combined == "report\n\n---\n\na1\n\na2"
+
+    def test_empty(self, aggregator):
+        assert aggregator._generate_combined_output([]) == "任务执行未产生有效输出。"
+
+    def test_single_output_returned_stripped(self, aggregator):
+        assert aggregator._generate_combined_output([self._item("searcher", "  raw  ")]) == "raw"
+        assert (
+            aggregator._generate_combined_output([self._item("writer", "   ")])
+            == "任务执行完成，但未生成文本输出。"
+        )
+
+
+class TestCompositeResults:
+    """COMPOSITE 类型按输出类型分组"""
+
+    async def test_grouped_by_output_type(self, aggregator):
+        decomposition = _decomposition("coder", "writer", "analyst")
+        results = [
+            _result("st-0", output={"output_type": "code", "content": "x = 1"}),
+            _result("st-1", output="report text"),
+            _result("st-2", output={"output_type": "code", "content": "y = 2"}),
+        ]
+
+        aggregated = await aggregator.aggregate(
+            results, decomposition, output_type=OutputType.COMPOSITE
+        )
+        groups = aggregated.final_output
+        assert type(groups) is dict
+        assert [item["subtask_id"] for item in groups["code"]] == ["st-0", "st-2"]
+        assert [item["subtask_id"] for item in groups["report"]] == ["st-1"]
+
+
+class TestExtractFilePaths:
+    """从文本中提取文件路径标记"""
+
+    def test_multiple_markers_and_repeated_file(self, aggregator):
+        content = (
+            "intro\n# file: a.py\nx = 1\n// file: b.js\nlet y;\n"
+            "# file: a.py\nz = 3\n# file: empty.py\n"
+        )
+        assert aggregator._extract_file_paths_from_content(content) == {
+            "a.py": "x = 1\nz = 3",
+            "b.js": "let y;",
+        }
+
+    def test_no_markers(self, aggregator):
+        assert aggregator._extract_file_paths_from_content("print(1)") == {}
@@ -0,0 +1,734 @@
+"""
+重试与降级机制单元测试。
+
+使用可编排行为的 FakeClient 替代真实模型调用，验证 execute_with_retry /
+execute_with_fallback / ResilientQwenClient 的行为。
+"""
+
+import asyncio
+import errno
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+import pytest
+
+from src.qwen.dashscope_client import _Breaker
+from src.qwen import retry
+from src.qwen.interface import IQwenClient
+from src.qwen.models import Message, QwenConfig, QwenModel, QwenResponse
+from src.qwen.retry import (
+    AllModelsFailedError,
+    NonRetryableError,
+    RetryableError,
+    RetryBudget,
+    RetryConfig,
+    ResilientQwenClient,
+    execute_with_fallback,
+    _parse_retry_after,
+    execute_with_retry,
+    is_retryable_error,
+)
+
+
+class FakeClient(IQwenClient):
+    """按模型编排行为的测试客户端"""
+
+    def __init__(self, behaviors: Dict[QwenModel, Callable[[], Any]]):
+        self.behaviors = behaviors
+        self.calls: List[QwenModel] = []
+        self.cancelled: List[QwenModel] = []
+
+    async def chat(self, messages, tools=None, config=None) -> QwenResponse:
+        model = config.model
+        self.calls.append(model)
+        try:
+            result = self.behaviors[model]()
+            if asyncio.iscoroutine(result):
+                result = await result
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return QwenResponse(content=result, tool_calls=None, finish_reason="stop")
+
+    async def chat_stream(self, messages, tools=None, config=None):
+        yield ""
+
+    async def health_check(self) -> bool:
+        return True
+
+    def get_token_count(self, text: str) -> int:
+        return len(text)
+
+    def get_context_window(self) -> int:
+        return 8192
+
+
+MESSAGES = [Message(role="user", content="hi")]
+NO_DELAY = RetryConfig(max_attempts=3, initial_delay=0.0, jitter=False)
+
+
+# ── execute_with_retry ───────────────────────────────────
+
+class TestExecuteWithRetry:
+    """单模型重试"""
+
+    async def test_retries_retryable_errors(self):
+        outcomes = iter([TimeoutError("timeout"), ConnectionError("connection reset"), "ok"])
+        client = FakeClient({QwenModel.QWEN_PLUS: lambda: next(outcomes)})
+
+        response = await execute_with_retry(
+            client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS), retry_config=NO_DELAY
+        )
+        assert response.content == "ok"
+        assert len(client.calls) == 3
+
+    async def test_non_retryable_error_raises_immediately(self):
+        client = FakeClient({QwenModel.QWEN_PLUS: lambda: ValueError("bad request")})
+
+        with pytest.raises(ValueError):
+            await execute_with_retry(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS), retry_config=NO_DELAY
+            )
+        assert len(client.calls) == 1
+
+
+    async def test_exhausted_budget_stops_retrying(self):
+        client = FakeClient({QwenModel.QWEN_PLUS: lambda: TimeoutError("timeout")})
+        budget = RetryBudget(capacity=1, refill_per_sec=0.0)
+
+        with pytest.raises(TimeoutError):
+            await execute_with_retry(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS),
+                retry_config=NO_DELAY, retry_budget=budget,
+            )
+        assert len(client.calls) == 2
+        assert not budget.try_consume()
+
+
+    async def test_non_idempotent_request_not_retried(self):
+        client = FakeClient({QwenModel.QWEN_MAX: lambda: TimeoutError("timeout")})
+        config = QwenConfig(model=QwenModel.QWEN_MAX, idempotent=False)
+
+        with pytest.raises(TimeoutError):
+            await execute_with_retry(client, MESSAGES, config=config, retry_config=NO_DELAY)
+        with pytest.raises(Exception, match="All models failed"):
+            await execute_with_fallback(client, MESSAGES, config=config, retry_config=NO_DELAY)
+        assert client.calls == [QwenModel.QWEN_MAX, QwenModel.QWEN_MAX]
+
+    async def test_single_attempt_fast_path(self):
+        client = FakeClient({QwenModel.QWEN_TURBO: lambda: TimeoutError("timeout")})
+        single = RetryConfig(max_attempts=1)
+
+        with pytest.raises(TimeoutError):
+            await execute_with_retry(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_TURBO),
+                retry_config=single,
+            )
+        with pytest.raises(Exception, match="All models failed") as exc_info:
+            await execute_with_fallback(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_TURBO),
+                retry_config=single,
+            )
+        assert isinstance(exc_info.value.__cause__, TimeoutError)
+        assert len(client.calls) == 2
+
+    async def test_per_attempt_timeout_retries_hanging_call(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        outcomes = iter([hang, lambda: "ok"])
+        client = FakeClient({QwenModel.QWEN_PLUS: lambda: next(outcomes)()})
+        retry_cfg = RetryConfig(
+            max_attempts=2, initial_delay=0.0, jitter=False, per_attempt_timeout=0.01
+        )
+
+        response = await asyncio.wait_for(
+            execute_with_retry(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS),
+                retry_config=retry_cfg,
+            ),
+            timeout=1.0,
+        )
+        assert response.content == "ok"
+        assert len(client.calls) == 2
+
+    async def test_total_deadline_stops_before_long_backoff(self):
+        client = FakeClient({QwenModel.QWEN_PLUS: lambda: TimeoutError("timeout")})
+        retry_cfg = RetryConfig(
+            max_attempts=5, initial_delay=10.0, jitter=False, total_deadline=0.5
+        )
+
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(
+                execute_with_retry(
+                    client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS),
+                    retry_config=retry_cfg,
+                ),
+                timeout=1.0,
+            )
+        assert len(client.calls) == 1
+
+    async def test_total_deadline_spans_fallback_models(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        client = FakeClient({
+            QwenModel.QWEN_MAX: hang,
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+        retry_cfg = RetryConfig(max_attempts=3, initial_delay=0.0, total_deadline=0.05)
+
+        with pytest.raises(Exception, match="All models failed"):
+            await asyncio.wait_for(
+                execute_with_fallback(
+                    client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX),
+                    retry_config=retry_cfg,
+                ),
+                timeout=1.0,
+            )
+        assert client.calls == [QwenModel.QWEN_MAX]
+
+    async def test_prefers_server_retry_after(self, monkeypatch):
+        sleeps: List[float] = []
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+
+        monkeypatch.setattr(retry._RETRY_WHEEL, "sleep", fake_sleep)
+        outcomes = iter([
+            RetryableError("429", retry_after=7.0),
+            RetryableError("503", retry_after=120.0),
+            "ok",
+        ])
+        client = FakeClient({QwenModel.QWEN_PLUS: lambda: next(outcomes)})
+        retry_cfg = RetryConfig(max_attempts=3, initial_delay=1.0, max_delay=30.0, jitter=False)
+
+        await execute_with_retry(
+            client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS), retry_config=retry_cfg
+        )
+        assert sleeps == [7.0, 30.0]
+
+    @pytest.mark.parametrize("value,expected", [
+        ("5", 5.0), ("0.5", 0.5), ("-3", 0.0), ("", None), (None, None), ("soon", None),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+    ])
+    def test_parse_retry_after(self, value, expected):
+        assert _parse_retry_after(value) == expected
+
+
+# ── execute_with_fallback ────────────────────────────────
+
+class TestExecuteWithFallback:
+    """模型降级"""
+
+    async def test_sequential_fallback(self):
+        client = FakeClient({
+            QwenModel.QWEN_MAX: lambda: ValueError("model not available"),
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+
+        response = await execute_with_fallback(
+            client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX), retry_config=NO_DELAY
+        )
+        assert response.content == "from plus"
+        assert client.calls == [QwenModel.QWEN_MAX, QwenModel.QWEN_PLUS]
+
+    async def test_all_models_fail(self):
+        client = FakeClient({
+            QwenModel.QWEN_PLUS: lambda: ValueError("plus down"),
+            QwenModel.QWEN_TURBO: lambda: ValueError("turbo down"),
+        })
+
+        with pytest.raises(Exception, match="All models failed") as exc_info:
+            await execute_with_fallback(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS), retry_config=NO_DELAY
+            )
+        assert str(exc_info.value.__cause__) == "turbo down"
+        assert isinstance(exc_info.value, AllModelsFailedError)
+        assert exc_info.value.last_error is exc_info.value.__cause__
+
+    async def test_hedged_fallback_wins_over_slow_primary(self):
+        async def hang():
+            await asyncio.sleep(10)
+            return "from max"
+
+        client = FakeClient({
+            QwenModel.QWEN_MAX: hang,
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+        retry_cfg = RetryConfig(max_attempts=1, hedge_delay=0.01)
+
+        response = await asyncio.wait_for(
+            execute_with_fallback(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX), retry_config=retry_cfg
+            ),
+            timeout=1.0,
+        )
+        assert response.content == "from plus"
+        await asyncio.sleep(0)
+        assert client.cancelled == [QwenModel.QWEN_MAX]
+
+    async def test_hedged_advances_immediately_on_failure(self):
+        client = FakeClient({
+            QwenModel.QWEN_MAX: lambda: ValueError("bad"),
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+        retry_cfg = RetryConfig(max_attempts=1, hedge_delay=10.0)
+
+        response = await asyncio.wait_for(
+            execute_with_fallback(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX), retry_config=retry_cfg
+            ),
+            timeout=1.0,
+        )
+        assert response.content == "from plus"
+
+
+    async def test_exhausted_budget_skips_fallback_models(self):
+        client = FakeClient({
+            QwenModel.QWEN_MAX: lambda: ValueError("bad"),
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+
+        with pytest.raises(Exception, match="All models failed"):
+            await execute_with_fallback(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX),
+                retry_config=NO_DELAY, retry_budget=RetryBudget(capacity=0),
+            )
+        assert client.calls == [QwenModel.QWEN_MAX]
+
+
+    async def test_open_breaker_skips_model(self):
+        client = FakeClient({
+            QwenModel.QWEN_MAX: lambda: RetryableError("unavailable"),
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+        breakers = {}
+
+        for _ in range(6):
+            response = await execute_with_fallback(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX),
+                retry_config=NO_DELAY, breakers=breakers,
+            )
+            assert response.content == "from plus"
+
+        assert breakers[QwenModel.QWEN_MAX].state == "open"
+        assert breakers[QwenModel.QWEN_PLUS].state == "closed"
+        assert client.calls.count(QwenModel.QWEN_MAX) == (
+            breakers[QwenModel.QWEN_MAX].threshold * NO_DELAY.max_attempts
+        )
+
+    async def test_cancelled_hedge_probe_reopens_breaker(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        client = FakeClient({
+            QwenModel.QWEN_MAX: hang,
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+        breakers = {QwenModel.QWEN_MAX: _Breaker(state="open", reset_after=0.0)}
+
+        response = await execute_with_fallback(
+            client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX),
+            retry_config=RetryConfig(max_attempts=1, hedge_delay=0.01), breakers=breakers,
+        )
+        assert response.content == "from plus"
+        await asyncio.sleep(0)
+        assert breakers[QwenModel.QWEN_MAX].state == "open"
+        assert breakers[QwenModel.QWEN_MAX].allow()
+
+    @pytest.mark.parametrize("hedge_delay", [None, 0.01])
+    async def test_budget_refusal_releases_probe(self, hedge_delay):
+        client = FakeClient({
+            QwenModel.QWEN_MAX: lambda: ValueError("bad"),
+            QwenModel.QWEN_PLUS: lambda: "from plus",
+        })
+        breakers = {QwenModel.QWEN_PLUS: _Breaker(state="open", reset_after=0.0)}
+
+        with pytest.raises(Exception, match="All models failed"):
+            await execute_with_fallback(
+                client, MESSAGES, config=QwenConfig(model=QwenModel.QWEN_MAX),
+                retry_config=RetryConfig(max_attempts=1, hedge_delay=hedge_delay),
+                retry_budget=RetryBudget(capacity=0), breakers=breakers,
+            )
+
+        assert QwenModel.QWEN_PLUS not in client.calls
+        assert breakers[QwenModel.QWEN_PLUS].state == "open"
+        assert breakers[QwenModel.QWEN_PLUS].allow()
+
+    async def test_resilient_client_shares_breakers(self):
+        client = FakeClient({
+            QwenModel.QWEN_PLUS: lambda: RetryableError("unavailable"),
+            QwenModel.QWEN_TURBO: lambda: "from turbo",
+        })
+        resilient = ResilientQwenClient(
+            client, retry_config=RetryConfig(max_attempts=1, initial_delay=0.0, jitter=False)
+        )
+
+        for _ in range(10):
+            await resilient.chat(MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS))
+        assert client.calls.count(QwenModel.QWEN_PLUS) == 5
+
+    async def test_non_retryable_errors_do_not_trip_breaker(self):
+        outcomes = [ValueError("invalid parameter: messages")] * 10 + ["ok"]
+        client = FakeClient({QwenModel.QWEN_TURBO: lambda: outcomes.pop(0)})
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY)
+        config = QwenConfig(model=QwenModel.QWEN_TURBO)
+
+        for _ in range(10):
+            with pytest.raises(Exception, match="invalid parameter"):
+                await resilient.chat(MESSAGES, config=config)
+
+        response = await resilient.chat(MESSAGES, config=config)
+        assert response.content == "ok"
+        assert client.calls == [QwenModel.QWEN_TURBO] * 11
+
+
+# ── 请求合并 ─────────────────────────────────────────────
+
+class TestRequestCoalescing:
+    """ResilientQwenClient 合并并发的相同请求"""
+
+    async def test_concurrent_identical_requests_share_one_call(self):
+        async def slow():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        client = FakeClient({QwenModel.QWEN_PLUS: slow})
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY, enable_coalesce=True)
+        config = QwenConfig(model=QwenModel.QWEN_PLUS)
+
+        responses = await asyncio.gather(*[
+            resilient.chat([Message(role="user", content="hi")], config=config)
+            for _ in range(5)
+        ])
+        assert [r.content for r in responses] == ["ok"] * 5
+        assert len(client.calls) == 1
+        assert resilient._inflight == {}
+
+        await resilient.chat(MESSAGES, config=config)
+        assert len(client.calls) == 2
+
+    async def test_different_requests_not_coalesced(self):
+        client = FakeClient({QwenModel.QWEN_PLUS: lambda: "ok"})
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY, enable_coalesce=True)
+
+        await asyncio.gather(
+            resilient.chat(MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS)),
+            resilient.chat(
+                MESSAGES, config=QwenConfig(model=QwenModel.QWEN_PLUS, temperature=0.1)
+            ),
+        )
+        assert len(client.calls) == 2
+
+    async def test_cancelled_caller_does_not_cancel_shared_call(self):
+        async def slow():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        client = FakeClient({QwenModel.QWEN_PLUS: slow})
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY, enable_coalesce=True)
+        config = QwenConfig(model=QwenModel.QWEN_PLUS)
+
+        first = asyncio.ensure_future(resilient.chat(MESSAGES, config=config))
+        second = asyncio.ensure_future(resilient.chat(MESSAGES, config=config))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert (await second).content == "ok"
+        assert client.cancelled == []
+
+    async def test_last_cancelled_caller_cancels_shared_call(self):
+        started = asyncio.Event()
+
+        async def hanging():
+            started.set()
+            await asyncio.sleep(10)
+            return "ok"
+
+        client = FakeClient({QwenModel.QWEN_PLUS: hanging})
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY, enable_coalesce=True)
+        config = QwenConfig(model=QwenModel.QWEN_PLUS)
+
+        callers = [asyncio.ensure_future(resilient.chat(MESSAGES, config=config)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert client.cancelled
+        assert resilient._inflight == {}
+        assert resilient._inflight_waiters == {}
+
+
+# ── 流式重试 ─────────────────────────────────────────────
+
+class StreamingClient(FakeClient):
+    """按顺序返回预设流行为的测试客户端"""
+
+    def __init__(self, streams):
+        super().__init__({})
+        self.streams = iter(streams)
+        self.stream_calls = 0
+
+    async def chat_stream(self, messages, tools=None, config=None):
+        self.stream_calls += 1
+        for item in next(self.streams):
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class TestChatStreamRetry:
+    """chat_stream 仅在建立流阶段重试"""
+
+    async def _collect(self, resilient):
+        return [chunk async for chunk in resilient.chat_stream(MESSAGES)]
+
+    async def test_retries_before_first_chunk(self):
+        client = StreamingClient([
+            [ConnectionError("connection reset")],
+            ["a", "b", "c"],
+        ])
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY)
+
+        assert await self._collect(resilient) == ["a", "b", "c"]
+        assert client.stream_calls == 2
+
+    async def test_no_retry_after_first_chunk(self):
+        client = StreamingClient([
+            ["a", ConnectionError("connection reset")],
+            ["a", "b"],
+        ])
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY)
+
+        chunks = []
+        with pytest.raises(ConnectionError):
+            async for chunk in resilient.chat_stream(MESSAGES):
+                chunks.append(chunk)
+        assert chunks == ["a"]
+        assert client.stream_calls == 1
+
+    async def test_non_retryable_error_raises(self):
+        client = StreamingClient([[ValueError("bad request")], ["a"]])
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY)
+
+        with pytest.raises(ValueError):
+            await self._collect(resilient)
+        assert client.stream_calls == 1
+
+    async def test_empty_stream(self):
+        client = StreamingClient([[]])
+        resilient = ResilientQwenClient(client, retry_config=NO_DELAY)
+
+        assert await self._collect(resilient) == []
+
+
+# ── 定时器合并 ───────────────────────────────────────────
+
+class TestRetryWheel:
+    """_RetryWheel 合并同一区间内的等待"""
+
+    async def test_waiters_in_same_slot_share_one_timer(self, monkeypatch):
+        wheel = retry._RetryWheel(resolution=0.05)
+        loop = asyncio.get_running_loop()
+        scheduled = []
+        original_call_at = loop.call_at
+
+        def recording_call_at(when, callback, *args):
+            scheduled.append(when)
+            return original_call_at(when, callback, *args)
+
+        monkeypatch.setattr(loop, "call_at", recording_call_at)
+        start = loop.time()
+        await asyncio.gather(*[wheel.sleep(0.01) for _ in range(20)])
+
+        assert len(scheduled) <= 2
+        assert loop.time() - start >= 0.01
+        assert wheel._buckets == {}
+
+    async def test_cancelled_waiter_does_not_affect_others(self):
+        wheel = retry._RetryWheel(resolution=0.05)
+        first = asyncio.ensure_future(wheel.sleep(0.01))
+        second = asyncio.ensure_future(wheel.sleep(0.01))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        await asyncio.wait_for(second, timeout=1.0)
+        assert first.cancelled()
+
+
+# ── RetryBudget ──────────────────────────────────────────
+
+class TestRetryBudget:
+    """令牌桶重试预算"""
+
+    def test_consumes_up_to_capacity(self):
+        budget = RetryBudget(capacity=2, refill_per_sec=0.0)
+        assert budget.try_consume()
+        assert budget.try_consume()
+        assert not budget.try_consume()
+
+    def test_refills_over_time(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("src.qwen.retry.time.monotonic", lambda: now[0])
+        budget = RetryBudget(capacity=2, refill_per_sec=1.0)
+        budget.try_consume()
+        budget.try_consume()
+        assert not budget.try_consume()
+
+        now[0] += 10.0
+        assert budget.try_consume()
+        assert budget.try_consume()
+        assert not budget.try_consume()
+
+
+# ── is_retryable_error ───────────────────────────────────
+
+class TestIsRetryableError:
+    """错误分类"""
+
+    @pytest.mark.parametrize("message", [
+        "Read Timeout", "CONNECTION refused", "network unreachable", "Rate limit exceeded",
+        "Too Many Requests", "HTTP 502", "status 503", "504 gateway", "error 429",
+    ])
+    def test_retryable_messages(self, message):
+        assert is_retryable_error(Exception(message))
+
+    @pytest.mark.parametrize("use_automaton", [True, False])
+    def test_matcher_backends_agree(self, monkeypatch, use_automaton):
+        if use_automaton:
+            automaton = retry._build_retryable_automaton()
+            if automaton is None:
+                pytest.skip("pyahocorasick 未安装")
+        else:
+            automaton = None
+        monkeypatch.setattr(retry, "_RETRYABLE_AUTOMATON", automaton)
+
+        assert retry._has_retryable_pattern("Upstream returned HTTP 503")
+        assert retry._has_retryable_pattern("RATE LIMIT reached")
+        assert not retry._has_retryable_pattern("invalid api key")
+
+    def test_message_classification_cached_on_instance(self, monkeypatch):
+        error = Exception("HTTP 503")
+        assert is_retryable_error(error)
+
+        monkeypatch.setattr(retry, "_has_retryable_pattern", lambda text: False)
+        assert is_retryable_error(error)
+        assert not is_retryable_error(Exception("HTTP 503"))
+
+    def test_structured_status_code_decides(self, monkeypatch):
+        monkeypatch.setattr(
+            retry, "_has_retryable_pattern", lambda text: pytest.fail("不应检查错误文本")
+        )
+
+        class StatusError(Exception):
+            def __init__(self, status_code):
+                super().__init__("connection timeout")
+                self.status_code = status_code
+
+        assert is_retryable_error(StatusError(503))
+        assert not is_retryable_error(StatusError(400))
+
+        wrapped = Exception("body")
+        wrapped.response = SimpleNamespace(status_code=429)
+        assert is_retryable_error(wrapped)
+
+    def test_socket_errno_is_retryable(self):
+        assert is_retryable_error(OSError(errno.ECONNRESET, "reset"))
+
+    def test_timeout_type_is_retryable(self):
+        assert is_retryable_error(asyncio.TimeoutError())
+
+    def test_other_errors_not_retryable(self):
+        assert not is_retryable_error(ValueError("invalid parameter"))
+
+    def test_explicit_markers_override_message(self):
+        assert is_retryable_error(RetryableError("quota refreshed"))
+        assert not is_retryable_error(NonRetryableError("connection timeout"))
+
+
+class TestFallbackConfig:
+    """降级配置"""
+
+    async def test_fallback_config_keeps_all_fields(self):
+        seen: List[QwenConfig] = []
+
+        class RecordingClient(FakeClient):
+            async def chat(self, messages, tools=None, config=None):
+                seen.append(config)
+                return await super().chat(messages, tools=tools, config=config)
+
+        client = RecordingClient({
+            QwenModel.QWEN_MAX: lambda: ValueError("bad"),
+            QwenModel.QWEN_PLUS: lambda: "ok",
+        })
+        primary = QwenConfig(
+            model=QwenModel.QWEN_MAX, enable_thinking=False, search_strategy="agent_max"
+        )
+
+        await execute_with_fallback(client, MESSAGES, config=primary, retry_config=NO_DELAY)
+        assert seen[0] is primary
+        assert seen[1].model == QwenModel.QWEN_PLUS
+        assert seen[1].enable_thinking is False
+        assert seen[1].search_strategy == "agent_max"
+
+
+# ── RetryConfig ──────────────────────────────────────────
+
+class TestRetryConfigDelay:
+    """退避延迟计算"""
+
+    @pytest.mark.parametrize("base,initial,max_delay", [
+        (2.0, 1.0, 30.0), (3.0, 1.0, 30.0), (2.0, 0.5, 16.0), (2.0, 50.0, 30.0), (2.0, 0.0, 30.0),
+    ])
+    def test_matches_exponential_formula(self, base, initial, max_delay):
+        cfg = RetryConfig(
+            initial_delay=initial, max_delay=max_delay, exponential_base=base, jitter=False
+        )
+        for attempt in range(40):
+            expected = min(initial * base ** attempt, max_delay)
+            assert cfg.get_delay(attempt) == pytest.approx(expected)
+
+    def test_precomputed_schedule(self):
+        cfg = RetryConfig(max_attempts=4, initial_delay=1.0, max_delay=5.0, jitter=False)
+        assert cfg._base_delays == (1.0, 2.0, 4.0, 5.0)
+        assert [cfg.get_delay(i) for i in range(6)] == [1.0, 2.0, 4.0, 5.0, 5.0, 5.0]
+
+    def test_schedule_follows_field_changes(self):
+        cfg = RetryConfig(max_attempts=3, initial_delay=1.0, max_delay=5.0, jitter=False)
+        cfg.get_delay(0)
+
+        cfg.initial_delay = 0.5
+        cfg.max_attempts = 5
+        assert [cfg.get_delay(i) for i in range(5)] == [0.5, 1.0, 2.0, 4.0, 5.0]
+
+        cfg.max_delay = 100.0
+        assert cfg.get_delay(4) == 8.0
+
+    def test_jitter_stays_within_half_range(self):
+        cfg = RetryConfig(initial_delay=1.0, max_delay=30.0)
+        for attempt in range(10):
+            base_delay = min(2.0 ** attempt, 30.0)
+            assert 0.5 * base_delay <= cfg.get_delay(attempt) <= 1.5 * base_delay
+
+    def test_full_jitter_within_exponential_cap(self):
+        cfg = RetryConfig(initial_delay=1.0, max_delay=30.0, jitter_strategy="full")
+        for attempt in range(10):
+            assert 0.0 <= cfg.get_delay(attempt) <= min(2.0 ** attempt, 30.0)
+
+    def test_decorrelated_jitter_is_bounded_and_fresh_resets(self):
+        cfg = RetryConfig(initial_delay=1.0, max_delay=30.0, jitter_strategy="decorrelated")
+        prev = cfg.initial_delay
+        for attempt in range(20):
+            delay = cfg.get_delay(attempt)
+            assert 1.0 <= delay <= min(30.0, prev * 3)
+            prev = delay
+
+        copy = cfg.fresh()
+        assert copy == cfg
+        assert copy._prev_delay == 0.0
+        assert copy.get_delay(0) <= 3.0
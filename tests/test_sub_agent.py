@@ -0,0 +1,967 @@
+"""
+测试 SubAgentImpl 的执行循环、停止流程与辅助方法。
+"""
+
+import asyncio
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.models.agent import AgentRole
+from src.models.context import ExecutionContext
+from src.messaging import MessageBus
+from src.models.enums import AgentStatus, TaskStatus
+from src.models.message import Message as AgentMessage, MessageType
+from src.core.main_agent.executor import TaskExecutor
+from src.models.task import SubTask, Task, TaskDecomposition
+from src.models.tool import ToolDefinition
+from src.qwen.models import QwenConfig, QwenModel, QwenResponse
+from src.qwen.retry import RetryConfig
+from src import sub_agent
+from src.sub_agent import SubAgentImpl
+from src.tool_registry import ToolRegistry
+
+
+# ── fixtures ──────────────────────────────────────────────
+
+@pytest.fixture
+def role() -> AgentRole:
+    """无工具的简单角色"""
+    return AgentRole(
+        name="analyst",
+        description="分析师",
+        system_prompt="你是一名分析师。",
+        available_tools=[],
+    )
+
+
+@pytest.fixture
+def subtask() -> SubTask:
+    return SubTask(
+        id="st-1",
+        parent_task_id="task-1",
+        content="分析测试数据",
+        dependencies=set(),
+        priority=1,
+        role_hint="analyst",
+    )
+
+
+@pytest.fixture
+def execution_context() -> ExecutionContext:
+    return ExecutionContext(
+        task_id="task-1",
+        start_time=0,
+        status=TaskStatus.EXECUTING,
+    )
+
+
+def _response(content: str = "完成", tool_calls=None) -> QwenResponse:
+    """构造模型响应"""
+    return QwenResponse(
+        content=content,
+        tool_calls=tool_calls,
+        finish_reason="tool_calls" if tool_calls else "stop",
+        usage={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+    )
+
+
+def _make_agent(
+    role: AgentRole, client, registry=None, model=QwenModel.QWEN_MAX, **kwargs
+) -> SubAgentImpl:
+    """创建测试用 SubAgentImpl"""
+    return SubAgentImpl(
+        agent_id="test-agent-001",
+        role=role,
+        qwen_client=client,
+        tool_registry=registry or ToolRegistry(),
+        config=QwenConfig(model=model),
+        **kwargs,
+    )
+
+
+def _no_backoff() -> RetryConfig:
+    """不等待的重试退避配置"""
+    return RetryConfig(initial_delay=0, jitter=False)
+
+
+# ── 执行循环 ──────────────────────────────────────────────
+
+class TestExecute:
+    """execute 的结果与统计"""
+
+    async def test_token_usage_accumulated(self, role, subtask, execution_context):
+        client = AsyncMock()
+        client.chat = AsyncMock(return_value=_response("最终答案"))
+        agent = _make_agent(role, client)
+
+        result = await agent.execute(subtask, execution_context)
+
+        expected = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        assert result.output == "最终答案"
+        assert result.token_usage == expected
+        assert agent.token_usage == expected
+        assert agent.get_execution_summary()["token_usage"] == expected
+
+    async def test_system_prompt_identical_across_retries(self, role, subtask, execution_context):
+        prompts = []
+
+        async def flaky_chat(messages, **kwargs):
+            prompts.append(messages[0].content)
+            if len(prompts) == 1:
+                raise RuntimeError("temporary failure")
+            return _response()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=flaky_chat)
+        agent = _make_agent(role, client, retry_config=_no_backoff())
+
+        result = await agent.execute(subtask, execution_context)
+
+        assert result.success is True
+        assert len(prompts) == 2
+        assert prompts[0] == prompts[1]
+
+
+# ── 停止流程 ──────────────────────────────────────────────
+
+class TestRetryBackoff:
+    """执行重试的指数退避"""
+
+    async def test_backoff_delays_and_no_wait_after_last_attempt(
+        self, role, subtask, execution_context, monkeypatch
+    ):
+        delays = []
+        real_wait_for = asyncio.wait_for
+
+        async def record_wait_for(awaitable, timeout):
+            delays.append(timeout)
+            return await real_wait_for(awaitable, timeout=0)
+
+        monkeypatch.setattr(sub_agent.asyncio, "wait_for", record_wait_for)
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=RuntimeError("provider down"))
+        agent = _make_agent(
+            role, client, retry_config=RetryConfig(initial_delay=0.5, jitter=False)
+        )
+
+        result = await agent.execute(subtask, execution_context)
+
+        assert result.success is False
+        assert client.chat.await_count == 3
+        assert delays == [0.5, 1.0]
+
+
+class TestPerIterationBounds:
+    """单轮模型调用的输出长度与耗时上限"""
+
+    def test_request_config_bounded(self, role):
+        agent = SubAgentImpl(
+            agent_id="test-agent-001", role=role, qwen_client=AsyncMock(),
+            tool_registry=ToolRegistry(),
+            config=QwenConfig(model=QwenModel.QWEN_MAX, max_tokens=100000, timeout=120.0),
+            per_iteration_timeout=60.0,
+        )
+
+        config = agent.request_config
+        assert config.max_tokens == SubAgentImpl.PER_ITERATION_MAX_TOKENS
+        assert config.timeout == 60.0
+        assert config.total_timeout == 60.0
+
+    async def test_hanging_model_call_times_out(self, role, subtask, execution_context):
+        async def hanging_chat(**kwargs):
+            await asyncio.Event().wait()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=hanging_chat)
+        agent = _make_agent(
+            role, client, retry_config=_no_backoff(), per_iteration_timeout=0.01
+        )
+
+        result = await asyncio.wait_for(agent.execute(subtask, execution_context), timeout=1)
+
+        assert result.success is False
+        assert "timed out" in result.error
+        assert client.chat.await_count == 3
+
+
+class TestItemBatches:
+    """列表输入的批量处理"""
+
+    def _subtask(self, items) -> SubTask:
+        return SubTask(
+            id="st-1", parent_task_id="task-1", content="判断情感倾向",
+            role_hint="analyst", items=items,
+        )
+
+    async def test_items_packed_into_batches(self, role, execution_context):
+        async def batch_chat(messages, **kwargs):
+            count = messages[-1].content.count("\n[")
+            return _response("```json\n" + json.dumps(["正面"] * count) + "\n```")
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=batch_chat)
+        agent = _make_agent(role, client)
+
+        result = await agent.execute(self._subtask([f"评论{i}" for i in range(10)]), execution_context)
+
+        assert result.success is True
+        assert result.output == "\n".join(f"{i}. 正面" for i in range(1, 11))
+        assert client.chat.await_count == 2
+        assert agent.token_usage["total_tokens"] == 30
+
+    async def test_malformed_batch_falls_back_to_single_items(self, role, execution_context):
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=[
+            _response("无法按要求输出"),
+            _response(" 正面 "),
+            _response("负面"),
+        ])
+        agent = _make_agent(role, client)
+
+        result = await agent.execute(self._subtask(["好", {"text": "差"}]), execution_context)
+
+        assert result.output == "1. 正面\n2. 负面"
+        assert '{"text":"差"}' in client.chat.await_args_list[2].kwargs["messages"][-1].content
+
+    async def test_failed_batch_cancels_other_batches(self, role, execution_context):
+        pending, cancelled = [], []
+
+        async def chat(messages, **kwargs):
+            if "[1] 评论0\n" in messages[-1].content:
+                raise RuntimeError("invalid request")
+            pending.append(messages)
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(messages)
+                raise
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=chat)
+        agent = _make_agent(role, client, retry_config=_no_backoff())
+
+        result = await agent.execute(self._subtask([f"评论{i}" for i in range(16)]), execution_context)
+
+        assert result.success is False
+        assert pending
+        assert len(cancelled) == len(pending)
+
+    async def test_items_path_sends_no_function_tools(self, execution_context):
+        registry = ToolRegistry()
+        registry.register_tool(ToolDefinition(
+            name="data_analysis", description="分析", parameters_schema={"type": "object", "properties": {}},
+            handler=AsyncMock(),
+        ))
+        role = AgentRole(
+            name="analyst", description="分析", system_prompt="分析。", available_tools=["data_analysis"],
+        )
+        client = AsyncMock()
+        client.chat = AsyncMock(return_value=_response('["正面"]'))
+        agent = _make_agent(role, client, registry)
+        assert agent.tools_schema
+
+        result = await agent.execute(self._subtask(["好"]), execution_context)
+
+        assert result.output == "1. 正面"
+        assert client.chat.await_args.kwargs.get("tools") is None
+
+    async def test_item_output_joins_in_team_executor(self, execution_context):
+        async def chat(messages, **kwargs):
+            prompt = messages[-1].content
+            if "JSON 数组" in prompt:
+                return _response(json.dumps(["正面", {"score": 0.2}], ensure_ascii=False))
+            return _response("报告")
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=chat)
+        scheduler = MagicMock(_qwen_client=client, _tool_registry=ToolRegistry())
+        context_manager = AsyncMock()
+        context_manager.get_context.return_value = execution_context
+        executor = TaskExecutor(
+            task_decomposer=MagicMock(), agent_scheduler=scheduler,
+            result_aggregator=MagicMock(), context_manager=context_manager, config=MagicMock(),
+        )
+        task = Task(
+            id="task-1", content="评论情感分析", status=TaskStatus.EXECUTING,
+            complexity_score=3.0, created_at=0.0,
+        )
+        classify = SubTask(
+            id="st-1", parent_task_id="task-1", content="判断情感倾向",
+            role_hint="analyst", items=["好", "差"],
+        )
+        report = SubTask(
+            id="st-2", parent_task_id="task-1", content="撰写报告",
+            role_hint="writer", dependencies={"st-1"},
+        )
+        subtask_map = {st.id: st for st in (classify, report)}
+        outputs = {}
+
+        for st in (classify, report):
+            await executor._run_subtask(task, st, subtask_map, outputs, None)
+        result = executor._build_team_result(
+            task, TaskDecomposition(
+                original_task_id="task-1", subtasks=[classify, report],
+                execution_order=[["st-1"], ["st-2"]], total_estimated_time=0.0,
+            ),
+            outputs, MagicMock(failed_tasks=0, completed_tasks=2), 0.0,
+        )
+
+        assert outputs["st-1"].output == '1. 正面\n2. {"score":0.2}'
+        assert result.success is True
+        assert result.output == '1. 正面\n2. {"score":0.2}\n\n---\n\n报告'
+        # 依赖方的前序结果注入（截断后拼接）同样按文本处理
+        writer_prompt = client.chat.await_args_list[-1].kwargs["messages"][-1].content
+        assert '1. 正面\n2. {"score":0.2}' in writer_prompt
+
+
+class TestStop:
+    """stop() 等待执行循环退出"""
+
+    async def test_stop_idle_agent_terminates(self, role):
+        agent = _make_agent(role, AsyncMock())
+
+        await agent.stop()
+        assert agent.get_status() == AgentStatus.TERMINATED
+
+    async def test_stop_interrupts_model_call(self, role, subtask, execution_context):
+        chat_started = asyncio.Event()
+        chat_cancelled = asyncio.Event()
+
+        async def hanging_chat(**kwargs):
+            chat_started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                chat_cancelled.set()
+                raise
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=hanging_chat)
+        agent = _make_agent(role, client)
+
+        execute_task = asyncio.create_task(agent.execute(subtask, execution_context))
+        await chat_started.wait()
+        assert agent.get_status() == AgentStatus.RUNNING
+
+        await asyncio.wait_for(agent.stop(), timeout=1)
+        result = await asyncio.wait_for(execute_task, timeout=1)
+
+        assert chat_cancelled.is_set()
+        assert client.chat.await_count == 1
+        assert agent.get_status() == AgentStatus.TERMINATED
+        assert result.success is False
+        assert "stopped" in result.error
+
+
+class TestExecutionHistory:
+    """执行历史有界保留"""
+
+    async def test_history_keeps_latest_entries(self, role):
+        agent = SubAgentImpl(
+            agent_id="test-agent-001",
+            role=role,
+            qwen_client=AsyncMock(),
+            tool_registry=ToolRegistry(),
+            max_history=2,
+        )
+
+        await agent.stop()
+        await agent.cleanup()
+
+        history = agent.execution_history
+        assert [entry["type"] for entry in history] == ["state_change", "cleanup"]
+        assert agent.get_execution_summary()["execution_history_count"] == 2
+
+    async def test_history_entries_are_flat_dicts(self, role):
+        agent = _make_agent(role, AsyncMock())
+
+        await agent.stop()
+
+        stop_requested, state_change = agent.execution_history
+        assert set(stop_requested) == {"type", "timestamp"}
+        assert state_change["type"] == "state_change"
+        assert state_change["from_status"] == AgentStatus.IDLE.value
+        assert state_change["to_status"] == AgentStatus.TERMINATED.value
+
+
+class TestReadOnlyViews:
+    """对外属性返回只读视图，记录未变化时复用同一对象"""
+
+    async def test_views_reused_until_changed(self, role):
+        agent = _make_agent(role, AsyncMock())
+
+        history = agent.execution_history
+        calls = agent.tool_calls
+        usage = agent.token_usage
+        assert isinstance(history, tuple) and isinstance(calls, tuple)
+        assert agent.execution_history is history
+        assert agent.tool_calls is calls
+        assert agent.token_usage is usage
+        with pytest.raises(TypeError):
+            usage["total_tokens"] = 1
+
+        await agent.stop()
+        agent._update_token_usage({"input_tokens": 3, "output_tokens": 2, "total_tokens": 5})
+
+        assert agent.execution_history is not history
+        assert len(agent.execution_history) == len(history) + 2
+        assert agent.token_usage["total_tokens"] == 5
+        assert dict(agent.token_usage) == agent.get_execution_summary()["token_usage"]
+
+
+# ── 消息总线 ──────────────────────────────────────────────
+
+class TestMessageBus:
+    """推送式收件箱"""
+
+    async def test_shutdown_message_interrupts_model_call(self, role, subtask, execution_context):
+        bus = MessageBus()
+        await bus.register_agent("test-agent-001", "team-1")
+        chat_started = asyncio.Event()
+
+        async def hanging_chat(**kwargs):
+            chat_started.set()
+            await asyncio.Event().wait()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=hanging_chat)
+        agent = SubAgentImpl(
+            agent_id="test-agent-001",
+            role=role,
+            qwen_client=client,
+            tool_registry=ToolRegistry(),
+            config=QwenConfig(model=QwenModel.QWEN_MAX),
+            message_bus=bus,
+        )
+
+        execute_task = asyncio.create_task(agent.execute(subtask, execution_context))
+        await asyncio.wait_for(chat_started.wait(), timeout=1)
+        await bus.send_shutdown_request("leader", "test-agent-001", "done")
+        result = await asyncio.wait_for(execute_task, timeout=1)
+
+        assert result.success is False
+        assert result.error == "Execution stopped by SHUTDOWN message"
+        assert agent.get_status() == AgentStatus.TERMINATED
+        assert agent._mailbox_task is None
+
+    async def test_shutdown_message_interrupts_item_batches(self, role, execution_context):
+        bus = MessageBus()
+        await bus.register_agent("test-agent-001", "team-1")
+        chat_started = asyncio.Event()
+
+        async def hanging_chat(**kwargs):
+            chat_started.set()
+            await asyncio.Event().wait()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=hanging_chat)
+        agent = SubAgentImpl(
+            agent_id="test-agent-001", role=role, qwen_client=client,
+            tool_registry=ToolRegistry(), message_bus=bus,
+        )
+        subtask = SubTask(
+            id="st-1", parent_task_id="task-1", content="判断情感倾向",
+            role_hint="analyst", items=[f"评论{i}" for i in range(10)],
+        )
+
+        execute_task = asyncio.create_task(agent.execute(subtask, execution_context))
+        await asyncio.wait_for(chat_started.wait(), timeout=1)
+        await bus.send_shutdown_request("leader", "test-agent-001", "done")
+        result = await asyncio.wait_for(execute_task, timeout=1)
+
+        assert result.success is False
+        assert result.error == "Execution stopped by SHUTDOWN message"
+        assert agent.get_status() == AgentStatus.TERMINATED
+        assert client.chat.await_count == 2
+        assert await bus.receive_messages("test-agent-001") == []
+
+    async def test_context_messages_injected(self, role, subtask, execution_context):
+        bus = MessageBus()
+        await bus.register_agent("test-agent-001", "team-1")
+        await bus.send_message("peer", "test-agent-001", "参考数据", MessageType.DIRECT)
+        seen = []
+
+        async def chat(messages, **kwargs):
+            seen.extend(m.content for m in messages)
+            return _response()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=chat)
+        agent = SubAgentImpl(
+            agent_id="test-agent-001",
+            role=role,
+            qwen_client=client,
+            tool_registry=ToolRegistry(),
+            message_bus=bus,
+        )
+
+        result = await agent.execute(subtask, execution_context)
+
+        assert result.success is True
+        assert "[Message from peer]: 参考数据" in seen
+
+
+    async def test_unconsumed_messages_returned_to_inbox(self, role, subtask, execution_context):
+        bus = MessageBus()
+        await bus.register_agent("test-agent-001", "team-1")
+
+        async def chat(**kwargs):
+            await bus.send_message("peer", "test-agent-001", "迟到的数据", MessageType.DIRECT)
+            for _ in range(3):
+                await asyncio.sleep(0)
+            return _response()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=chat)
+        agent = SubAgentImpl(
+            agent_id="test-agent-001", role=role, qwen_client=client,
+            tool_registry=ToolRegistry(), message_bus=bus,
+        )
+
+        result = await agent.execute(subtask, execution_context)
+        assert result.success is True
+
+        leftovers = await bus.receive_messages("test-agent-001")
+        assert [msg.content for msg in leftovers] == ["迟到的数据"]
+
+    async def test_messages_after_shutdown_returned_to_inbox(self, role, subtask, execution_context):
+        bus = MessageBus()
+        await bus.register_agent("test-agent-001", "team-1")
+        await bus.send_shutdown_request("leader", "test-agent-001", "done")
+        await bus.send_message("peer", "test-agent-001", "给下一位", MessageType.DIRECT)
+        agent = SubAgentImpl(
+            agent_id="test-agent-001", role=role, qwen_client=AsyncMock(),
+            tool_registry=ToolRegistry(), message_bus=bus,
+        )
+
+        result = await agent.execute(subtask, execution_context)
+        assert result.error == "Execution stopped by SHUTDOWN message"
+
+        leftovers = await bus.receive_messages("test-agent-001")
+        assert [msg.content for msg in leftovers] == ["给下一位"]
+
+
+def _bus_message(sender: str, receiver: str, content: str, msg_type: MessageType) -> AgentMessage:
+    """构造消息总线消息"""
+    return AgentMessage(
+        id=f"{sender}-{msg_type.value}", sender_id=sender, receiver_id=receiver,
+        content=content, msg_type=msg_type, timestamp=0.0, team_id="team-1",
+    )
+
+
+class _PollingBus(MessageBus):
+    """不支持订阅的总线：第一次轮询返回上下文消息，之后的轮询等待放行后返回 SHUTDOWN"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.polls = 0
+
+    def subscribe(self, agent_id):
+        return None
+
+    async def receive_messages(self, agent_id):
+        self.polls += 1
+        if self.polls == 1:
+            return [_bus_message("peer", agent_id, "参考数据", MessageType.DIRECT)]
+        await self.release.wait()
+        return [_bus_message("leader", agent_id, "", MessageType.SHUTDOWN)]
+
+
+class TestPollingMessageBus:
+    """轮询式消息总线与模型调用并发"""
+
+    async def test_poll_overlaps_model_call_and_shutdown_interrupts(
+        self, role, subtask, execution_context
+    ):
+        bus = _PollingBus()
+        chat_started = asyncio.Event()
+        seen = []
+
+        async def hanging_chat(messages, **kwargs):
+            seen.extend(m.content for m in messages)
+            chat_started.set()
+            await asyncio.Event().wait()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=hanging_chat)
+        agent = SubAgentImpl(
+            agent_id="test-agent-001", role=role, qwen_client=client,
+            tool_registry=ToolRegistry(), message_bus=bus,
+        )
+
+        execute_task = asyncio.create_task(agent.execute(subtask, execution_context))
+        await asyncio.wait_for(chat_started.wait(), timeout=1)
+        assert "[Message from peer]: 参考数据" in seen
+        assert bus.polls == 2
+
+        bus.release.set()
+        result = await asyncio.wait_for(execute_task, timeout=1)
+
+        assert result.error == "Execution stopped by SHUTDOWN message"
+        assert client.chat.await_count == 1
+
+    async def test_shutdown_interrupts_item_batches(self, role, execution_context):
+        bus = _PollingBus()
+        chat_started = asyncio.Event()
+
+        async def hanging_chat(messages, **kwargs):
+            chat_started.set()
+            await asyncio.Event().wait()
+
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=hanging_chat)
+        agent = SubAgentImpl(
+            agent_id="test-agent-001", role=role, qwen_client=client,
+            tool_registry=ToolRegistry(), message_bus=bus,
+        )
+        subtask = SubTask(
+            id="st-1", parent_task_id="task-1", content="判断情感倾向",
+            role_hint="analyst", items=["好", "差"],
+        )
+
+        execute_task = asyncio.create_task(agent.execute(subtask, execution_context))
+        await asyncio.wait_for(chat_started.wait(), timeout=1)
+        assert bus.polls == 2
+
+        bus.release.set()
+        result = await asyncio.wait_for(execute_task, timeout=1)
+
+        assert result.error == "Execution stopped by SHUTDOWN message"
+        assert agent.get_status() == AgentStatus.TERMINATED
+        assert client.chat.await_count == 1
+
+
+# ── 工具调用 ──────────────────────────────────────────────
+
+def _tool_call(call_id: str, name: str, arguments: str) -> dict:
+    return {"id": call_id, "function": {"name": name, "arguments": arguments}}
+
+
+class TestProcessToolCalls:
+    """_process_tool_calls 并发执行并保持结果顺序"""
+
+    async def test_tool_calls_run_concurrently_in_order(self):
+        running = 0
+        peak = 0
+
+        async def lookup(query: str):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01 if query == "slow" else 0)
+            running -= 1
+            return {"query": query}
+
+        registry = ToolRegistry()
+        registry.register_tool(ToolDefinition(
+            name="lookup",
+            description="查询",
+            parameters_schema={"type": "object", "properties": {"query": {"type": "string"}}},
+            handler=lookup,
+        ))
+        role = AgentRole(name="searcher", description="搜索", system_prompt="搜索。", available_tools=["lookup"])
+        agent = _make_agent(role, AsyncMock(), registry)
+
+        messages = await agent._process_tool_calls([
+            _tool_call("c1", "lookup", '{"query": "slow"}'),
+            _tool_call("c2", "lookup", '{"query": "fast"}'),
+            _tool_call("c3", "missing", "{}"),
+        ], [])
+
+        assert peak == 2
+        assert [m.role for m in messages] == ["assistant", "tool", "tool", "tool"]
+        assert [m.tool_call_id for m in messages[1:]] == ["c1", "c2", "c3"]
+        assert messages[1].content == '{"query":"slow"}'
+        assert messages[3].content.startswith("Error:")
+        assert agent._last_tool_error_count == 1
+
+    async def test_tool_result_serialized_compactly(self):
+        async def lookup():
+            return {"标题": "千问", 1: [1, 2]}
+
+        registry = ToolRegistry()
+        registry.register_tool(ToolDefinition(
+            name="lookup", description="查询", parameters_schema={}, handler=lookup,
+        ))
+        role = AgentRole(name="searcher", description="搜索", system_prompt="搜索。", available_tools=["lookup"])
+        agent = _make_agent(role, AsyncMock(), registry)
+
+        _, result_str = await agent._invoke_tool_call(_tool_call("c1", "lookup", "{}"))
+
+        assert result_str == '{"标题":"千问","1":[1,2]}'
+
+    def test_compact_dumps_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(sub_agent, "orjson", None)
+
+        assert sub_agent._dumps_compact({"标题": "千问", 1: [1, 2]}) == '{"标题":"千问","1":[1,2]}'
+
+
+class TestToolCache:
+    """无副作用工具的结果缓存"""
+
+    def _agent(self, name: str, handler):
+        registry = ToolRegistry()
+        registry.register_tool(ToolDefinition(
+            name=name,
+            description=name,
+            parameters_schema={"type": "object", "properties": {}},
+            handler=handler,
+        ))
+        role = AgentRole(name="analyst", description="分析", system_prompt="分析。", available_tools=[name])
+        return _make_agent(role, AsyncMock(), registry)
+
+    async def test_repeated_call_served_from_cache(self):
+        calls = []
+
+        async def analyse(data: str, operation: str = "summary"):
+            calls.append(data)
+            return {"rows": len(data)}
+
+        agent = self._agent("data_analysis", analyse)
+
+        first = await agent.call_tool("data_analysis", {"data": "abc", "operation": "summary"})
+        second = await agent.call_tool("data_analysis", {"operation": "summary", "data": "abc"})
+
+        assert first == second == {"rows": 3}
+        assert calls == ["abc"]
+        assert [record.cached for record in agent.tool_calls] == [False, True]
+        assert agent.get_execution_summary()["tool_cache_hits"] == 1
+
+    async def test_side_effecting_tool_not_cached(self):
+        calls = []
+
+        async def write(operation: str, path: str):
+            calls.append(path)
+            return {"success": True}
+
+        agent = self._agent("file_operations", write)
+
+        await agent.call_tool("file_operations", {"operation": "write", "path": "a.txt"})
+        await agent.call_tool("file_operations", {"operation": "write", "path": "a.txt"})
+
+        assert calls == ["a.txt", "a.txt"]
+
+    async def test_failed_result_not_cached(self):
+        results = [{"success": False, "error": "timeout"}, {"success": True, "content": "ok"}]
+        calls = []
+
+        async def browse(url: str):
+            calls.append(url)
+            return results[len(calls) - 1]
+
+        agent = self._agent("sandbox_browser", browse)
+
+        first = await agent.call_tool("sandbox_browser", {"url": "http://a"})
+        second = await agent.call_tool("sandbox_browser", {"url": "http://a"})
+        third = await agent.call_tool("sandbox_browser", {"url": "http://a"})
+
+        assert first["success"] is False
+        assert second == third == {"success": True, "content": "ok"}
+        assert len(calls) == 2
+        assert [record.cached for record in agent.tool_calls] == [False, False, True]
+
+
+class TestResponseCache:
+    """确定性请求的模型响应缓存"""
+
+    def _agent(self, role, client, cache, temperature):
+        return SubAgentImpl(
+            agent_id="test-agent-001",
+            role=role,
+            qwen_client=client,
+            tool_registry=ToolRegistry(),
+            config=QwenConfig(model=QwenModel.QWEN_MAX, temperature=temperature),
+            response_cache=cache,
+        )
+
+    async def test_identical_request_served_from_shared_cache(
+        self, role, subtask, execution_context
+    ):
+        cache = sub_agent.ResponseCache()
+        first_client, second_client = AsyncMock(), AsyncMock()
+        first_client.chat = AsyncMock(return_value=_response("结论"))
+        second_client.chat = AsyncMock(return_value=_response("其他"))
+
+        first = await self._agent(role, first_client, cache, 0).execute(subtask, execution_context)
+        agent = self._agent(role, second_client, cache, 0)
+        second = await agent.execute(subtask, execution_context)
+
+        assert first.output == second.output == "结论"
+        second_client.chat.assert_not_awaited()
+        assert cache.hits == 1
+        assert agent.token_usage["total_tokens"] == 0
+
+    async def test_sampling_requests_not_cached(self, role, subtask, execution_context):
+        cache = sub_agent.ResponseCache()
+        client = AsyncMock()
+        client.chat = AsyncMock(return_value=_response())
+
+        await self._agent(role, client, cache, 0.7).execute(subtask, execution_context)
+        await self._agent(role, client, cache, 0.7).execute(subtask, execution_context)
+
+        assert client.chat.await_count == 2
+        assert len(cache) == 0
+
+    async def test_tools_digest_computed_once_per_agent(
+        self, subtask, execution_context, monkeypatch
+    ):
+        registry = ToolRegistry()
+
+        async def analyse(data: str):
+            return {"rows": len(data)}
+
+        registry.register_tool(ToolDefinition(
+            name="data_analysis",
+            description="分析",
+            parameters_schema={"type": "object", "properties": {"data": {"type": "string"}}},
+            handler=analyse,
+        ))
+        role = AgentRole(
+            name="analyst", description="分析", system_prompt="分析。",
+            available_tools=["data_analysis"],
+        )
+        client = AsyncMock()
+        client.chat = AsyncMock(side_effect=[
+            _response(tool_calls=[_tool_call("c1", "data_analysis", '{"data": "abc"}')]),
+            _response("完成"),
+        ])
+        digests = []
+        original = sub_agent.ResponseCache.tools_digest
+        monkeypatch.setattr(
+            sub_agent.ResponseCache, "tools_digest",
+            staticmethod(lambda tools: digests.append(tools) or original(tools)),
+        )
+        agent = SubAgentImpl(
+            agent_id="test-agent-001", role=role, qwen_client=client, tool_registry=registry,
+            config=QwenConfig(model=QwenModel.QWEN_MAX, temperature=0),
+            response_cache=sub_agent.ResponseCache(),
+        )
+
+        result = await agent.execute(subtask, execution_context)
+
+        assert result.success is True
+        assert client.chat.await_count == 2
+        assert len(digests) == 1
+
+    def test_tool_call_responses_not_stored_and_lru_bounded(self):
+        cache = sub_agent.ResponseCache(max_size=1)
+        cache.put("a", _response(tool_calls=[_tool_call("c1", "x", "{}")]))
+        assert len(cache) == 0
+
+        cache.put("a", _response("a"))
+        cache.put("b", _response("b"))
+        assert cache.get("a") is None
+        assert cache.get("b").content == "b"
+
+
+# ── 系统提示 ──────────────────────────────────────────────
+
+class TestSystemPrompt:
+    """系统提示的构建与缓存"""
+
+    def test_tools_instruction_built_once(self, subtask):
+        role = AgentRole(
+            name="coder",
+            description="程序员",
+            system_prompt="你是一名程序员。",
+            available_tools=["code_review"],
+        )
+        registry = ToolRegistry()
+        agent = _make_agent(role, AsyncMock(), registry)
+        calls = []
+        original_get_tool = registry.get_tool
+        registry.get_tool = lambda name: calls.append(name) or original_get_tool(name)
+
+        first = agent._build_system_prompt(subtask)
+        second = agent._build_system_prompt(subtask)
+
+        assert agent.tools_schema == []
+        assert calls == ["code_review"]
+        assert "当前无外部工具" in first and "当前无外部工具" in second
+        assert subtask.content in second
+
+    def test_tools_schema_and_request_config_cached(self, role):
+        agent = _make_agent(role, AsyncMock())
+
+        assert agent.tools_schema is agent.tools_schema
+        assert agent.request_config is agent.request_config
+        assert agent.request_config.model == QwenModel.QWEN_MAX
+
+    def test_sandbox_flags_follow_model(self):
+        role = AgentRole(
+            name="searcher",
+            description="搜索",
+            system_prompt="搜索。",
+            available_tools=["web_search"],
+        )
+        native = _make_agent(role, AsyncMock(), model=QwenModel.QWEN_MAX)
+        third_party = _make_agent(role, AsyncMock(), model=QwenModel.DEEPSEEK_V3_2)
+
+        assert native._uses_sandbox_browser() is False
+        assert "web_search" in native._get_effective_builtin_tools()
+        assert third_party._uses_sandbox_browser() is True
+        assert third_party._uses_sandbox_code_interpreter() is False
+        assert third_party._get_effective_builtin_tools() == frozenset()
+
+
+# ── 文本工具调用解析 ──────────────────────────────────────
+
+class TestParseTextToolCalls:
+    """_parse_text_tool_calls 的各种文本格式"""
+
+    def test_deepseek_marker_with_nested_arguments(self):
+        content = (
+            "先搜索一下。function<｜tool▁sep｜>sandbox_browser\n"
+            '```json\n{"query": "a}b", "options": {"limit": 3}}\n```<｜tool▁call▁end｜>'
+        )
+        calls = SubAgentImpl._parse_text_tool_calls(content)
+
+        assert len(calls) == 1
+        assert calls[0]["function"]["name"] == "sandbox_browser"
+        assert calls[0]["function"]["arguments"] == '{"query": "a}b", "options": {"limit": 3}}'
+
+    def test_deepseek_multiple_calls_and_invalid_json_skipped(self):
+        content = (
+            "function<｜tool▁sep｜>bad\n{not json}\n"
+            'function<｜tool▁sep｜>first\n{"x": 1}\n'
+            'function<tool_sep>second {"y": 2}'
+        )
+        calls = SubAgentImpl._parse_text_tool_calls(content)
+
+        assert [c["function"]["name"] for c in calls] == ["first", "second"]
+
+    def test_json_array_format(self):
+        content = '```json\n[{"name": "web_search", "arguments": {"q": "qwen"}}]\n```'
+        calls = SubAgentImpl._parse_text_tool_calls(content)
+
+        assert calls[0]["function"] == {"name": "web_search", "arguments": '{"q":"qwen"}'}
+
+    def test_json_array_with_brackets_in_strings(self):
+        content = (
+            "说明文字\n```python\nprint(1)\n```\n"
+            '```json\n[{"name": "lookup", "arguments": {"q": "a] ``` b"}}, "skip"]\n```'
+        )
+        calls = SubAgentImpl._parse_text_tool_calls(content)
+
+        assert len(calls) == 1
+        assert calls[0]["function"] == {"name": "lookup", "arguments": '{"q":"a] ``` b"}'}
+
+    def test_tool_call_tags(self):
+        content = (
+            '<tool_call>\n{"name": "lookup", "arguments": {"q": "</tool_call>"}}\n</tool_call>\n'
+            '<tool_call>{"broken": </tool_call>'
+            '<tool_call>{"name": "fetch", "arguments": "raw"}</tool_call>'
+        )
+        calls = SubAgentImpl._parse_text_tool_calls(content)
+
+        assert [c["function"] for c in calls] == [
+            {"name": "lookup", "arguments": '{"q":"</tool_call>"}'},
+            {"name": "fetch", "arguments": "raw"},
+        ]
+
+    def test_plain_text_returns_none(self):
+        assert SubAgentImpl._parse_text_tool_calls("普通的最终回答，没有工具调用。") is None
+        assert SubAgentImpl._parse_text_tool_calls("") is None